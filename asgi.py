@@ -0,0 +1,5 @@
+from main import app as flask_app
+from backend.asgi import create_asgi_app
+
+# uvicorn asgi:app, or gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+app = create_asgi_app(flask_app)
@@ -1,12 +1,15 @@
-from flask import Blueprint, request, jsonify, session, url_for, redirect
+from flask import Blueprint, request, jsonify, session, url_for, redirect, Response, stream_with_context, current_app
 from flask_login import current_user, login_required
-from backend.core.semantic_parser import SemanticParser
-from backend.core.rate_limiter import RateLimiter
-from backend.utils import get_client_ip, get_request_user_id
+from backend.core.semantic_parser import SemanticParser, ParseContext
+from backend.core import tracing
+from backend.core.rate_limiter import RateLimiter, batch_accounting
+from backend.utils import get_request_identity, get_request_user_id
 from backend.database import get_db_connection
 from backend.models.user import User
 from backend.config import Config
 from backend.security import encrypt_token, decrypt_token
+from backend import http_client
+from backend.integrations.ha_states import invalidate as invalidate_ha_states
 import secrets
 import requests
 import time
@@ -16,34 +19,102 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 parser = SemanticParser()
 rate_limiter = RateLimiter()
 
+def read_query_request():
+    """(query, timezone) from the JSON body of a query request."""
+    data = request.json
+    return data.get('query', ''), data.get('timezone', Config.DEFAULT_TIMEZONE)
+
+def requested_trace(ctx):
+    """ctx's trace when the request body asks for step timings ({"trace": true}), else None."""
+    return ctx.trace if request.json.get('trace') else None
+
 @api_bp.route('/query', methods=['POST'])
 def query():
+    query_text, user_timezone = read_query_request()
+    ctx = ParseContext(user_timezone=user_timezone)
+    return query_response(parser.process(query_text, user_timezone, ctx), requested_trace(ctx))
+
+@api_bp.route('/query/stream', methods=['POST'])
+def query_stream():
+    """Server-Sent Events version of /query; see SemanticParser.process_stream for the events."""
+    query_text, user_timezone = read_query_request()
+    ctx = ParseContext(user_timezone=user_timezone)
+    trace = requested_trace(ctx)
+    events = parser.process_stream(query_text, user_timezone, ctx)
+    return stream_response(stream_with_context(format_stream_event(event, data, trace) for event, data in events))
+
+def read_batch_request():
+    """([(query, timezone), ...], error) from a batch body: a list of query items, or {"queries": [...]}."""
     data = request.json
-    query_text = data.get('query', '')
-    user_timezone = data.get('timezone', Config.DEFAULT_TIMEZONE)
-    
-    response, widgets, thoughts, highlighted_query = parser.process(query_text, user_timezone)
-    
-    # Serialize thoughts
-    thoughts_serializable = []
-    for t in thoughts:
-        thoughts_serializable.append({
-            "description": t['description'],
-            "result": str(t['result']) if t['result'] is not None else None
-        })
-        
-    return jsonify({
+    if isinstance(data, dict):
+        data = data.get('queries')
+    if not isinstance(data, list) or not data:
+        return None, "Expected a non-empty list of queries"
+    if len(data) > Config.BATCH_MAX_ITEMS:
+        return None, f"At most {Config.BATCH_MAX_ITEMS} queries per batch"
+    items = []
+    for item in data:
+        if not isinstance(item, dict) or not isinstance(item.get('query'), str):
+            return None, "Every item needs a query string"
+        items.append((item['query'], item.get('timezone') or Config.DEFAULT_TIMEZONE))
+    return items, None
+
+@api_bp.route('/query/batch', methods=['POST'])
+def query_batch():
+    """Runs many queries in one request; results come back in item order, each shaped like /query's."""
+    items, error = read_batch_request()
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+    with batch_accounting():
+        results = parser.process_batch(items)
+    return batch_response(results)
+
+def batch_response(results):
+    return jsonify({"results": [query_payload(result) for result in results]})
+
+def serialize_thought(t, trace=None):
+    thought = {
+        "description": t['description'],
+        "result": str(t['result']) if t['result'] is not None else None
+    }
+    if trace is not None:
+        thought.update(tracing.thought_timings(trace, t))
+    return thought
+
+def query_payload(result, trace=None):
+    """With a trace, thoughts carry their timings and a "trace" key lists the spans."""
+    response, widgets, thoughts, highlighted_query, highlight_spans = result
+    payload = {
         "response": response,
         "widgets": widgets,
-        "thoughts": thoughts_serializable,
-        "highlightedQuery": highlighted_query
-    })
+        "thoughts": [serialize_thought(t, trace) for t in thoughts],
+        "highlightedQuery": highlighted_query,
+        "highlightSpans": highlight_spans
+    }
+    if trace is not None:
+        payload["trace"] = trace.to_dict()
+    return payload
+
+def query_response(result, trace=None):
+    """JSON response for a parser.process()/process_async() result."""
+    return jsonify(query_payload(result, trace))
+
+def format_stream_event(event, data, trace=None):
+    if event == "thought":
+        data = serialize_thought(data, trace)
+    elif event == "done":
+        data = query_payload(data, trace)
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
+def stream_response(body=None):
+    # No buffering anywhere on the way, or the events arrive all at once
+    return Response(body, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @api_bp.route('/limits', methods=['GET'])
 def get_rate_limits():
-    ip = get_client_ip()
-    user_id = get_request_user_id()
-    limits = rate_limiter.get_limits(ip, user_id)
+    identity = get_request_identity()
+    limits = rate_limiter.get_limits(identity.ip, identity.user_id)
     return jsonify(limits)
 
 @api_bp.route('/user', methods=['GET'])
@@ -201,7 +272,7 @@ def ha_callback():
         'client_id': url_for('api.ha_callback', _external=True)
     }
     try:
-        r = requests.post(token_url, data=payload, timeout=15)
+        r = http_client.post("homeassistant_auth", token_url, data=payload)
     except Exception as e:
         return f"Token request failed: {e}", 502
     if r.status_code != 200:
@@ -275,7 +346,7 @@ def ha_control():
                 'refresh_token': refresh_token,
                 'client_id': url_for('api.ha_callback', _external=True)
             }
-            ref_res = requests.post(refresh_url, data=payload, timeout=10)
+            ref_res = http_client.post("homeassistant_auth", refresh_url, data=payload)
             if ref_res.status_code == 200:
                 ref_data = ref_res.json()
                 access_token = ref_data.get('access_token')
@@ -312,7 +383,8 @@ def ha_control():
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
-        res = requests.post(url, headers=headers, json=svc_data, timeout=10)
+        res = http_client.post("homeassistant", url, headers=headers, json=svc_data)
+        invalidate_ha_states(current_user.id, base_url)
         if res.status_code in (200, 201):
             return jsonify({"success": True})
         else:
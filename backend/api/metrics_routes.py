@@ -0,0 +1,21 @@
+import hmac
+from flask import Blueprint, request, Response
+from backend.config import Config
+from backend import metrics
+from backend.integrations.ha_context import get_ha_context_stats
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def prometheus_metrics():
+    """Every worker's metrics, added up, in Prometheus' text format."""
+    if not Config.METRICS_TOKEN and not Config.METRICS_PUBLIC:
+        return Response("Not Found\n", status=404, mimetype='text/plain')
+    if Config.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode(), Config.METRICS_TOKEN.encode()):
+            return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    # Refreshes the stored-context gauges, which are only measured on demand
+    get_ha_context_stats()
+    body = metrics.render_prometheus(metrics.collect(Config.METRICS_DIR or None))
+    return Response(body, mimetype='text/plain; version=0.0.4')
@@ -1,19 +1,30 @@
-from flask import Flask
+import time
+from flask import Flask, request, g
 from flask_cors import CORS
 from backend.config import Config
-from backend.database import init_db
+from backend.database import init_db, reset_request_query_count, record_request_query_count
+from backend.core.timezones import warm_up as warm_up_timezones
 from backend.extensions import login_manager, oauth
-from backend.models.user import User
+from backend.principals import load_user as load_cached_user, user_for_api_token
+from backend.utils import resolve_request_identity
+from backend import metrics
 from backend.api.api_routes import api_bp
 from backend.api.auth_routes import auth_bp
 from backend.api.view_routes import view_bp
+from backend.api.metrics_routes import metrics_bp
 import os
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+# Proxy headers trusted in front of the app (one reverse proxy hop)
+PROXY_HOPS = dict(x_for=1, x_proto=1, x_host=1, x_prefix=1)
+
+# Up to the response headers: a streamed body (/api/query/stream) is not included
+request_seconds = metrics.histogram("neubot_http_request_seconds", "Request latency by endpoint, method and status")
+
 def create_app():
     static_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'static'))
     app = Flask(__name__, static_folder=static_folder, template_folder=static_folder)
-    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
+    app.wsgi_app = ProxyFix(app.wsgi_app, **PROXY_HOPS)
     app.config.from_object(Config)
     app.secret_key = Config.SECRET_KEY
     
@@ -59,7 +70,7 @@ def create_app():
     # User loader
     @login_manager.user_loader
     def load_user(user_id):
-        return User.get(user_id)
+        return load_cached_user(user_id)
 
     # Request loader for API tokens
     @login_manager.request_loader
@@ -70,10 +81,9 @@ def create_app():
             try:
                 # Expecting 'Bearer <token>'
                 token = auth_header.replace('Bearer ', '', 1)
-                from backend.security import decode_api_token
-                user_id = decode_api_token(token)
-                if user_id:
-                    return User.get(user_id)
+                user = user_for_api_token(token)
+                if user:
+                    return user
             except Exception:
                 return None
         
@@ -81,22 +91,45 @@ def create_app():
         token = request.args.get('token')
         if token:
             try:
-                from backend.security import decode_api_token
-                user_id = decode_api_token(token)
-                if user_id:
-                    return User.get(user_id)
+                user = user_for_api_token(token)
+                if user:
+                    return user
             except Exception:
                 return None
                 
         return None
         
+    @app.before_request
+    def start_db_budget():
+        g.request_started = time.perf_counter()
+        reset_request_query_count()
+
+    # After the DB budget reset, so the principal lookups count towards it
+    app.before_request(resolve_request_identity)
+
+    @app.after_request
+    def record_db_budget(response):
+        count = record_request_query_count(request.endpoint or "unknown")
+        response.headers['X-DB-Queries'] = str(count)
+        request_seconds.observe(time.perf_counter() - g.request_started, endpoint=request.endpoint or "unknown",
+                                method=request.method, status=response.status_code)
+        return response
+        
     # Register blueprints
     app.register_blueprint(api_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(view_bp)
+    app.register_blueprint(metrics_bp)
     
     # Initialize DB
     init_db()
+
+    # Each gunicorn worker builds its own app, so this loads the timezone
+    # polygons once per worker before it takes traffic
+    warm_up_timezones()
+
+    if Config.METRICS_DIR:
+        metrics.start_snapshot_writer(Config.METRICS_DIR, Config.METRICS_FLUSH_SECONDS)
     
     return app
 
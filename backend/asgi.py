@@ -0,0 +1,172 @@
+import sys
+import io
+import asyncio
+import contextvars
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from flask import Flask, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
+from backend.app import PROXY_HOPS
+from backend.api.api_routes import (parser, read_query_request, requested_trace, query_response, format_stream_event,
+                                    stream_response, read_batch_request, batch_response)
+from backend.core.semantic_parser import ParseContext
+from backend.core.rate_limiter import batch_accounting
+from backend import http_client
+
+# ASGI front for the Flask app. /api/query and /api/query/stream are served
+# natively on the event loop with the parser's async pipeline, so a worker
+# can hold many queries waiting on upstreams at once; every other route runs
+# the regular Flask app in a thread through WsgiToAsgi.
+
+# Same proxy header handling as the WSGI stack, applied to a bare environ
+_forwarded = ProxyFix(lambda environ, start_response: environ, **PROXY_HOPS)
+
+def _environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+    path_info = scope["path"].encode("utf8").decode("latin1")
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def _read_body(receive) -> bytes:
+    chunks: List[bytes] = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+_UNSET = object()
+
+async def _in_thread(fn):
+    """Runs a blocking step of the request (DB lookups in hooks) off the event
+    loop, then keeps the context variables it set, such as the request's DB
+    query counter."""
+    context = contextvars.copy_context()
+    result = await asyncio.get_running_loop().run_in_executor(None, context.run, fn)
+    for var, value in context.items():
+        if var.get(_UNSET) is not value:
+            var.set(value)
+    return result
+
+# Views return (rv, body): a Flask response value, plus an async iterator of
+# chunks to stream after it, or None
+async def _query_view() -> Tuple[Any, None]:
+    query_text, user_timezone = read_query_request()
+    ctx = ParseContext(user_timezone=user_timezone)
+    return query_response(await parser.process_async(query_text, user_timezone, ctx), requested_trace(ctx)), None
+
+async def _query_stream_view() -> Tuple[Any, AsyncIterator[str]]:
+    query_text, user_timezone = read_query_request()
+    ctx = ParseContext(user_timezone=user_timezone)
+    trace = requested_trace(ctx)
+
+    async def body():
+        async for event, data in parser.process_stream_async(query_text, user_timezone, ctx):
+            yield format_stream_event(event, data, trace)
+    return stream_response(), body()
+
+async def _query_batch_view() -> Tuple[Any, None]:
+    items, error = read_batch_request()
+    if error:
+        return (jsonify({"success": False, "error": error}), 400), None
+    with batch_accounting():
+        results = await parser.process_batch_async(items)
+    return batch_response(results), None
+
+ASYNC_ROUTES = {
+    ("POST", "/api/query"): _query_view,
+    ("POST", "/api/query/stream"): _query_stream_view,
+    ("POST", "/api/query/batch"): _query_batch_view,
+}
+
+class AsyncQueryApp:
+    def __init__(self, flask_app: Flask):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        view = ASYNC_ROUTES.get((scope.get("method"), scope.get("path")))
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and view is not None:
+            await self._serve(view, scope, receive, send)
+        else:
+            # Without its own context every WSGI request would share one thread
+            async with ThreadSensitiveContext():
+                await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await http_client.close_async_session()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _serve(self, view, scope, receive, send):
+        app = self.flask_app
+        environ = _forwarded(_environ(scope, await _read_body(receive)), None)
+        body: Optional[AsyncIterator[str]] = None
+        # The same request lifecycle Flask.wsgi_app runs (hooks, session,
+        # login, teardown), with the view awaited instead of called
+        with app.request_context(environ):
+            try:
+                try:
+                    # before_request hooks load the user and resolve the caller's identity
+                    rv = await _in_thread(app.preprocess_request)
+                    if rv is None:
+                        rv, body = await view()
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                body = None
+                response = app.handle_exception(e)
+            headers: List[Tuple[bytes, bytes]] = [(k.encode("latin1"), v.encode("latin1"))
+                                                 for k, v in response.headers.to_wsgi_list()]
+            await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+            if body is None:
+                await send({"type": "http.response.body", "body": response.get_data()})
+                return
+            async for chunk in body:
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+def create_asgi_app(flask_app: Flask) -> AsyncQueryApp:
+    return AsyncQueryApp(flask_app)
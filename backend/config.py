@@ -7,6 +7,10 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_hex(16))
     DB_FILE = os.getenv("DB_FILE", "neubot.db")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "2.0"))
+    DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
     
     # API Keys
     OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "") 
@@ -22,6 +26,89 @@ class Config:
     
     # Encryption
     TOKEN_ENCRYPTION_SALT = os.getenv("TOKEN_ENCRYPTION_SALT", "").encode()
+    # Comma-separated secrets that older tokens may still be encrypted with
+    PREVIOUS_SECRET_KEYS = [k.strip() for k in os.getenv("PREVIOUS_SECRET_KEYS", "").split(",") if k.strip()]
+
+    # Geocoding: "hybrid" answers common cities with unambiguous names from the
+    # bundled gazetteer and falls back to Nominatim, "offline" never calls
+    # Nominatim, "online" skips the gazetteer
+    GEOCODER_MODE = os.getenv("GEOCODER_MODE", "hybrid")
+    GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "2048"))
+    GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(30 * 86400)))
+    GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", "3600"))
+
+    # Load timezone polygons fully into memory instead of reading from disk per lookup
+    TIMEZONE_FINDER_IN_MEMORY = os.getenv("TIMEZONE_FINDER_IN_MEMORY", "1") == "1"
+
+    # Weather observations are shared between users for WEATHER_CACHE_TTL
+    # seconds, keyed by lat/lon rounded to WEATHER_CACHE_PRECISION decimals
+    WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+    WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "1024"))
+    WEATHER_CACHE_PRECISION = int(os.getenv("WEATHER_CACHE_PRECISION", "2"))
+    # Whether answers served from the cache use up the monthly weather quota
+    WEATHER_CACHE_HITS_COUNT = os.getenv("WEATHER_CACHE_HITS_COUNT", "1") == "1"
+
+    SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+
+    # Outbound HTTP: connections kept alive per upstream host, and the share
+    # of traffic that may be spent on retries
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+    HTTP_RETRY_BUDGET_RATIO = float(os.getenv("HTTP_RETRY_BUDGET_RATIO", "0.2"))
+    # Connections shared by all in-flight requests of one ASGI worker's loop
+    HTTP_ASYNC_POOL_SIZE = int(os.getenv("HTTP_ASYNC_POOL_SIZE", "100"))
+    # Every linked Home Assistant is its own host; sessions and circuit
+    # breakers are kept for the HTTP_MAX_HOSTS most recently used ones
+    HTTP_MAX_HOSTS = int(os.getenv("HTTP_MAX_HOSTS", "256"))
+
+    # Decoded API tokens and loaded users, so authenticated calls skip
+    # SQLite; entries are dropped on login/logout of their user
+    PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+    PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+
+    # Per-user copy of Home Assistant's /api/states; dropped early after our own service calls
+    HA_STATE_CACHE_TTL = float(os.getenv("HA_STATE_CACHE_TTL", "5"))
+    HA_STATE_CACHE_SIZE = int(os.getenv("HA_STATE_CACHE_SIZE", "512"))
+
+    # What the last Home Assistant command touched, so follow-ups ("turn them
+    # off") resolve; "sqlite" shares it between workers, "memory" keeps it per
+    # worker. Entries expire HA_CONTEXT_TTL seconds after their last write.
+    HA_CONTEXT_BACKEND = os.getenv("HA_CONTEXT_BACKEND", "sqlite")
+    HA_CONTEXT_TTL = int(os.getenv("HA_CONTEXT_TTL", "1800"))
+    HA_CONTEXT_SIZE = int(os.getenv("HA_CONTEXT_SIZE", "10000"))
+
+    # Optional live mirror over HA's WebSocket API (one socket per active
+    # linked user per worker), closed after HA_WEBSOCKET_IDLE_SECONDS unused
+    HA_WEBSOCKET_ENABLED = os.getenv("HA_WEBSOCKET_ENABLED", "0") == "1"
+    HA_WEBSOCKET_MAX_CONNECTIONS = int(os.getenv("HA_WEBSOCKET_MAX_CONNECTIONS", "50"))
+    HA_WEBSOCKET_IDLE_SECONDS = float(os.getenv("HA_WEBSOCKET_IDLE_SECONDS", "900"))
+
+    # Entities sharing identical service data are switched in one HA call;
+    # the remaining distinct calls run HA_SERVICE_CONCURRENCY at a time
+    HA_BATCH_SERVICE_CALLS = os.getenv("HA_BATCH_SERVICE_CALLS", "1") == "1"
+    HA_SERVICE_CONCURRENCY = int(os.getenv("HA_SERVICE_CONCURRENCY", "8"))
+
+    # Independent tools/segments of one query run concurrently on a shared
+    # pool; a tool still running after TOOL_TIMEOUT_SECONDS is abandoned
+    PARSER_MAX_WORKERS = int(os.getenv("PARSER_MAX_WORKERS", "16"))
+    TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+    # Most queries one /api/query/batch request may carry
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+
+    # Workers snapshot their metrics into METRICS_DIR every
+    # METRICS_FLUSH_SECONDS so /metrics can report all of them; unset, it
+    # reports the answering process only. /metrics requires METRICS_TOKEN as
+    # a bearer token; with no token it is a 404 unless METRICS_PUBLIC opts in
+    # to serving per-route traffic and upstream error rates to anyone.
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+    METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"
+
+    # Every parse whose trace spans at least TRACE_EXPORT_MIN_MS is appended
+    # to TRACE_EXPORT_FILE as a JSON line (steps, spans, timings; no results)
+    TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "")
+    TRACE_EXPORT_MIN_MS = float(os.getenv("TRACE_EXPORT_MIN_MS", "0"))
 
     # Defaults
     DEFAULT_TIMEZONE = "America/New_York"
@@ -32,3 +119,14 @@ class Config:
 
     USER_WEATHER_RATE_LIMIT = 50
     USER_SEARCH_RATE_LIMIT = 100
+
+    # "memory" keeps sliding-window counters in process and writes behind to
+    # SQLite; "sqlite" queries the requests table on every check
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_BUCKET_SECONDS = int(os.getenv("RATE_LIMIT_BUCKET_SECONDS", "3600"))
+    RATE_LIMIT_SYNC_SECONDS = float(os.getenv("RATE_LIMIT_SYNC_SECONDS", "5"))
+    RATE_LIMIT_FLUSH_SECONDS = float(os.getenv("RATE_LIMIT_FLUSH_SECONDS", "1"))
+    RATE_LIMIT_FLUSH_BATCH = int(os.getenv("RATE_LIMIT_FLUSH_BATCH", "100"))
+    # Identities kept in memory per worker; least recently used ones are dropped
+    # once their queued writes are flushed and reloaded from SQLite on next use
+    RATE_LIMIT_MAX_IDENTITIES = int(os.getenv("RATE_LIMIT_MAX_IDENTITIES", "10000"))
@@ -0,0 +1,165 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from backend import metrics
+
+cache_requests = metrics.counter("neubot_cache_requests_total", "Cache lookups by cache and result")
+cache_evictions = metrics.counter("neubot_cache_evictions_total", "Entries evicted for size by cache")
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a TTL.
+
+    Cached values may be None (e.g. negative results), so lookup() returns a
+    (hit, value) pair instead of relying on a sentinel default.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                cache_requests.inc(cache=self.name, result="hit")
+                return True, entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            cache_requests.inc(cache=self.name, result="miss")
+            return False, None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        hit, value = self.lookup(key)
+        return value if hit else default
+
+    def peek(self, key: Hashable) -> Tuple[bool, Any]:
+        """lookup() without counting a hit or miss or refreshing LRU order.
+
+        For re-checks of a key whose lookup() was already counted (e.g. inside
+        a single flight) and for probes that are not a lookup of their own.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return True, entry[1]
+            return False, None
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                cache_evictions.inc(cache=self.name)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def values(self) -> List[Any]:
+        """Snapshot of the unexpired values, without touching LRU order or hit counts."""
+        now = time.monotonic()
+        with self._lock:
+            return [value for expires, value in self._data.values() if expires > now]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller runs fn(); callers arriving while it is in flight wait
+    for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn) -> Tuple[Any, bool]:
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._calls[key] = flight
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            flight.done.set()
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop.
+
+    Waiters await the leader's future instead of blocking a thread.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Future"] = {}
+
+    async def do(self, key: Hashable, fn) -> Tuple[Any, bool]:
+        flight = self._calls.get(key)
+        if flight is not None:
+            # shield: one cancelled waiter must not cancel the shared call
+            return await asyncio.shield(flight), True
+        flight = asyncio.get_running_loop().create_future()
+        self._calls[key] = flight
+        try:
+            result = await fn()
+            flight.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            # Retrieve it so an unawaited flight does not log "exception never retrieved"
+            flight.exception()
+            raise
+        finally:
+            self._calls.pop(key, None)
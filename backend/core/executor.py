@@ -0,0 +1,50 @@
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable
+from flask import g, has_request_context, current_app
+from flask.globals import request_ctx
+from backend.config import Config
+from backend import metrics
+
+# Shared, bounded pool for running independent tools concurrently. Work
+# submitted from a request runs inside a copy of that request's context, so
+# current_user, request headers and g behave as they do on the request thread.
+
+tool_timeouts = metrics.counter("neubot_tool_timeouts_total", "Tools abandoned after TOOL_TIMEOUT_SECONDS")
+tool_seconds = metrics.histogram("neubot_tool_seconds", "Time spent in each parser tool")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.PARSER_MAX_WORKERS, thread_name_prefix="parser")
+    return _executor
+
+def with_request_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wraps fn to run under a copy of the current request context and its g.
+
+    A copied request context on its own would get a fresh app context (and an
+    empty g, losing e.g. the user flask-login already loaded), so g's
+    attributes are carried over too.
+    """
+    if not has_request_context():
+        return fn
+    app = current_app._get_current_object()
+    req = request_ctx.copy()
+    g_state = dict(vars(g))
+
+    def run(*args, **kwargs):
+        with app.app_context():
+            vars(g).update(g_state)
+            with req:
+                return fn(*args, **kwargs)
+    return run
+
+def submit(fn: Callable[..., Any], *args, **kwargs) -> Future:
+    # Context variables too (e.g. the request's DB query counter)
+    return get_executor().submit(contextvars.copy_context().run, with_request_context(fn), *args, **kwargs)
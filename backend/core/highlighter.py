@@ -0,0 +1,91 @@
+import re
+import functools
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+QUERY_INDICATORS = ["what", "what's", "how", "when", "where", "who", "why", "is", "can", "tell", "show", "calculate", "compute", "solve"]
+TOOL_REFERENCES = ["time", "weather", "date", "day", "calculator", "calc"]
+MATH_OPERATORS = ["plus", "minus", "times", "divided by", "multiplied by"]
+MATH_SYMBOLS = ["+", "-", "*", "/"]
+
+STATIC_PATTERNS: List[Tuple[str, str]] = (
+    [(p, "query-indicator") for p in QUERY_INDICATORS]
+    + [(p, "tool-reference") for p in TOOL_REFERENCES]
+    + [(p, "math-operator") for p in MATH_OPERATORS]
+    + [(p, "math-operator") for p in MATH_SYMBOLS]
+)
+
+@dataclass(frozen=True)
+class HighlightSpan:
+    start: int
+    end: int
+    cls: str
+    text: str
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"start": self.start, "end": self.end, "class": self.cls, "text": self.text}
+
+def _pattern_part(p: str) -> str:
+    # Word boundaries only where the pattern itself starts/ends with a word
+    # character: "weather" -> \bweather\b, "+" -> \+, "Winston-Salem" -> \bWinston\-Salem\b
+    part = re.escape(p)
+    if p[0].isalnum():
+        part = r'\b' + part
+    if p[-1].isalnum():
+        part = part + r'\b'
+    return part
+
+@functools.lru_cache(maxsize=256)
+def _compile(location: Optional[str]) -> Tuple["re.Pattern", Dict[str, str]]:
+    """Master alternation for the static vocabulary plus one location, longest pattern first."""
+    all_patterns = list(STATIC_PATTERNS)
+    if location:
+        all_patterns.append((location, "entity-location"))
+    all_patterns.sort(key=lambda x: len(x[0]), reverse=True)
+    pattern_map = {p.lower(): cls for p, cls in all_patterns}
+    master = re.compile('(' + '|'.join(_pattern_part(p) for p, _ in all_patterns) + ')', re.IGNORECASE)
+    return master, pattern_map
+
+def find_spans(query: str, location: Optional[str] = None, offset: int = 0) -> List[HighlightSpan]:
+    master, pattern_map = _compile(location or None)
+    spans = []
+    for m in master.finditer(query):
+        cls = pattern_map.get(m.group(0).lower())
+        if cls:
+            spans.append(HighlightSpan(m.start() + offset, m.end() + offset, cls, m.group(0)))
+    return spans
+
+def render(query: str, spans: List[HighlightSpan], offset: int = 0) -> str:
+    parts = []
+    pos = 0
+    for span in spans:
+        start, end = span.start - offset, span.end - offset
+        parts.append(query[pos:start])
+        parts.append(f'<span class="{span.cls}">{span.text}</span>')
+        pos = end
+    parts.append(query[pos:])
+    return "".join(parts)
+
+def highlight(query: str, location: Optional[str] = None) -> Tuple[str, List[HighlightSpan]]:
+    """Returns (html, spans) for one query (or one segment of a split query)."""
+    spans = find_spans(query, location)
+    return render(query, spans), spans
+
+def segment_spans(query: str, segments: List[str], per_segment: List[List[HighlightSpan]]) -> List[HighlightSpan]:
+    """Re-bases per-segment spans onto the original query and marks the joining words as conjunctions."""
+    combined: List[HighlightSpan] = []
+    pos = 0
+    prev_end = None
+    for seg, spans in zip(segments, per_segment):
+        start = query.find(seg, pos)
+        if start < 0:
+            return combined
+        if prev_end is not None:
+            gap = query[prev_end:start]
+            word = gap.strip()
+            if word:
+                w_start = prev_end + gap.index(word)
+                combined.append(HighlightSpan(w_start, w_start + len(word), "conjunction", word))
+        combined.extend(HighlightSpan(s.start + start, s.end + start, s.cls, s.text) for s in spans)
+        pos = prev_end = start + len(seg)
+    return combined
@@ -0,0 +1,90 @@
+import re
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+WORD_RE = re.compile(r"\w+")
+
+Span = Tuple[int, int]
+
+def _gap(sep: str) -> str:
+    # Any run of whitespace is one gap; punctuation (the ' in "i'm") must match itself
+    stripped = sep.strip()
+    return stripped if stripped else " "
+
+def _phrase_key(phrase: str) -> str:
+    words = list(WORD_RE.finditer(phrase.lower()))
+    if not words:
+        return ""
+    key = words[0].group()
+    for prev, m in zip(words, words[1:]):
+        key += _gap(phrase[prev.end():m.start()]) + m.group()
+    return key
+
+class KeywordHits:
+    """Vocabulary hits for one text, grouped by category, with their character spans."""
+
+    __slots__ = ("_hits",)
+
+    def __init__(self, hits: Dict[str, Dict[str, List[Span]]]):
+        self._hits = hits
+
+    def __getitem__(self, category: str) -> FrozenSet[str]:
+        return frozenset(self._hits.get(category, ()))
+
+    def any(self, category: str) -> bool:
+        return category in self._hits
+
+    def first(self, category: str, order: Iterable[str]):
+        """First phrase of `order` (vocabulary order, not text order) that was hit."""
+        found = self._hits.get(category, {})
+        return next((p for p in order if p in found), None)
+
+    def spans(self, category: str) -> List[Tuple[int, int, str]]:
+        """(start, end, phrase) for every hit of the category, in text order."""
+        return sorted((start, end, phrase)
+                      for phrase, spans in self._hits.get(category, {}).items()
+                      for start, end in spans)
+
+class KeywordMatcher:
+    """Matches a whole vocabulary of words and phrases in one pass over a text.
+
+    Phrases are compiled into a table keyed by their normalised form plus the
+    set of all their prefixes. scan() splits the text into words once and
+    extends each starting word only while it is still a prefix of some
+    phrase, so it finds every hit, overlapping ones included (e.g. both
+    "turn on" and "on"). A hit means the same as `\\bphrase\\b`, except that
+    any whitespace run between words is accepted.
+    """
+
+    def __init__(self, vocabulary: Dict[str, Iterable[str]]):
+        self._phrases: Dict[str, List[Tuple[str, str]]] = {}
+        self._prefixes: Set[str] = set()
+        for category, phrases in vocabulary.items():
+            for phrase in phrases:
+                key = _phrase_key(phrase)
+                if not key:
+                    continue
+                self._phrases.setdefault(key, []).append((category, phrase))
+                words = list(WORD_RE.finditer(key))
+                for m in words[:-1]:
+                    self._prefixes.add(key[:m.end()])
+
+    def scan(self, text: str) -> KeywordHits:
+        matches = list(WORD_RE.finditer(text))
+        phrases = self._phrases
+        prefixes = self._prefixes
+        found: Dict[str, Dict[str, List[Span]]] = {}
+        n = len(matches)
+        for i in range(n):
+            key = matches[i].group()
+            j = i
+            while True:
+                entries = phrases.get(key)
+                if entries:
+                    span = (matches[i].start(), matches[j].end())
+                    for category, phrase in entries:
+                        found.setdefault(category, {}).setdefault(phrase, []).append(span)
+                if key not in prefixes or j + 1 == n:
+                    break
+                j += 1
+                key += _gap(text[matches[j - 1].end():matches[j].start()]) + matches[j].group()
+        return KeywordHits(found)
@@ -0,0 +1,55 @@
+import re
+import functools
+from dataclasses import dataclass
+from typing import Tuple
+from backend.core.keyword_matcher import KeywordMatcher, KeywordHits
+
+TOKEN_RE = re.compile(r"[\w']+|[.,!?;]")
+
+# Chitchat groups keep the order the chitchat tool answers them in
+CHITCHAT_GROUPS = ("chitchat_identity", "chitchat_name", "chitchat_wellbeing", "chitchat_abilities")
+
+PARSER_VOCABULARY = KeywordMatcher({
+    "fun": ["joke", "jokes", "destruct", "rainbow", "good morning", "good afternoon", "good evening", "good night", "goodnight"],
+    "personal": ["my name", "who am i", "what is my name", "do you know my name", "do you know who i am",
+                 "my email", "what is my email", "am i logged in", "my account"],
+    "chitchat_identity": ["who are you", "your name", "what are you called", "what is your name"],
+    "chitchat_name": ["i'm neubot, nice to meet you", "my name is neubot", "i'm neubot", "im neubot", "neubot is my name"],
+    "chitchat_wellbeing": ["how are you", "how's it going", "how are you doing"],
+    "chitchat_abilities": ["what can you do", "what are your abilities", "help me", "what tools do you have"],
+})
+
+@dataclass(frozen=True)
+class QueryFeatures:
+    """Everything the detectors and extractors need from one query, computed once."""
+    text: str
+    lower: str
+    # Word/punctuation tokens of the original text and their character spans
+    tokens: Tuple[str, ...]
+    spans: Tuple[Tuple[int, int], ...]
+    # Lowercased tokens with trailing/leading .,?! stripped (tool and indicator lookups)
+    words: Tuple[str, ...]
+    # Tokens re-joined with single spaces and lowercased; what phrase checks run against
+    normalized: str
+    titled: str
+    hits: KeywordHits
+
+    @property
+    def is_chitchat(self) -> bool:
+        return any(self.hits.any(g) for g in CHITCHAT_GROUPS)
+
+@functools.lru_cache(maxsize=2048)
+def analyze_query(query: str) -> QueryFeatures:
+    matches = list(TOKEN_RE.finditer(query))
+    tokens = tuple(m.group() for m in matches)
+    normalized = " ".join(tokens).lower()
+    return QueryFeatures(
+        text=query,
+        lower=query.lower(),
+        tokens=tokens,
+        spans=tuple(m.span() for m in matches),
+        words=tuple(t.lower().strip(".,?!") for t in tokens),
+        normalized=normalized,
+        titled=query.title(),
+        hits=PARSER_VOCABULARY.scan(normalized),
+    )
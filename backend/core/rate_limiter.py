@@ -1,229 +1,522 @@
 from datetime import datetime, timedelta
+import os
 import math
-from typing import Optional, Tuple, Dict, Any
+import atexit
+import threading
+import time
+import contextlib
+import contextvars
+from collections import OrderedDict, deque
+from typing import Optional, Tuple, Dict, Any, List
 from backend.database import get_db_connection
 from backend.config import Config
+from backend import metrics
 
-class RateLimiter:
-    def __init__(self):
-        # DB is initialized in database.py
-        pass
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+WINDOW = timedelta(days=30)
+
+rate_limit_decisions = metrics.counter("neubot_rate_limit_decisions_total", "Rate limit checks by outcome")
+rate_limit_flushes = metrics.counter("neubot_rate_limit_flushed_writes_total", "Rate limit writes flushed to SQLite")
+
+INSERT_REQUEST_SQL = '''
+INSERT INTO requests (ip, req_type, timestamp, ts, user_id)
+VALUES (?, ?, ?, ?, ?)
+'''
+SAVE_RESET_SQL = '''
+INSERT OR REPLACE INTO reset_dates (ip, reset_date, reset_ts) VALUES (?, ?, ?)
+'''
+
+def _epoch(dt: datetime) -> int:
+    return int(dt.timestamp())
+
+def _reset_from_row(row) -> datetime:
+    # Rows written before the epoch migration may only carry the string form
+    if row[1] is not None:
+        return datetime.fromtimestamp(row[1])
+    return datetime.strptime(row[0], TIMESTAMP_FORMAT)
+
+def identity_key(ip: str, user_id: Optional[str]) -> str:
+    # Use user_id when available so resets follow the user; fall back to IP for guests
+    return f"user:{user_id}" if user_id else f"ip:{ip}"
 
-    def _identity_key(self, ip: str, user_id: Optional[str]) -> str:
-        # Use user_id when available so resets follow the user; fall back to IP for guests
-        return f"user:{user_id}" if user_id else f"ip:{ip}"
-    
-    def _cleanup_old_requests(self, ip: str, req_type: str, user_id: Optional[str] = None):
+class SQLiteRateLimitStore:
+    """Reads and writes every request straight to the `requests` table."""
+
+    def prune(self, ip: str, req_type: str, user_id: Optional[str], cutoff: datetime):
         with get_db_connection() as conn:
             cursor = conn.cursor()
-
-            now = datetime.now()
-            month_ago = now - timedelta(days=30)
-            month_ago_str = month_ago.strftime("%Y-%m-%d %H:%M:%S")
+            cutoff_ts = _epoch(cutoff)
 
             if user_id:
                 cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE user_id = ? AND req_type = ? AND timestamp > ?
-                ''', (user_id, req_type, month_ago_str))
+                SELECT COUNT(*) FROM requests
+                WHERE user_id = ? AND req_type = ? AND ts > ?
+                ''', (user_id, req_type, cutoff_ts))
             else:
                 cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE ip = ? AND req_type = ? AND timestamp > ? AND user_id IS NULL
-                ''', (ip, req_type, month_ago_str))
+                SELECT COUNT(*) FROM requests
+                WHERE ip = ? AND req_type = ? AND ts > ? AND user_id IS NULL
+                ''', (ip, req_type, cutoff_ts))
 
             recent_count = cursor.fetchone()[0]
 
             if recent_count == 0:
                 if user_id:
                     cursor.execute('''
-                    DELETE FROM requests 
+                    DELETE FROM requests
                     WHERE user_id = ? AND req_type = ?
                     ''', (user_id, req_type))
                 else:
                     cursor.execute('''
-                    DELETE FROM requests 
+                    DELETE FROM requests
                     WHERE ip = ? AND req_type = ? AND user_id IS NULL
                     ''', (ip, req_type))
             else:
                 if user_id:
                     cursor.execute('''
-                    DELETE FROM requests 
-                    WHERE user_id = ? AND req_type = ? AND timestamp < ?
-                    ''', (user_id, req_type, month_ago_str))
+                    DELETE FROM requests
+                    WHERE user_id = ? AND req_type = ? AND ts < ?
+                    ''', (user_id, req_type, cutoff_ts))
                 else:
                     cursor.execute('''
-                    DELETE FROM requests 
-                    WHERE ip = ? AND req_type = ? AND timestamp < ? AND user_id IS NULL
-                    ''', (ip, req_type, month_ago_str))
+                    DELETE FROM requests
+                    WHERE ip = ? AND req_type = ? AND ts < ? AND user_id IS NULL
+                    ''', (ip, req_type, cutoff_ts))
 
             conn.commit()
-    
-    def _get_next_reset(self, ip: str, user_id: Optional[str]) -> Optional[datetime]:
-        identity = self._identity_key(ip, user_id)
+
+    def count(self, ip: str, req_type: str, user_id: Optional[str], since: datetime) -> int:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT reset_date FROM reset_dates WHERE ip = ?', (identity,))
+            since_ts = _epoch(since)
+            if user_id:
+                cursor.execute('''
+                SELECT COUNT(*) FROM requests
+                WHERE user_id = ? AND req_type = ? AND ts > ?
+                ''', (user_id, req_type, since_ts))
+            else:
+                cursor.execute('''
+                SELECT COUNT(*) FROM requests
+                WHERE ip = ? AND req_type = ? AND ts > ? AND user_id IS NULL
+                ''', (ip, req_type, since_ts))
+            return cursor.fetchone()[0]
+
+    def record(self, ip: str, req_type: str, user_id: Optional[str], now: datetime):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            now_str = now.strftime(TIMESTAMP_FORMAT)
+
+            cursor.execute(INSERT_REQUEST_SQL, (ip, req_type, now_str, _epoch(now), user_id))
+
+            identity = identity_key(ip, user_id)
+            cursor.execute('SELECT reset_date, reset_ts FROM reset_dates WHERE ip = ?', (identity,))
+            row = cursor.fetchone()
+            if not row or now - _reset_from_row(row) >= WINDOW:
+                cursor.execute(SAVE_RESET_SQL, (identity, now_str, _epoch(now)))
+
+            conn.commit()
+
+    def get_reset_start(self, ip: str, user_id: Optional[str]) -> Optional[datetime]:
+        identity = identity_key(ip, user_id)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT reset_date, reset_ts FROM reset_dates WHERE ip = ?', (identity,))
             row = cursor.fetchone()
             if not row:
                 return None
-            start = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
-            return start + timedelta(days=30)
-    
-    def _save_reset_date(self, ip: str, reset_date: datetime, user_id: Optional[str]):
-        identity = self._identity_key(ip, user_id)
+            return _reset_from_row(row)
+
+    def set_reset_start(self, ip: str, user_id: Optional[str], start: datetime):
+        identity = identity_key(ip, user_id)
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-            INSERT OR REPLACE INTO reset_dates (ip, reset_date) 
-            VALUES (?, ?)
-            ''', (identity, reset_date.strftime("%Y-%m-%d %H:%M:%S")))
+            cursor.execute(SAVE_RESET_SQL, (identity, start.strftime(TIMESTAMP_FORMAT), _epoch(start)))
             conn.commit()
-    
-    def check_rate_limit(self, ip: str, req_type: str, user_id: Optional[str] = None) -> Tuple[bool, int]:
-        self._cleanup_old_requests(ip, req_type, user_id)
-        
+
+    def clear(self, ip: str, user_id: Optional[str]):
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
-            
             if user_id:
-                search_limit = Config.USER_SEARCH_RATE_LIMIT
-                weather_limit = Config.USER_WEATHER_RATE_LIMIT
-                
-                if req_type in ["search", "weather"]:
-                    cursor.execute('''
-                    SELECT COUNT(*) FROM requests 
-                    WHERE user_id = ? AND req_type = ? AND timestamp > ?
-                    ''', (user_id, req_type, month_ago))
-                    current_count = cursor.fetchone()[0]
-                    
-                    limit = search_limit if req_type == "search" else weather_limit
-                    return (current_count < limit), limit - current_count
-
+                cursor.execute('DELETE FROM requests WHERE user_id = ?', (user_id,))
             else:
-                search_limit = Config.GUEST_SEARCH_RATE_LIMIT
-                weather_limit = Config.GUEST_WEATHER_RATE_LIMIT
-                
-                if req_type in ["search", "weather"]:
-                    cursor.execute('''
-                    SELECT COUNT(*) FROM requests 
-                    WHERE ip = ? AND req_type = ? AND timestamp > ? AND user_id IS NULL
-                    ''', (ip, req_type, month_ago))
-                    current_count = cursor.fetchone()[0]
-
-                    limit = search_limit if req_type == "search" else weather_limit
-                    return (current_count < limit), limit - current_count
-        
-        return True, -1
-    
-    def add_request(self, ip: str, req_type: str, user_id: Optional[str] = None):
+                cursor.execute('DELETE FROM requests WHERE ip = ? AND user_id IS NULL', (ip,))
+            conn.commit()
+
+class SlidingWindowCounter:
+    """Request count over a sliding window, kept as fixed-width time buckets.
+
+    Adding and counting are amortised O(1): expired buckets fall off the left
+    of the deque and a running total is maintained.
+    """
+    __slots__ = ("buckets", "total")
+
+    def __init__(self):
+        self.buckets = deque()
+        self.total = 0
+
+    def add(self, bucket: int, amount: int = 1):
+        if self.buckets and self.buckets[-1][0] == bucket:
+            self.buckets[-1][1] += amount
+        else:
+            self.buckets.append([bucket, amount])
+        self.total += amount
+
+    def count(self, oldest_bucket: int) -> int:
+        while self.buckets and self.buckets[0][0] < oldest_bucket:
+            self.total -= self.buckets.popleft()[1]
+        return self.total
+
+class _IdentityState:
+    __slots__ = ("counters", "reset_start", "loaded_at")
+
+    def __init__(self):
+        self.counters: Dict[str, SlidingWindowCounter] = {}
+        self.reset_start: Optional[datetime] = None
+        self.loaded_at = 0.0
+
+class MemoryRateLimitStore:
+    """In-memory sliding-window counters with SQLite as a write-behind store.
+
+    Writes are queued and flushed in batches by a background thread. Each
+    identity is re-read from SQLite every RATE_LIMIT_SYNC_SECONDS so counts
+    recorded by other gunicorn workers are picked up; between syncs a worker
+    may over-admit by at most what its peers accepted in that interval.
+
+    Counts are whole buckets: a request up to bucket_seconds older than the
+    window may still be counted, so the store errs towards denying.
+
+    Lock order is _flush_lock then _lock. _lock only guards in-memory state;
+    SQLite is read and written under _flush_lock alone, so a reload or flush
+    never holds up checks for other identities.
+    """
+
+    def __init__(self, bucket_seconds: int = None, sync_seconds: float = None,
+                 flush_seconds: float = None, flush_batch: int = None, max_identities: int = None):
+        self.bucket_seconds = bucket_seconds or Config.RATE_LIMIT_BUCKET_SECONDS
+        self.sync_seconds = sync_seconds if sync_seconds is not None else Config.RATE_LIMIT_SYNC_SECONDS
+        self.flush_seconds = flush_seconds if flush_seconds is not None else Config.RATE_LIMIT_FLUSH_SECONDS
+        self.flush_batch = flush_batch or Config.RATE_LIMIT_FLUSH_BATCH
+        self.max_identities = max_identities or Config.RATE_LIMIT_MAX_IDENTITIES
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._reset_process_state()
+        atexit.register(self.flush)
+
+    def _reset_process_state(self):
+        self._pid = os.getpid()
+        # A fork can happen mid-flush; the child must not inherit a held lock
+        self._flush_lock = threading.Lock()
+        self._states: "OrderedDict[str, _IdentityState]" = OrderedDict()
+        self._pending: List[Tuple[str, tuple]] = []
+        # Changes per identity since the last flush took _pending, replayed
+        # onto a reload so it does not lose writes that were not in SQLite yet
+        self._dirty: Dict[str, List[tuple]] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+
+    def _check_fork(self):
+        # State inherited from a parent process belongs to the parent
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_process_state()
+
+    def _bucket(self, dt: datetime) -> int:
+        return _epoch(dt) // self.bucket_seconds
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_loop, name="rate-limit-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def _enqueue(self, sql: str, params: tuple):
+        self._pending.append((sql, params))
+        self._ensure_flusher()
+        if len(self._pending) >= self.flush_batch:
+            self._wake.set()
+
+    def flush(self):
+        self._check_fork()
+        with self._flush_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        # Batches are taken and written under _flush_lock, so they land in order
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._dirty.clear()
+            self._evict()
+        if pending:
+            self._write(pending)
+
+    def _write(self, pending: List[Tuple[str, tuple]]):
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            now_dt = datetime.now()
-            now_str = now_dt.strftime("%Y-%m-%d %H:%M:%S")
-
-            cursor.execute('''
-            INSERT INTO requests (ip, req_type, timestamp, user_id)
-            VALUES (?, ?, ?, ?)
-            ''', (ip, req_type, now_str, user_id))
-
-            # if req_type != "total":
-            #    cursor.execute('''
-            #    INSERT INTO requests (ip, req_type, timestamp, user_id)
-            #    VALUES (?, ?, ?, ?)
-            #    ''', (ip, "total", now_str, user_id))
-
-            identity = self._identity_key(ip, user_id)
-            cursor.execute('SELECT reset_date FROM reset_dates WHERE ip = ?', (identity,))
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute('''
-                INSERT OR REPLACE INTO reset_dates (ip, reset_date) VALUES (?, ?)
-                ''', (identity, now_str))
-            else:
-                start = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
-                if now_dt - start >= timedelta(days=30):
-                    cursor.execute('''
-                    INSERT OR REPLACE INTO reset_dates (ip, reset_date) VALUES (?, ?)
-                    ''', (identity, now_str))
-
+            # Group consecutive identical statements into executemany batches
+            batch_sql, batch = None, []
+            for sql, params in pending:
+                if sql != batch_sql and batch:
+                    cursor.executemany(batch_sql, batch)
+                    batch = []
+                batch_sql = sql
+                batch.append(params)
+            if batch:
+                cursor.executemany(batch_sql, batch)
+            now = time.time()
+            if now - self._last_prune > 3600:
+                cursor.execute('DELETE FROM requests WHERE ts < ?', (_epoch(datetime.now() - WINDOW),))
+                self._last_prune = now
             conn.commit()
-    
-    def get_limits(self, ip: str, user_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
-        self._cleanup_old_requests(ip, "search", user_id)
-        self._cleanup_old_requests(ip, "weather", user_id)
-        self._cleanup_old_requests(ip, "total", user_id)
-        
+        rate_limit_flushes.inc(len(pending))
+
+    def _load(self, ip: str, user_id: Optional[str]) -> _IdentityState:
+        state = _IdentityState()
+        since = _epoch(datetime.now() - WINDOW)
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
-            month_ago = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
-            
             if user_id:
-                search_limit = Config.USER_SEARCH_RATE_LIMIT
-                weather_limit = Config.USER_WEATHER_RATE_LIMIT
-                
-                cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE user_id = ? AND req_type = 'search' AND timestamp > ?
-                ''', (user_id, month_ago))
-                search_count = cursor.fetchone()[0]
-                
-                cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE user_id = ? AND req_type = 'weather' AND timestamp > ?
-                ''', (user_id, month_ago))
-                weather_count = cursor.fetchone()[0]
-                
                 cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE user_id = ? AND req_type = 'total' AND timestamp > ?
-                ''', (user_id, month_ago))
-                total_count = cursor.fetchone()[0]
+                SELECT req_type, ts / ? AS bucket, COUNT(*) FROM requests
+                WHERE user_id = ? AND ts > ? GROUP BY req_type, bucket ORDER BY bucket
+                ''', (self.bucket_seconds, user_id, since))
             else:
-                search_limit = Config.GUEST_SEARCH_RATE_LIMIT
-                weather_limit = Config.GUEST_WEATHER_RATE_LIMIT
-                
                 cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE ip = ? AND req_type = 'search' AND timestamp > ? AND user_id IS NULL
-                ''', (ip, month_ago))
-                search_count = cursor.fetchone()[0]
-                
-                cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE ip = ? AND req_type = 'weather' AND timestamp > ? AND user_id IS NULL
-                ''', (ip, month_ago))
-                weather_count = cursor.fetchone()[0]
-                
-                cursor.execute('''
-                SELECT COUNT(*) FROM requests 
-                WHERE ip = ? AND req_type = 'total' AND timestamp > ? AND user_id IS NULL
-                ''', (ip, month_ago))
-                total_count = cursor.fetchone()[0]
-        
-        next_reset = self._get_next_reset(ip, user_id)
+                SELECT req_type, ts / ? AS bucket, COUNT(*) FROM requests
+                WHERE ip = ? AND ts > ? AND user_id IS NULL GROUP BY req_type, bucket ORDER BY bucket
+                ''', (self.bucket_seconds, ip, since))
+            for req_type, bucket, count in cursor.fetchall():
+                state.counters.setdefault(req_type, SlidingWindowCounter()).add(bucket, count)
+            cursor.execute('SELECT reset_date, reset_ts FROM reset_dates WHERE ip = ?', (identity_key(ip, user_id),))
+            row = cursor.fetchone()
+            if row:
+                state.reset_start = _reset_from_row(row)
+        state.loaded_at = time.monotonic()
+        return state
+
+    def _fresh(self, key: str) -> Optional[_IdentityState]:
+        state = self._states.get(key)
+        if state is None or time.monotonic() - state.loaded_at > self.sync_seconds:
+            return None
+        self._states.move_to_end(key)
+        return state
+
+    def _evict(self):
+        # Least recently used first, and only identities with nothing queued:
+        # their counts would otherwise be missing from SQLite on reload
+        while len(self._states) > self.max_identities:
+            oldest = next(iter(self._states))
+            if oldest in self._dirty:
+                break
+            del self._states[oldest]
+
+    @contextlib.contextmanager
+    def _identity(self, ip: str, user_id: Optional[str]):
+        """Yields (key, state) for the identity with _lock held.
+
+        A missing or stale state is reloaded first: our own queued writes are
+        flushed and SQLite re-read under _flush_lock only, then the changes
+        made to the identity meanwhile are replayed onto the loaded state.
+        """
+        self._check_fork()
+        key = identity_key(ip, user_id)
+        with self._lock:
+            state = self._fresh(key)
+            if state is not None:
+                yield key, state
+                return
+        with self._flush_lock:
+            with self._lock:
+                # Another thread may have reloaded it while we waited
+                state = self._fresh(key)
+                if state is not None:
+                    yield key, state
+                    return
+            self._flush_locked()
+            state = self._load(ip, user_id)
+            with self._lock:
+                for change in self._dirty.get(key, ()):
+                    self._apply(state, change)
+                self._states[key] = state
+                self._states.move_to_end(key)
+                self._evict()
+                yield key, state
+
+    def _apply(self, state: _IdentityState, change: tuple):
+        kind = change[0]
+        if kind == "add":
+            state.counters.setdefault(change[1], SlidingWindowCounter()).add(change[2])
+        elif kind == "reset":
+            state.reset_start = change[1]
+        else:
+            state.counters.clear()
+
+    def _change(self, key: str, state: _IdentityState, change: tuple, sql: str, params: tuple):
+        self._apply(state, change)
+        self._dirty.setdefault(key, []).append(change)
+        self._enqueue(sql, params)
+
+    def prune(self, ip: str, req_type: str, user_id: Optional[str], cutoff: datetime):
+        # Expired buckets are dropped on read; old rows are pruned during flush
+        pass
+
+    def count(self, ip: str, req_type: str, user_id: Optional[str], since: datetime) -> int:
+        with self._identity(ip, user_id) as (_, state):
+            counter = state.counters.get(req_type)
+            if counter is None:
+                return 0
+            # Includes the bucket `since` falls in (see the class docstring)
+            return counter.count(self._bucket(since))
+
+    def record(self, ip: str, req_type: str, user_id: Optional[str], now: datetime):
+        with self._identity(ip, user_id) as (key, state):
+            now_str = now.strftime(TIMESTAMP_FORMAT)
+            self._change(key, state, ("add", req_type, self._bucket(now)),
+                         INSERT_REQUEST_SQL, (ip, req_type, now_str, _epoch(now), user_id))
+            if state.reset_start is None or now - state.reset_start >= WINDOW:
+                self._set_reset_locked(key, state, now)
+
+    def get_reset_start(self, ip: str, user_id: Optional[str]) -> Optional[datetime]:
+        with self._identity(ip, user_id) as (_, state):
+            return state.reset_start
+
+    def set_reset_start(self, ip: str, user_id: Optional[str], start: datetime):
+        with self._identity(ip, user_id) as (key, state):
+            self._set_reset_locked(key, state, start)
+
+    def _set_reset_locked(self, key: str, state: _IdentityState, start: datetime):
+        self._change(key, state, ("reset", start.replace(microsecond=0)),
+                     SAVE_RESET_SQL, (key, start.strftime(TIMESTAMP_FORMAT), _epoch(start)))
+
+    def clear(self, ip: str, user_id: Optional[str]):
+        with self._identity(ip, user_id) as (key, state):
+            if user_id:
+                self._change(key, state, ("clear",), 'DELETE FROM requests WHERE user_id = ?', (user_id,))
+            else:
+                self._change(key, state, ("clear",), 'DELETE FROM requests WHERE ip = ? AND user_id IS NULL', (ip,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"identities": len(self._states), "pending_writes": len(self._pending)}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_rate_limit_store():
+    # Shared by every RateLimiter in the process so counters stay consistent
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if Config.RATE_LIMIT_BACKEND == "sqlite":
+                    _store = SQLiteRateLimitStore()
+                else:
+                    _store = MemoryRateLimitStore()
+    return _store
+
+class BatchAccounting:
+    """Rate limit state shared by all sub-queries of one batch request.
+
+    The identity's count is read from the store once per request type, and
+    every allowed check reserves a slot right away, so sub-queries running
+    concurrently cannot all pass the check before any of them is recorded.
+    """
+
+    def __init__(self):
+        self._remaining: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def check(self, limiter: "RateLimiter", ip: str, req_type: str, user_id: Optional[str]) -> Tuple[bool, int]:
+        key = (identity_key(ip, user_id), req_type)
+        with self._lock:
+            if key not in self._remaining:
+                self._remaining[key] = limiter.check_store(ip, req_type, user_id)
+            allowed = self._remaining[key] > 0
+            if allowed:
+                self._remaining[key] -= 1
+            rate_limit_decisions.inc(req_type=req_type, outcome="allowed" if allowed else "denied")
+            return allowed, self._remaining[key]
+
+_batch: "contextvars.ContextVar[Optional[BatchAccounting]]" = contextvars.ContextVar("rate_limit_batch", default=None)
+
+@contextlib.contextmanager
+def batch_accounting():
+    """Makes every RateLimiter check in this context (and work it spawns) share one BatchAccounting."""
+    token = _batch.set(BatchAccounting())
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+
+class RateLimiter:
+    def __init__(self, store=None):
+        self.store = store or get_rate_limit_store()
+
+    def identity_key(self, ip: str, user_id: Optional[str]) -> str:
+        return identity_key(ip, user_id)
+
+    def _limit_for(self, req_type: str, user_id: Optional[str]) -> int:
+        if user_id:
+            return Config.USER_SEARCH_RATE_LIMIT if req_type == "search" else Config.USER_WEATHER_RATE_LIMIT
+        return Config.GUEST_SEARCH_RATE_LIMIT if req_type == "search" else Config.GUEST_WEATHER_RATE_LIMIT
+
+    def _get_next_reset(self, ip: str, user_id: Optional[str]) -> Optional[datetime]:
+        start = self.store.get_reset_start(ip, user_id)
+        return start + WINDOW if start else None
+
+    def check_store(self, ip: str, req_type: str, user_id: Optional[str] = None) -> int:
+        """Requests of req_type the identity has left in the current window."""
+        now = datetime.now()
+        self.store.prune(ip, req_type, user_id, now - WINDOW)
+        current_count = self.store.count(ip, req_type, user_id, now - WINDOW)
+        return self._limit_for(req_type, user_id) - current_count
+
+    def check_rate_limit(self, ip: str, req_type: str, user_id: Optional[str] = None) -> Tuple[bool, int]:
+        if req_type not in ["search", "weather"]:
+            return True, -1
+
+        batch = _batch.get()
+        if batch is not None:
+            return batch.check(self, ip, req_type, user_id)
+
+        remaining = self.check_store(ip, req_type, user_id)
+        allowed = remaining > 0
+        rate_limit_decisions.inc(req_type=req_type, outcome="allowed" if allowed else "denied")
+        return allowed, remaining
+
+    def add_request(self, ip: str, req_type: str, user_id: Optional[str] = None):
+        self.store.record(ip, req_type, user_id, datetime.now())
+
+    def get_limits(self, ip: str, user_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
         now_dt = datetime.now()
+        month_ago = now_dt - WINDOW
+        for req_type in ("search", "weather", "total"):
+            self.store.prune(ip, req_type, user_id, month_ago)
+
+        search_limit = self._limit_for("search", user_id)
+        weather_limit = self._limit_for("weather", user_id)
+        search_count = self.store.count(ip, "search", user_id, month_ago)
+        weather_count = self.store.count(ip, "weather", user_id, month_ago)
+
+        next_reset = self._get_next_reset(ip, user_id)
 
         if next_reset and now_dt >= next_reset:
-            with get_db_connection() as conn2:
-                cur2 = conn2.cursor()
-                if user_id:
-                    cur2.execute('DELETE FROM requests WHERE user_id = ?', (user_id,))
-                else:
-                    cur2.execute('DELETE FROM requests WHERE ip = ? AND user_id IS NULL', (ip,))
-                conn2.commit()
-            self._save_reset_date(ip, now_dt, user_id)
+            self.store.clear(ip, user_id)
+            self.store.set_reset_start(ip, user_id, now_dt)
             search_count = 0
             weather_count = 0
-            total_count = 0
             next_reset = self._get_next_reset(ip, user_id)
 
         # Initialize a reset window for new identities so UI shows a reset schedule
         if next_reset is None:
-            self._save_reset_date(ip, now_dt, user_id)
+            self.store.set_reset_start(ip, user_id, now_dt)
             next_reset = self._get_next_reset(ip, user_id)
 
         diff = next_reset - now_dt if next_reset else None
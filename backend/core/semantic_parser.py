@@ -1,37 +1,117 @@
 import re
 import json
-import requests
-import pytz
+import asyncio
 import math
 import random
 import threading
 import time
+from types import MappingProxyType
 from datetime import datetime, timedelta
-from dataclasses import dataclass
-from typing import List, Dict, Optional, Any, Set, Tuple
-from timezonefinder import TimezoneFinder
-from geopy.geocoders import Nominatim
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Any, Set, Tuple, Iterator, AsyncIterator
+from concurrent.futures import TimeoutError as FuturesTimeout, as_completed
 from flask_login import current_user
 from flask import url_for
 
 from backend.config import Config
 from backend.database import get_db_connection
-from backend.utils import get_client_ip, get_request_user_id
+from backend.utils import get_request_identity
 from backend.core.rate_limiter import RateLimiter
+from backend.core.timezones import timezone_name_at, get_zone
+from backend.integrations.geocoding import geocode, geocode_async, GeoPlace
+from backend.integrations.brave_search import search_web, search_web_async, SearchUnavailable
+from backend.integrations.openweather import get_current_weather, get_current_weather_async, get_cached_weather, WeatherUnavailable
 from backend.integrations.home_assistant import extract_ha_entities, execute_ha_tool, is_home_assistant_query
 from backend.security import decrypt_token
+from backend.core.query_analysis import QueryFeatures, analyze_query, CHITCHAT_GROUPS
+from backend.core import highlighter
+from backend.core.highlighter import HighlightSpan
+from backend.core import executor
+from backend.core import tracing
+
+TIME_LOCATION_RE = re.compile(r"\btime\s+(?:in|at|for)\s+([A-Za-z][A-Za-z\s-]+?)(?=$|[.?!,]|\s+(?:and|with|at|is|are|was|were))", re.IGNORECASE)
+PREP_LOCATION_RE = re.compile(r"\b(?:in|at|for)\s+([A-Za-z][A-Za-z\s-]+?)(?=$|[.?!,]|\s+(?:and|with|at|is|are|was|were))", re.IGNORECASE)
+STANDALONE_LOCATION_RE = re.compile(r"\b([A-Za-z][A-Za-z]+(?:\s+[A-Za-z]+)*)\b")
+SEARCH_PREFIX_RE = re.compile(r"^(search for|search|look up|find|tell me about|what is|who is|where is|when is)\s+")
+SPLIT_RE = re.compile(r'\s+and\s+then\s+|\s+then\s+|\s+and\s+', re.IGNORECASE)
+WORD_RE = re.compile(r"\w+")
 
 @dataclass
 class ThoughtStep:
     description: str
     result: Any
+    # Monotonic time of the previous step in the same context (or of the
+    # context's creation) and of this one, and the trace span it was logged in
+    start: float = 0.0
+    end: float = 0.0
+    span: Optional[int] = None
+
+class _StageTimer:
+    # Plain class rather than @contextmanager: it wraps every stage of every query
+    __slots__ = ("timings", "stage", "start", "trace", "opened")
+
+    def __init__(self, timings: Dict[str, float], stage: str, trace: tracing.Trace):
+        self.timings = timings
+        self.stage = stage
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.opened = self.trace.enter(self.stage)
+
+    def __exit__(self, *exc):
+        self.trace.exit(self.opened)
+        self.timings[self.stage] = self.timings.get(self.stage, 0.0) + time.perf_counter() - self.start
+
+@dataclass
+class ParseContext:
+    """Everything one parse produces along the way: thoughts, entities and stage timings.
+
+    A new context is created per request (and per segment of a split query and
+    per tool), so the parser itself can be shared by concurrent threads.
+    """
+    user_timezone: str = Config.DEFAULT_TIMEZONE
+    thoughts: List[ThoughtStep] = field(default_factory=list)
+    entities: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Contexts of segments and tools that ran on their own, in original order
+    children: List["ParseContext"] = field(default_factory=list)
+    # Shared with the children, so a query's stages, tools and upstream calls form one tree
+    trace: tracing.Trace = field(default_factory=tracing.Trace, repr=False)
+    last_step: float = field(default_factory=time.monotonic, repr=False)
+
+    def add_thought(self, description: str, result: Any):
+        now = time.monotonic()
+        self.thoughts.append(ThoughtStep(description, result, self.last_step, now, self.trace.current()))
+        self.last_step = now
+
+    def timed(self, stage: str) -> "_StageTimer":
+        return _StageTimer(self.timings, stage, self.trace)
+
+    def child(self) -> "ParseContext":
+        return ParseContext(user_timezone=self.user_timezone, trace=self.trace)
+
+    def merge(self, child: "ParseContext"):
+        self.thoughts.extend(child.thoughts)
+        for stage, seconds in child.timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        self.children.append(child)
+
+@dataclass
+class _SegmentPlan:
+    ctx: ParseContext
+    query: str
+    tools: List[str] = field(default_factory=list)
+    entities: Dict[str, Any] = field(default_factory=dict)
+    # Set when the segment is answered without running any tool (greetings)
+    immediate: Optional[str] = None
 
 class SemanticParser:
+    # Only read-only tables live on the instance; per-request state goes in ParseContext
     def __init__(self):
-        self.thoughts: List[ThoughtStep] = []
         self.rate_limiter = RateLimiter()
         
-        self.query_indicators = {
+        self.query_indicators = MappingProxyType({
             "what": "information_query",
             "how": "information_query",
             "when": "time_query",
@@ -70,23 +150,23 @@ class SemanticParser:
             "brighten": "command_query",
             "open": "command_query",
             "close": "command_query",
-        }
+        })
         
-        self.greeting_phrases = [
+        self.greeting_phrases = (
             "hello", "hi", "hey", "howdy", "g'day", "greetings", 
             "good morning", "good afternoon", "good evening", "good night"
-        ]
+        )
         
-        self.greeting_responses = [
+        self.greeting_responses = (
             "Hello to you too,",
             "Hi there,",
             "Hey,",
             "Nice to see you,",
             "Greetings,",
             "Hello,"
-        ]
+        )
         
-        self.known_tools = {
+        self.known_tools = MappingProxyType({
             "time": self._get_time,
             "weather": self._get_weather,
             "date": self._get_date,
@@ -98,97 +178,78 @@ class SemanticParser:
             "fun": self._fun_tool,
             "personal": self._personal_tool,
             "chitchat": self._chitchat_tool,
-        }
+        })
+        
+        # Tools with a native coroutine for process_async(); the rest run in a thread there
+        self.async_tools = MappingProxyType({
+            "time": self._get_time_async,
+            "weather": self._get_weather_async,
+            "search": self._web_search_tool_async,
+        })
         
-        self.entity_types = {
+        self.entity_types = MappingProxyType({
             "location": self._extract_location,
             "date": self._extract_date,
             "math_expression": self._extract_math_expression,
-        }
+        })
 
-        self.search_indicator_phrases = [
+        self.search_indicator_phrases = (
             "what is", "who is", "where is", "when is", "tell me about", "look up", "find", "search for"
-        ]
-    
-    def _reset_thoughts(self):
-        self.thoughts = []
+        )
     
-    def _add_thought(self, description: str, result: Any):
-        self.thoughts.append(ThoughtStep(description, result))
-    
-    def _extract_query_type(self, tokens: List[str]) -> str:
-        self._add_thought("Looking for query indicators", tokens[:3])
+    def _extract_query_type(self, ctx: ParseContext, features: QueryFeatures) -> str:
+        ctx.add_thought("Looking for query indicators", list(features.tokens[:3]))
         
         # Check greeting phrases first (supports multi-word greetings like "good evening")
-        ql = " ".join(tokens).lower()
+        ql = features.normalized
         for gp in self.greeting_phrases:
             if ql.startswith(gp) or f" {gp} " in ql:
-                self._add_thought(f"Matched greeting phrase '{gp}'", "greeting_query")
+                ctx.add_thought(f"Matched greeting phrase '{gp}'", "greeting_query")
                 return "greeting_query"
         
-        for i in range(min(3, len(tokens))):
-            word = tokens[i].lower().strip(".,?!")
+        for word in features.words[:3]:
             if word in self.query_indicators:
                 query_type = self.query_indicators[word]
-                self._add_thought(f"Found query indicator '{word}'", query_type)
+                ctx.add_thought(f"Found query indicator '{word}'", query_type)
                 return query_type
         
-        self._add_thought("No clear query indicator found", "unknown_query")
+        ctx.add_thought("No clear query indicator found", "unknown_query")
         return "unknown_query"
     
-    def _identify_tools(self, tokens: List[str]) -> Set[str]:
-        self._add_thought("Looking for tool references in query", None)
+    def _identify_tools(self, ctx: ParseContext, features: QueryFeatures) -> Set[str]:
+        ctx.add_thought("Looking for tool references in query", None)
         
         found_tools = set()
-        for token in tokens:
-            clean_token = token.lower().strip(".,?!")
+        for clean_token in features.words:
             if clean_token in self.known_tools:
-                self._add_thought(f"Found tool reference", clean_token)
+                ctx.add_thought(f"Found tool reference", clean_token)
                 found_tools.add(clean_token)
         
         if not found_tools:
-            self._add_thought("No specific tools referenced", None)
+            ctx.add_thought("No specific tools referenced", None)
         
-        lowered = " ".join(tokens).lower()
+        lowered = features.normalized
 
         # Check for Home Assistant
         if "homeassistant" not in found_tools:
             if is_home_assistant_query(lowered):
                 found_tools.add("homeassistant")
-                self._add_thought("Inferred Home Assistant tool from verbs/domains", None)
+                ctx.add_thought("Inferred Home Assistant tool from verbs/domains", None)
 
         # Check for fun keywords
-        fun_keywords = ["joke", "jokes", "destruct", "rainbow", "good morning", "good afternoon", "good evening", "good night", "goodnight"]
-        if any(re.search(rf"\b{re.escape(kw)}\b", lowered) for kw in fun_keywords):
+        if features.hits.any("fun"):
             found_tools.add("fun")
-            self._add_thought("Inferred fun tool from query keyword/phrase", None)
+            ctx.add_thought("Inferred fun tool from query keyword/phrase", None)
 
         # Check for personal user identity query keywords
-        personal_patterns = [
-            r"\bmy name\b",
-            r"\bwho am i\b",
-            r"\bwhat is my name\b",
-            r"\bdo you know my name\b",
-            r"\bdo you know who i am\b",
-            r"\bmy email\b",
-            r"\bwhat is my email\b",
-            r"\bam i logged in\b",
-            r"\bmy account\b"
-        ]
-        if any(re.search(pat, lowered) for pat in personal_patterns):
+        if features.hits.any("personal"):
             found_tools.add("personal")
-            self._add_thought("Inferred personal tool from user identity query", None)
+            ctx.add_thought("Inferred personal tool from user identity query", None)
 
         # Check for chatbot chitchat keywords
-        chitchat_patterns = [
-            r"\b(who are you|your name|what are you called|what is your name)\b",
-            r"\b(i'm neubot, nice to meet you|i'm neubot, nice to meet you!|my name is neubot|i'm neubot|im neubot|neubot is my name)\b",
-            r"\b(how are you|how's it going|how are you doing)\b",
-            r"\b(what can you do|what are your abilities|help me|what tools do you have)\b"
-        ]
-        if any(re.search(pat, lowered) for pat in chitchat_patterns):
+        if features.is_chitchat:
             found_tools.add("chitchat")
-            self._add_thought("Inferred chitchat tool from general query", None)
+            ctx.add_thought("Inferred chitchat tool from general query", None)
 
         # Logic to determine if we should fallback to search
         # If we already have specific tools (weather, time, calculator, etc),
@@ -202,7 +263,7 @@ class SemanticParser:
         for phrase in explicit_search_phrases:
             if lowered.startswith(phrase) or f" {phrase} " in lowered:
                 explicit_search = True
-                self._add_thought("Explicit search requested", phrase)
+                ctx.add_thought("Explicit search requested", phrase)
                 break
         
         if not explicit_search:
@@ -218,141 +279,144 @@ class SemanticParser:
             # Only add search if NO other tools found
             if not found_tools and "search" not in found_tools:
                 found_tools.add("search")
-                self._add_thought("Inferred search tool from generic phrase (no other tools found)", generic_search_intent)
+                ctx.add_thought("Inferred search tool from generic phrase (no other tools found)", generic_search_intent)
                 
         return found_tools
 
-    def _extract_entities(self, query: str, tools: Set[str]) -> Dict[str, Any]:
-        self._add_thought("Extracting entities based on identified tools", list(tools))
+    def _extract_entities(self, ctx: ParseContext, features: QueryFeatures, tools: Set[str]) -> Dict[str, Any]:
+        ctx.add_thought("Extracting entities based on identified tools", list(tools))
         
         entities = {}
         
         for tool in tools:
             if tool == "weather" or tool == "time":
-                location = self._extract_location(query)
+                location = self._extract_location(ctx, features)
                 if location:
                     entities["location"] = location
             
             if tool in ["time", "date", "day"]:
-                date_spec = self._extract_date(query)
+                date_spec = self._extract_date(ctx, features)
                 if date_spec:
                     entities["date"] = date_spec
             
             if tool == "search":
-                search_query = self._extract_search_query(query)
+                search_query = self._extract_search_query(ctx, features)
                 if search_query:
                     entities["search_query"] = search_query
 
             if tool == "homeassistant":
-                ha_entities = extract_ha_entities(query, self._add_thought)
+                ha_entities = extract_ha_entities(features.text, ctx.add_thought)
                 entities.update(ha_entities)
-                entities.setdefault("search_query", query)
+                entities.setdefault("search_query", features.text)
         
-        entities.setdefault("search_query", query)
-        self._add_thought("Extracted entities", entities)
+        entities.setdefault("search_query", features.text)
+        ctx.add_thought("Extracted entities", entities)
         return entities
     
-    def _extract_location(self, query: str) -> Optional[str]:
-        self._add_thought("Looking for location in query", None)
+    def _extract_location(self, ctx: ParseContext, features: QueryFeatures) -> Optional[str]:
+        ctx.add_thought("Looking for location in query", None)
         
-        title_query = query.title()
+        title_query = features.titled
         
-        time_location_pattern = r"\btime\s+(?:in|at|for)\s+([A-Za-z][A-Za-z\s-]+?)(?=$|[.?!,]|\s+(?:and|with|at|is|are|was|were))"
-        time_match = re.search(time_location_pattern, title_query, re.IGNORECASE)
+        time_match = TIME_LOCATION_RE.search(title_query)
         if time_match:
             location = time_match.group(1).strip()
-            self._add_thought("Found location in time query", location)
+            ctx.add_thought("Found location in time query", location)
             return location
         
-        prep_pattern = r"\b(?:in|at|for)\s+([A-Za-z][A-Za-z\s-]+?)(?=$|[.?!,]|\s+(?:and|with|at|is|are|was|were))"
-        prep_match = re.search(prep_pattern, title_query, re.IGNORECASE)
+        prep_match = PREP_LOCATION_RE.search(title_query)
         if prep_match:
             location = prep_match.group(1).strip()
-            self._add_thought("Found location after preposition", location)
+            ctx.add_thought("Found location after preposition", location)
             return location
         
-        location_pattern = r"\b([A-Za-z][A-Za-z]+(?:\s+[A-Za-z]+)*)\b"
-        location_matches = re.finditer(location_pattern, title_query)
-        
-        for match in location_matches:
+        for match in STANDALONE_LOCATION_RE.finditer(title_query):
             location = match.group(1).strip()
             if not any(word.lower() in location.lower() for word in 
                       ["what", "where", "when", "how", "why", "the", "weather", "time"]):
-                self._add_thought("Found standalone location", location)
+                ctx.add_thought("Found standalone location", location)
                 return location
         
-        self._add_thought("No location found", None)
+        ctx.add_thought("No location found", None)
         return None
     
-    def _extract_date(self, query: str) -> Optional[str]:
-        self._add_thought("Looking for date specification in query", None)
+    def _extract_date(self, ctx: ParseContext, features: QueryFeatures) -> Optional[str]:
+        ctx.add_thought("Looking for date specification in query", None)
         
-        today_match = re.search(r"today|now", query, re.IGNORECASE)
-        if today_match:
-            self._add_thought("Found reference to current date/time", "today")
+        if "today" in features.lower or "now" in features.lower:
+            ctx.add_thought("Found reference to current date/time", "today")
             return "today"
             
-        tomorrow_match = re.search(r"tomorrow", query, re.IGNORECASE)
-        if tomorrow_match:
-            self._add_thought("Found reference to tomorrow", "tomorrow")
+        if "tomorrow" in features.lower:
+            ctx.add_thought("Found reference to tomorrow", "tomorrow")
             return "tomorrow"
                 
-        self._add_thought("No specific date reference found", "today") 
+        ctx.add_thought("No specific date reference found", "today") 
         return "today"
     
-    def _get_time(self, entities: Dict[str, Any]) -> str:
+    def _get_time(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
         location = entities.get("location")
         user_timezone = entities.get("user_timezone", Config.DEFAULT_TIMEZONE)
         
-        self._add_thought("Executing time tool", {"location": location, "user_timezone": user_timezone})
+        ctx.add_thought("Executing time tool", {"location": location, "user_timezone": user_timezone})
         
         try:
-            if location:
-                geolocator = Nominatim(user_agent="neubot")
-                location_data = geolocator.geocode(location)
-                
-                if not location_data:
-                    self._add_thought("Could not geocode location", location)
-                    return f"I couldn't find the location '{location}'. Please check the spelling or try a different location."
-                
-                lat, lon = location_data.latitude, location_data.longitude
-                tf = TimezoneFinder()
-                timezone_str = tf.timezone_at(lng=lon, lat=lat)
-                
-                if not timezone_str:
-                    self._add_thought("Couldn't determine timezone for location", location)
-                    return f"I found {location}, but couldn't determine its timezone."
-                
-                timezone = pytz.timezone(timezone_str)
-                current_time = datetime.now(timezone)
-                time_str = current_time.strftime("%I:%M %p")
-                return f"The current time in {location} is {time_str} ({timezone_str})."
-                
-            else:
-                try:
-                    timezone = pytz.timezone(user_timezone)
-                    current_time = datetime.now(timezone)
-                    time_str = current_time.strftime("%I:%M %p")
-                    return f"The current time is {time_str} ({user_timezone})."
-                except:
-                    current_time = datetime.now()
-                    time_str = current_time.strftime("%I:%M %p")
-                    return f"The current time is {time_str}."
+            return self._time_response(ctx, location, user_timezone, geocode(location) if location else None)
+        except Exception as e:
+            ctx.add_thought("Error getting time", str(e))
+            return f"Sorry, there was an error retrieving the time information."
+    
+    async def _get_time_async(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
+        location = entities.get("location")
+        user_timezone = entities.get("user_timezone", Config.DEFAULT_TIMEZONE)
+        
+        ctx.add_thought("Executing time tool", {"location": location, "user_timezone": user_timezone})
         
+        try:
+            return self._time_response(ctx, location, user_timezone, await geocode_async(location) if location else None)
         except Exception as e:
-            self._add_thought("Error getting time", str(e))
+            ctx.add_thought("Error getting time", str(e))
             return f"Sorry, there was an error retrieving the time information."
     
-    def _get_date(self, entities: Dict[str, Any]) -> str:
-        self._add_thought("Executing date tool", None)
+    def _time_response(self, ctx: ParseContext, location: Optional[str], user_timezone: str, location_data: Optional[GeoPlace]) -> str:
+        if location:
+            if not location_data:
+                ctx.add_thought("Could not geocode location", location)
+                return f"I couldn't find the location '{location}'. Please check the spelling or try a different location."
+            
+            lat, lon = location_data.latitude, location_data.longitude
+            timezone_str = timezone_name_at(lat, lon)
+            
+            if not timezone_str:
+                ctx.add_thought("Couldn't determine timezone for location", location)
+                return f"I found {location}, but couldn't determine its timezone."
+            
+            timezone = get_zone(timezone_str)
+            current_time = datetime.now(timezone)
+            time_str = current_time.strftime("%I:%M %p")
+            return f"The current time in {location} is {time_str} ({timezone_str})."
+            
+        else:
+            try:
+                timezone = get_zone(user_timezone)
+                current_time = datetime.now(timezone)
+                time_str = current_time.strftime("%I:%M %p")
+                return f"The current time is {time_str} ({user_timezone})."
+            except:
+                current_time = datetime.now()
+                time_str = current_time.strftime("%I:%M %p")
+                return f"The current time is {time_str}."
+    
+    def _get_date(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
+        ctx.add_thought("Executing date tool", None)
         current_date = datetime.now().strftime("%A, %B %d, %Y")
         return f"Today's date is {current_date}."
     
-    def _get_day(self, entities: Dict[str, Any]) -> str:
-        self._add_thought("Executing day tool", None)
+    def _get_day(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
+        ctx.add_thought("Executing day tool", None)
 
         date_spec = entities.get("date", "today")
-        self._add_thought("Date specification", date_spec)
+        ctx.add_thought("Date specification", date_spec)
         
         if date_spec == "tomorrow":
             tomorrow = datetime.now() + timedelta(days=1)
@@ -362,135 +426,138 @@ class SemanticParser:
             current_day = datetime.now().strftime("%A")
         return f"Today is {current_day}."
     
-    def _get_weather(self, entities: Dict[str, Any]) -> str:
+    def _get_weather(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
         location = entities.get("location", "unknown location")
-        self._add_thought("Executing weather tool", {"location": location})
+        ctx.add_thought("Executing weather tool", {"location": location})
         
         if location == "unknown location":
             return "I need a location to check the weather. Please specify a city or place."
         
-        ip = get_client_ip()
-        user_id = get_request_user_id()
-        allowed, remaining = self.rate_limiter.check_rate_limit(ip, "weather", user_id)
-        if not allowed:
-            return f"Sorry, I can't get weather information because you've exceeded your monthly limit."
+        quota = None
+        if Config.WEATHER_CACHE_HITS_COUNT:
+            # Every lookup is charged, so refuse before geocoding
+            refusal, quota = self._weather_quota()
+            if refusal:
+                return refusal
         
+        location_data = None
         try:
-            geolocator = Nominatim(user_agent="neubot")
-            location_data = geolocator.geocode(location)
-            
-            if not location_data:
-                self._add_thought("Could not geocode location", location)
-                return f"I couldn't find the location '{location}'. Please check the spelling or try a different location."
-            
-            capitalized_location = location_data.address.split(',')[0].strip()
-            
-            lat, lon = location_data.latitude, location_data.longitude
-            self._add_thought("Geocoded location", {"lat": lat, "lon": lon})
-            
-            weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={Config.OPENWEATHER_API_KEY}&units=metric"
-            response = requests.get(weather_url)
-            
-            if response.status_code != 200:
-                self._add_thought("OpenWeatherMap API error", {"status": response.status_code})
-                return f"Sorry, I couldn't retrieve the weather information for {capitalized_location} right now."
-            
-            weather_data = response.json()
-            temp_c = weather_data["main"]["temp"]
-            # convert real units to wrong units
-            temp_f = (temp_c * 9/5) + 32
-            condition = weather_data["weather"][0]["description"]
-            humidity = weather_data["main"]["humidity"]
-            
-            self._add_thought("Weather data retrieved", {"temp_c": temp_c, "temp_f": temp_f, "condition": condition})
-            
-            if response.status_code == 200:
-                self.rate_limiter.add_request(ip, "weather", user_id)
-            
-            text_response = f"The weather in {capitalized_location} is {condition} with a temperature of {temp_c:.1f}°C/{temp_f:.1f}°F, and {humidity}% humidity."
-            
-            weather_widget = {
-                "type": "weather",
-                "data": {
-                    "location": capitalized_location,
-                    "condition": condition,
-                    "temperature": {
-                        "celsius": temp_c,
-                        "fahrenheit": temp_f
-                    },
-                    "humidity": humidity,
-                    "description": text_response
-                }
-            }
-            
-            return text_response, [weather_widget]
-        
+            location_data = geocode(location)
+            refusal, quota = self._weather_location(ctx, location, location_data, quota)
+            if refusal:
+                return refusal
+            weather_data, from_cache = get_current_weather(location_data.latitude, location_data.longitude)
+            return self._weather_response(ctx, location_data, weather_data, from_cache, quota)
+        except WeatherUnavailable as e:
+            ctx.add_thought("OpenWeatherMap API error", {"status": e.status})
+            return f"Sorry, I couldn't retrieve the weather information for {self._place_name(location_data)} right now."
         except Exception as e:
-            self._add_thought("Error getting weather", str(e))
+            ctx.add_thought("Error getting weather", str(e))
             return f"Sorry, there was an error retrieving weather information for {location}.", []
     
-    def _highlight_query(self, query: str, location: Optional[str] = None) -> str:
-        # Use single pass replacement to avoid nesting tags
-        query_indicators = ["what", "what's", "how", "when", "where", "who", "why", "is", "can", "tell", "show", "calculate", "compute", "solve"]
-        tools = ["time", "weather", "date", "day", "calculator", "calc"]
-        math_operators = ["plus", "minus", "times", "divided by", "multiplied by"]
-        symbols = ["+", "-", "*", "/"]
-
-        # Combine all patterns into one regex, sorted by length descending to match longest first
-        all_patterns = []
-        for p in query_indicators: all_patterns.append((p, "query-indicator"))
-        for p in tools: all_patterns.append((p, "tool-reference"))
-        for p in math_operators: all_patterns.append((p, "math-operator"))
-        for p in symbols: all_patterns.append((p, "math-operator"))
+    async def _get_weather_async(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
+        location = entities.get("location", "unknown location")
+        ctx.add_thought("Executing weather tool", {"location": location})
         
-        if location:
-            all_patterns.append((location, "entity-location"))
-            
-        # Sort by length of pattern (descending)
-        all_patterns.sort(key=lambda x: len(x[0]), reverse=True)
-        
-        # Build the master regex: (pattern1|pattern2|...)
-        # We handle word boundaries conditionally based on content
-        
-        pattern_map = {p.lower(): cls for p, cls in all_patterns}
-        pattern_parts = []
-        
-        for p, _ in all_patterns:
-            escaped = re.escape(p)
-            # If it starts with a word character, require word boundary at start
-            # If it ends with a word character, require word boundary at end
-            # This handles "weather" -> \bweather\b
-            # And "+" -> \+ (no boundary)
-            # And "Winston-Salem" -> \bWinston\-Salem\b
-            
-            part = escaped
-            if p[0].isalnum():
-                part = r'\b' + part
-            if p[-1].isalnum():
-                part = part + r'\b'
-            
-            pattern_parts.append(part)
-
-        master_pattern = '(' + '|'.join(pattern_parts) + ')'
+        if location == "unknown location":
+            return "I need a location to check the weather. Please specify a city or place."
         
-        def replace_match(match):
-            word = match.group(0)
-            # keys in pattern_map are lowercased
-            cls = pattern_map.get(word.lower())
-            if cls:
-                return f'<span class="{cls}">{word}</span>'
-            return word
-            
+        quota = None
+        if Config.WEATHER_CACHE_HITS_COUNT:
+            # Every lookup is charged, so refuse before geocoding. The rate
+            # limiter may read and write SQLite, so it stays off the loop
+            refusal, quota = await asyncio.to_thread(self._weather_quota)
+            if refusal:
+                return refusal
+        
+        location_data = None
         try:
-            result = re.sub(master_pattern, replace_match, query, flags=re.IGNORECASE)
-        except Exception:
-            # Fallback if regex fails
-            return query
-            
-        return result
+            location_data = await geocode_async(location)
+            refusal, quota = await asyncio.to_thread(self._weather_location, ctx, location, location_data, quota)
+            if refusal:
+                return refusal
+            weather_data, from_cache = await get_current_weather_async(location_data.latitude, location_data.longitude)
+            return await asyncio.to_thread(self._weather_response, ctx, location_data, weather_data, from_cache, quota)
+        except WeatherUnavailable as e:
+            ctx.add_thought("OpenWeatherMap API error", {"status": e.status})
+            return f"Sorry, I couldn't retrieve the weather information for {self._place_name(location_data)} right now."
+        except Exception as e:
+            ctx.add_thought("Error getting weather", str(e))
+            return f"Sorry, there was an error retrieving weather information for {location}.", []
+    
+    def _place_name(self, location_data: GeoPlace) -> str:
+        return location_data.address.split(',')[0].strip()
+    
+    def _weather_quota(self) -> Tuple[Optional[str], Optional[Tuple[str, Optional[str]]]]:
+        """Returns (refusal, quota): the over-the-limit response, or the (ip, user_id) to charge once the weather is in."""
+        identity = get_request_identity()
+        ip, user_id = identity.ip, identity.user_id
+        allowed, remaining = self.rate_limiter.check_rate_limit(ip, "weather", user_id)
+        if not allowed:
+            return f"Sorry, I can't get weather information because you've exceeded your monthly limit.", None
+        return None, (ip, user_id)
+    
+    def _weather_location(self, ctx: ParseContext, location: str, location_data: Optional[GeoPlace],
+                          quota: Optional[Tuple[str, Optional[str]]]) -> Tuple[Optional[str], Optional[Tuple[str, Optional[str]]]]:
+        """_weather_quota() once geocoded: ends the tool if the location was not found.
 
-    def _extract_math_expression(self, query: str) -> Optional[str]:
-        self._add_thought("Looking for math expression", None)
+        Unless WEATHER_CACHE_HITS_COUNT (where the quota was checked up front),
+        cache hits are free, so the limit is only checked on a cache miss.
+        """
+        if not location_data:
+            ctx.add_thought("Could not geocode location", location)
+            return f"I couldn't find the location '{location}'. Please check the spelling or try a different location.", None
+        
+        lat, lon = location_data.latitude, location_data.longitude
+        ctx.add_thought("Geocoded location", {"lat": lat, "lon": lon})
+        
+        if Config.WEATHER_CACHE_HITS_COUNT:
+            return None, quota
+        if get_cached_weather(lat, lon) is not None:
+            return None, None
+        return self._weather_quota()
+    
+    def _weather_response(self, ctx: ParseContext, location_data: GeoPlace, weather_data: Dict[str, Any], from_cache: bool,
+                          quota: Optional[Tuple[str, Optional[str]]]) -> Tuple[str, List[Dict[str, Any]]]:
+        lat, lon = location_data.latitude, location_data.longitude
+        if from_cache:
+            ctx.add_thought("Using cached weather observation", {"lat": lat, "lon": lon})
+        
+        capitalized_location = self._place_name(location_data)
+        temp_c = weather_data["main"]["temp"]
+        # convert real units to wrong units
+        temp_f = (temp_c * 9/5) + 32
+        condition = weather_data["weather"][0]["description"]
+        humidity = weather_data["main"]["humidity"]
+        
+        ctx.add_thought("Weather data retrieved", {"temp_c": temp_c, "temp_f": temp_f, "condition": condition})
+        
+        if quota:
+            self.rate_limiter.add_request(quota[0], "weather", quota[1])
+        
+        text_response = f"The weather in {capitalized_location} is {condition} with a temperature of {temp_c:.1f}°C/{temp_f:.1f}°F, and {humidity}% humidity."
+        
+        weather_widget = {
+            "type": "weather",
+            "data": {
+                "location": capitalized_location,
+                "condition": condition,
+                "temperature": {
+                    "celsius": temp_c,
+                    "fahrenheit": temp_f
+                },
+                "humidity": humidity,
+                "description": text_response
+            }
+        }
+        
+        return text_response, [weather_widget]
+    
+    def _highlight_query(self, query: str, location: Optional[str] = None) -> Tuple[str, List[HighlightSpan]]:
+        return highlighter.highlight(query, location)
+
+    def _extract_math_expression(self, ctx: ParseContext, query: str) -> Optional[str]:
+        ctx.add_thought("Looking for math expression", None)
         word_map = {
             r"\bplus\b": "+",
             r"\bminus\b": "-",
@@ -504,118 +571,130 @@ class SemanticParser:
             normalized = re.sub(pattern, repl, normalized)
         match = re.findall(r"[0-9()+\-*/. ]", normalized)
         if not match:
-            self._add_thought("No math characters found", None)
+            ctx.add_thought("No math characters found", None)
             return None
         candidate = "".join(match)
         candidate = re.sub(r"\s+", " ", candidate).strip()
         if not re.search(r"[+\-*/]", candidate):
-            self._add_thought("Expression lacks operators", candidate)
+            ctx.add_thought("Expression lacks operators", candidate)
             return None
         if re.search(r"[^0-9()+\-*/. ]", candidate):
-            self._add_thought("Disallowed characters in expression", candidate)
+            ctx.add_thought("Disallowed characters in expression", candidate)
             return None
-        self._add_thought("Extracted math expression", candidate)
+        ctx.add_thought("Extracted math expression", candidate)
         return candidate
 
-    def _extract_search_query(self, query: str) -> Optional[str]:
-        self._add_thought("Extracting search query", None)
-        q = query.strip()
+    def _extract_search_query(self, ctx: ParseContext, features: QueryFeatures) -> Optional[str]:
+        ctx.add_thought("Extracting search query", None)
+        q = features.text.strip()
         lowered = q.lower()
         lowered = lowered.strip("?!. ")
-        patterns = [
-            r"^(search for|search|look up|find|tell me about|what is|who is|where is|when is)\s+",
-        ]
-        for pattern in patterns:
-            match = re.match(pattern, lowered)
-            if match:
-                return q[match.end():].strip()
+        match = SEARCH_PREFIX_RE.match(lowered)
+        if match:
+            return q[match.end():].strip()
         return q
 
-    def _web_search_tool(self, entities: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+    def _web_search_tool(self, ctx: ParseContext, entities: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
         query = entities.get("search_query", "")
-        self._add_thought("Executing web search", {"query": query})
+        ctx.add_thought("Executing web search", {"query": query})
         
         if not query:
             return "What would you like me to search for?", []
         
-        ip = get_client_ip()
-        user_id = get_request_user_id()
-        allowed, remaining = self.rate_limiter.check_rate_limit(ip, "search", user_id)
-        if not allowed:
+        quota = self._search_quota()
+        if not quota:
             return "Sorry, I can't search the web because you've exceeded your monthly limit.", []
         
         try:
-            headers = {
-                "Accept": "application/json",
-                "Accept-Encoding": "gzip",
-                "X-Subscription-Token": Config.BRAVE_SEARCH_TOKEN
-            }
-            
-            url = "https://api.search.brave.com/res/v1/web/search"
-            params = {
-                "q": query,
-                "count": 5,
-                "spellcheck": True
-            }
-            
-            response = requests.get(url, headers=headers, params=params)
-            
-            if response.status_code != 200:
-                self._add_thought("Brave Search API error", {"status": response.status_code})
-                return "I encountered an error while searching the web.", []
-            
-            data = response.json()
-            
-            search_items = []
-            if "web" in data and "results" in data["web"]:
-                web_results = data["web"]["results"]
-                self._add_thought("Retrieved search results", len(web_results))
-                
-                for result in web_results:
-                    search_items.append({
-                        "title": result.get("title", ""),
-                        "url": result.get("url", ""),
-                        "description": result.get("description", ""),
-                        "favicon": result.get("favicon", "")
-                    })
-            
-            count = len(search_items)
-            results_data = {
-                "query": query,
-                "spellcheck": data.get("spellcheck", None),
-                "results": search_items,
-                "meta": {
-                    "total": count,
-                    "header": f"Here's what I found on the web for \"{query}\""
-                }
-            }
+            data, from_cache = search_web(query)
+            return self._search_response(ctx, query, data, from_cache, quota)
+        except SearchUnavailable as e:
+            ctx.add_thought("Brave Search API error", {"status": e.status})
+            return "I encountered an error while searching the web.", []
+        except Exception as e:
+            ctx.add_thought("Error performing web search", str(e))
+            return "An error occurred while searching.", []
 
-            if response.status_code == 200 and count > 0:
-                self.rate_limiter.add_request(ip, "search", user_id)
-            
-            if count > 0:
-                text_response = f"I found {count} results for \"{query}\". The top result is {search_items[0]['title']}."
-            else:
-                text_response = f"I didn't find any results for \"{query}\"."
-            
-            widget = {
-                "type": "search_results",
-                "data": results_data
-            }
-            
-            return text_response, [widget]
-            
+    async def _web_search_tool_async(self, ctx: ParseContext, entities: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        query = entities.get("search_query", "")
+        ctx.add_thought("Executing web search", {"query": query})
+        
+        if not query:
+            return "What would you like me to search for?", []
+        
+        # The rate limiter may read and write SQLite, so it stays off the loop
+        quota = await asyncio.to_thread(self._search_quota)
+        if not quota:
+            return "Sorry, I can't search the web because you've exceeded your monthly limit.", []
+        
+        try:
+            data, from_cache = await search_web_async(query)
+            return await asyncio.to_thread(self._search_response, ctx, query, data, from_cache, quota)
+        except SearchUnavailable as e:
+            ctx.add_thought("Brave Search API error", {"status": e.status})
+            return "I encountered an error while searching the web.", []
         except Exception as e:
-            self._add_thought("Error performing web search", str(e))
+            ctx.add_thought("Error performing web search", str(e))
             return "An error occurred while searching.", []
 
-    def _home_assistant_tool(self, entities: Dict[str, Any]) -> str:
-        return execute_ha_tool(entities, self._add_thought)
+    def _search_quota(self) -> Optional[Tuple[str, Optional[str]]]:
+        """The (ip, user_id) to charge for a search, or None when the limit is used up."""
+        identity = get_request_identity()
+        ip, user_id = identity.ip, identity.user_id
+        allowed, remaining = self.rate_limiter.check_rate_limit(ip, "search", user_id)
+        return (ip, user_id) if allowed else None
+
+    def _search_response(self, ctx: ParseContext, query: str, data: Dict[str, Any], from_cache: bool,
+                         quota: Tuple[str, Optional[str]]) -> Tuple[str, List[Dict[str, Any]]]:
+        if from_cache:
+            ctx.add_thought("Using cached search results", query)
+        
+        search_items = []
+        if "web" in data and "results" in data["web"]:
+            web_results = data["web"]["results"]
+            ctx.add_thought("Retrieved search results", len(web_results))
+            
+            for result in web_results:
+                search_items.append({
+                    "title": result.get("title", ""),
+                    "url": result.get("url", ""),
+                    "description": result.get("description", ""),
+                    "favicon": result.get("favicon", "")
+                })
+        
+        count = len(search_items)
+        results_data = {
+            "query": query,
+            "spellcheck": data.get("spellcheck", None),
+            "results": search_items,
+            "meta": {
+                "total": count,
+                "header": f"Here's what I found on the web for \"{query}\""
+            }
+        }
+
+        if count > 0:
+            self.rate_limiter.add_request(quota[0], "search", quota[1])
+        
+        if count > 0:
+            text_response = f"I found {count} results for \"{query}\". The top result is {search_items[0]['title']}."
+        else:
+            text_response = f"I didn't find any results for \"{query}\"."
+        
+        widget = {
+            "type": "search_results",
+            "data": results_data
+        }
+        
+        return text_response, [widget]
+
+    def _home_assistant_tool(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
+        return execute_ha_tool(entities, ctx.add_thought)
 
-    def _calculator_tool(self, entities: Dict[str, Any]) -> str:
-        self._add_thought("Executing calculator tool", None)
+    def _calculator_tool(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
+        ctx.add_thought("Executing calculator tool", None)
         
-        math_expression = self._extract_math_expression(entities.get("search_query", ""))
+        math_expression = self._extract_math_expression(ctx, entities.get("search_query", ""))
         if not math_expression:
             return "I need a mathematical expression to calculate. Try something like '5 + 3' or '10 * 4'."
         
@@ -627,19 +706,19 @@ class SemanticParser:
             expression = re.sub(r'\bdivided by\b', '/', expression)
             cleaned_expr = re.sub(r'[^0-9+\-*/().\s]', '', expression)
             cleaned_expr = cleaned_expr.strip()
-            self._add_thought("Evaluating expression", cleaned_expr)
+            ctx.add_thought("Evaluating expression", cleaned_expr)
             result = eval(cleaned_expr, {"__builtins__": {}})
-            self._add_thought("Calculation result", result)
+            ctx.add_thought("Calculation result", result)
             if isinstance(result, int):
                 return f"The result of {math_expression} is {result}."
             else:
                 return f"The result of {math_expression} is {result:.4f}."
         except Exception as e:
-            self._add_thought("Calculation error", str(e))
+            ctx.add_thought("Calculation error", str(e))
             return "There was an error evaluating that expression. Please check the syntax."
 
-    def _fun_tool(self, entities: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
-        self._add_thought("Executing fun tool", None)
+    def _fun_tool(self, ctx: ParseContext, entities: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        ctx.add_thought("Executing fun tool", None)
         raw_query = entities.get("search_query") or ""
         if not raw_query:
             raw_query = ""
@@ -695,48 +774,49 @@ class SemanticParser:
 
         return base_text, widgets
 
-    def _personal_tool(self, entities: Dict[str, Any]) -> str:
+    def _personal_tool(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
         from flask_login import current_user
         if current_user.is_authenticated and hasattr(current_user, 'name') and current_user.name:
             response = f"Your name is {current_user.name}."
             if hasattr(current_user, 'email') and current_user.email:
                 response += f" You are logged in with the email {current_user.email}."
-            self._add_thought("Answered personal query about user identity", response)
+            ctx.add_thought("Answered personal query about user identity", response)
             return response
         else:
             response = "I don't know your name yet. Please sign in so I can get to know you!"
-            self._add_thought("Personal query failed - user not authenticated", response)
+            ctx.add_thought("Personal query failed - user not authenticated", response)
             return response
 
-    def _chitchat_tool(self, entities: Dict[str, Any]) -> str:
+    def _chitchat_tool(self, ctx: ParseContext, entities: Dict[str, Any]) -> str:
         raw_query = entities.get("search_query") or ""
-        ql = raw_query.lower()
+        hits = analyze_query(raw_query).hits
         
         bot_responses = {
-            r"\b(who are you|your name|what are you called|what is your name)\b": [
+            "chitchat_identity": [
                 "I'm neubot, nice to meet you!",
                 "I'm neubot, what's your name?",
                 "People call me neubot!"
             ],
-            r"\b(i'm neubot, nice to meet you|i'm neubot, nice to meet you!|my name is neubot|i'm neubot|im neubot|neubot is my name)\b": [
+            "chitchat_name": [
                 "Wow, really? Me too!",
                 "Are you sure? I thought I was neubot!",
                 "What a coincidence, that's my name too!",
                 "That line sounds familiar!"
             ],
-            r"\b(how are you|how's it going|how are you doing)\b": [
+            "chitchat_wellbeing": [
                 "I'm doing great, thank you! How can I help you today?",
                 "Doing fantastic! How are you?",
                 "All systems nominal and ready to help!"
             ],
-            r"\b(what can you do|what are your abilities|help me|what tools do you have)\b": [
+            "chitchat_abilities": [
                 "I can check the weather, tell you the time, control your smart home, search the web and so much more! What can I help you with?"
             ]
         }
-        for pat, resp in bot_responses.items():
-            if re.search(pat, ql):
+        for group in CHITCHAT_GROUPS:
+            resp = bot_responses[group]
+            if hits.any(group):
                 selected_resp = random.choice(resp) if isinstance(resp, list) else resp
-                self._add_thought("Answered chatbot identity/chitchat query", selected_resp)
+                ctx.add_thought("Answered chatbot identity/chitchat query", selected_resp)
                 return selected_resp
         return "I'm here to help you! How can I assist you?"
 
@@ -744,8 +824,7 @@ class SemanticParser:
         if ' and ' not in query.lower() and ' then ' not in query.lower():
             return []
             
-        pattern = r'\s+and\s+then\s+|\s+then\s+|\s+and\s+'
-        segments = re.split(pattern, query, flags=re.IGNORECASE)
+        segments = SPLIT_RE.split(query)
         if len(segments) < 2:
             return []
             
@@ -761,7 +840,7 @@ class SemanticParser:
             seg = seg.strip()
             if not seg:
                 continue
-            words = set(re.findall(r"\w+", seg.lower()))
+            words = set(WORD_RE.findall(seg.lower()))
             if words & action_indicators:
                 valid_segments.append(seg)
                 
@@ -769,77 +848,314 @@ class SemanticParser:
             return valid_segments
         return []
 
-    def process(self, query: str, user_timezone: str = Config.DEFAULT_TIMEZONE) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str]:
-        segments = self._should_split_query(query)
+    def process(self, query: str, user_timezone: str = Config.DEFAULT_TIMEZONE,
+                ctx: Optional[ParseContext] = None) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str, List[Dict[str, Any]]]:
+        """Returns (response, widgets, thoughts, highlighted HTML, highlight spans).
+
+        Span offsets always refer to the original query, also for split queries.
+        Pass a ParseContext to get at the entities and stage timings afterwards.
+        """
+        ctx = ctx or ParseContext(user_timezone=user_timezone)
+        with ctx.timed("total"):
+            segments, plans = self._plan(ctx, query)
+            result = self._assemble(ctx, query, segments, plans, self._execute(plans))
+        tracing.export(ctx.trace, query, result[2])
+        return result
+
+    async def process_async(self, query: str, user_timezone: str = Config.DEFAULT_TIMEZONE,
+                            ctx: Optional[ParseContext] = None) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str, List[Dict[str, Any]]]:
+        """process() for an event loop: upstream calls are awaited instead of holding a thread.
+
+        Must run inside a request context, like process(). Tools without an
+        async implementation run in a thread with that context copied.
+        """
+        ctx = ctx or ParseContext(user_timezone=user_timezone)
+        with ctx.timed("total"):
+            segments, plans = self._plan(ctx, query)
+            result = self._assemble(ctx, query, segments, plans, await self._execute_async(plans))
+        tracing.export(ctx.trace, query, result[2])
+        return result
+
+    def process_stream(self, query: str, user_timezone: str = Config.DEFAULT_TIMEZONE,
+                       ctx: Optional[ParseContext] = None) -> Iterator[Tuple[str, Any]]:
+        """process() as a stream of (event, data) pairs for progressive display.
+
+        Events, in order: "query" (highlighted query and the number of tools
+        to run, as soon as it is planned), the planning "thought"s, then per tool in completion order
+        its "thought"s, "widget"s and a "partial" response, and finally "done"
+        carrying exactly what process() returns.
+        """
+        ctx = ctx or ParseContext(user_timezone=user_timezone)
+        with ctx.timed("total"):
+            segments, plans = self._plan(ctx, query)
+            yield from self._planned_events(query, segments, plans)
+            jobs = self._jobs(plans)
+            results = {}
+            for index, result in self._iter_jobs(jobs):
+                results[index] = result
+                yield from self._tool_events(plans, jobs[index], result)
+            done = self._assemble(ctx, query, segments, plans, self._finish_all(plans, jobs, results))
+        tracing.export(ctx.trace, query, done[2])
+        yield "done", done
+
+    async def process_stream_async(self, query: str, user_timezone: str = Config.DEFAULT_TIMEZONE,
+                                   ctx: Optional[ParseContext] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """process_stream() for an event loop."""
+        ctx = ctx or ParseContext(user_timezone=user_timezone)
+        with ctx.timed("total"):
+            segments, plans = self._plan(ctx, query)
+            for event in self._planned_events(query, segments, plans):
+                yield event
+            jobs = self._jobs(plans)
+            results = {}
+            async for index, result in self._iter_jobs_async(jobs):
+                results[index] = result
+                for event in self._tool_events(plans, jobs[index], result):
+                    yield event
+            done = self._assemble(ctx, query, segments, plans, self._finish_all(plans, jobs, results))
+        tracing.export(ctx.trace, query, done[2])
+        yield "done", done
+
+    def _planned_events(self, query: str, segments: List[str], plans: List[_SegmentPlan]) -> Iterator[Tuple[str, Any]]:
         if segments:
-            responses = []
-            all_widgets = []
-            all_thoughts = []
-            highlighted_parts = []
-            
-            for seg in segments:
-                if query.rstrip().endswith('?') and not seg.rstrip().endswith('?'):
-                    if seg == segments[-1]:
-                        seg += '?'
-                
-                resp, widgets, thoughts, highlighted = self.process_single(seg, user_timezone)
-                responses.append(resp)
-                all_widgets.extend(widgets)
-                all_thoughts.extend(thoughts)
-                highlighted_parts.append(highlighted)
-                
-            combined_response = " and ".join([r.strip().rstrip('.') for r in responses if r.strip()])
-            if combined_response:
-                combined_response = combined_response[0].upper() + combined_response[1:] + "."
-                
-            combined_highlighted = " <span class=\"conjunction\">and</span> ".join(highlighted_parts)
-            return combined_response, all_widgets, all_thoughts, combined_highlighted
+            per_segment = [self._highlight_query(plan.query, plan.entities.get("location")) for plan in plans]
+            highlighted = " <span class=\"conjunction\">and</span> ".join(html for html, _ in per_segment)
+            spans = highlighter.segment_spans(query, segments, [spans for _, spans in per_segment])
+        else:
+            highlighted, spans = self._highlight_query(query, plans[0].entities.get("location"))
+        yield "query", {"highlightedQuery": highlighted, "highlightSpans": [s.to_dict() for s in spans],
+                        "tools": sum(len(plan.tools) for plan in plans)}
+        for plan in plans:
+            for thought in plan.ctx.thoughts:
+                yield "thought", thought.__dict__
+
+    def _tool_events(self, plans: List[_SegmentPlan], job: Tuple[_SegmentPlan, str, ParseContext], result: Any) -> Iterator[Tuple[str, Any]]:
+        plan, tool, tool_ctx = job
+        for thought in tool_ctx.thoughts:
+            yield "thought", thought.__dict__
+        text, widgets = result if isinstance(result, tuple) and len(result) == 2 else (str(result), [])
+        for widget in widgets or []:
+            yield "widget", widget
+        segment = next(n for n, p in enumerate(plans) if p is plan)
+        yield "partial", {"segment": segment, "tool": tool, "response": text}
+
+    def process_batch(self, items: List[Tuple[str, str]]) -> List[Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str, List[Dict[str, Any]]]]:
+        """process() for many (query, timezone) items at once, results in item order.
+
+        Identical items are parsed once. The tools of all items share one run
+        on the executor, so a batch never waits on work queued behind itself;
+        as they queue on PARSER_MAX_WORKERS threads, the deadline grows by
+        TOOL_TIMEOUT_SECONDS per round of the pool.
+        """
+        unique = list(dict.fromkeys(items))
+        planned = []
+        for query, user_timezone in unique:
+            ctx = ParseContext(user_timezone=user_timezone)
+            planned.append((ctx, query) + self._plan(ctx, query))
+        jobs = self._jobs([plan for _, _, _, plans in planned for plan in plans])
+        results = dict(self._iter_jobs(jobs))
+        return self._assemble_batch(items, unique, planned, jobs, results)
+
+    async def process_batch_async(self, items: List[Tuple[str, str]]) -> List[Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str, List[Dict[str, Any]]]]:
+        """process_batch() for an event loop; every tool of every item is a task under one deadline."""
+        unique = list(dict.fromkeys(items))
+        planned = []
+        for query, user_timezone in unique:
+            ctx = ParseContext(user_timezone=user_timezone)
+            planned.append((ctx, query) + self._plan(ctx, query))
+        jobs = self._jobs([plan for _, _, _, plans in planned for plan in plans])
+        results = {index: result async for index, result in self._iter_jobs_async(jobs)}
+        return self._assemble_batch(items, unique, planned, jobs, results)
+
+    def _assemble_batch(self, items, unique, planned, jobs, results):
+        # jobs is flat across items; hand each item its own slice, re-indexed
+        outputs = {}
+        offset = 0
+        for key, (ctx, query, segments, plans) in zip(unique, planned):
+            count = sum(len(plan.tools) for plan in plans)
+            item_results = {index - offset: result for index, result in results.items() if offset <= index < offset + count}
+            finished = self._finish_all(plans, jobs[offset:offset + count], item_results)
+            outputs[key] = self._assemble(ctx, query, segments, plans, finished)
+            tracing.export(ctx.trace, query, outputs[key][2])
+            offset += count
+        return [outputs[item] for item in items]
+
+    def _plan(self, ctx: ParseContext, query: str) -> Tuple[List[str], List[_SegmentPlan]]:
+        """Returns (segments, plans); segments is empty unless the query was split."""
+        segments = self._should_split_query(query)
+        if not segments:
+            return [], [self._plan_segment(ctx, query)]
+        plans = []
+        for seg in segments:
+            if query.rstrip().endswith('?') and not seg.rstrip().endswith('?'):
+                if seg == segments[-1]:
+                    seg += '?'
+            plans.append(self._plan_segment(ctx.child(), seg))
+        return segments, plans
+
+    def _assemble(self, ctx: ParseContext, query: str, segments: List[str], plans: List[_SegmentPlan],
+                  outputs: List[Tuple[str, List[Dict[str, Any]], str, List[HighlightSpan]]]) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str, List[Dict[str, Any]]]:
+        if not segments:
+            response, widgets, highlighted, spans = outputs[0]
+            return response, widgets, [t.__dict__ for t in ctx.thoughts], highlighted, [s.to_dict() for s in spans]
+
+        for plan in plans:
+            ctx.merge(plan.ctx)
+
+        responses = [out[0] for out in outputs]
+        all_widgets = [w for out in outputs for w in out[1]]
+        combined_response = " and ".join([r.strip().rstrip('.') for r in responses if r.strip()])
+        if combined_response:
+            combined_response = combined_response[0].upper() + combined_response[1:] + "."
             
-        return self.process_single(query, user_timezone)
+        combined_highlighted = " <span class=\"conjunction\">and</span> ".join(out[2] for out in outputs)
+        combined_spans = highlighter.segment_spans(query, segments, [out[3] for out in outputs])
+        return combined_response, all_widgets, [t.__dict__ for t in ctx.thoughts], combined_highlighted, [s.to_dict() for s in combined_spans]
+
+    def process_single(self, query: str, user_timezone: str = Config.DEFAULT_TIMEZONE) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str, List[Dict[str, Any]]]:
+        ctx = ParseContext(user_timezone=user_timezone)
+        response, widgets, highlighted, spans = self._execute([self._plan_segment(ctx, query)])[0]
+        return response, widgets, [t.__dict__ for t in ctx.thoughts], highlighted, [s.to_dict() for s in spans]
 
-    def process_single(self, query: str, user_timezone: str = Config.DEFAULT_TIMEZONE) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]], str]:
-        self._reset_thoughts()
-        self._add_thought("Received query", query)
+    def _plan_segment(self, ctx: ParseContext, query: str) -> _SegmentPlan:
+        ctx.add_thought("Received query", query)
+        plan = _SegmentPlan(ctx=ctx, query=query)
         
-        ql = query.lower()
-        tokens = re.findall(r"[\w']+|[.,!?;]", query)
+        with ctx.timed("analyze"):
+            features = analyze_query(query)
         
-        query_type = self._extract_query_type(tokens)
-        tools = self._identify_tools(tokens)
+        with ctx.timed("identify"):
+            query_type = self._extract_query_type(ctx, features)
+            tools = self._identify_tools(ctx, features)
         
         if not tools:
             if query_type == "greeting_query":
-                response = f"{random.choice(self.greeting_responses)} how can I help you today?"
-                self._add_thought("Generated greeting response", response)
-                return response, [], [t.__dict__ for t in self.thoughts], self._highlight_query(query)
+                plan.immediate = f"{random.choice(self.greeting_responses)} how can I help you today?"
+                ctx.add_thought("Generated greeting response", plan.immediate)
+                return plan
             elif query_type == "information_query":
                 tools.add("search")
-                self._add_thought("Defaulting to search for information query", None)
+                ctx.add_thought("Defaulting to search for information query", None)
             elif query_type == "calculator_query":
                 tools.add("calculator")
-                self._add_thought("Defaulting to calculator", None)
+                ctx.add_thought("Defaulting to calculator", None)
             else:
                 tools.add("search")
-                self._add_thought("Defaulting to search", None)
-        
-        entities = self._extract_entities(query, tools)
-        entities["user_timezone"] = user_timezone
+                ctx.add_thought("Defaulting to search", None)
         
+        with ctx.timed("extract"):
+            entities = self._extract_entities(ctx, features, tools)
+        entities["user_timezone"] = ctx.user_timezone
+        ctx.entities = plan.entities = entities
+        plan.tools = [tool for tool in tools if tool in self.known_tools]
+        return plan
+
+    def _call_tool(self, ctx: ParseContext, tool: str, entities: Dict[str, Any]) -> Any:
+        with ctx.timed(f"tool:{tool}"), executor.tool_seconds.time(tool=tool):
+            return self.known_tools[tool](ctx, entities)
+
+    def _jobs(self, plans: List[_SegmentPlan]) -> List[Tuple[_SegmentPlan, str, ParseContext]]:
+        # One job per tool per segment, each logging into its own child context
+        return [(plan, tool, plan.ctx.child()) for plan in plans for tool in plan.tools]
+
+    def _iter_jobs(self, jobs: List[Tuple[_SegmentPlan, str, ParseContext]],
+                   timeout: Optional[float] = None) -> Iterator[Tuple[int, Any]]:
+        """Yields (job index, result) as tools finish, running them on the executor.
+
+        Jobs still running after timeout (by default TOOL_TIMEOUT_SECONDS per
+        round of PARSER_MAX_WORKERS threads), counted from submission, are
+        abandoned and never yielded; those not started yet are cancelled.
+        """
+        if not jobs:
+            return
+        if timeout is None:
+            timeout = Config.TOOL_TIMEOUT_SECONDS * math.ceil(len(jobs) / max(1, Config.PARSER_MAX_WORKERS))
+        deadline = time.monotonic() + timeout
+        futures = {executor.submit(self._call_tool, tool_ctx, tool, plan.entities): index
+                   for index, (plan, tool, tool_ctx) in enumerate(jobs)}
+        try:
+            for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                yield futures[future], future.result()
+        except FuturesTimeout:
+            pass
+        finally:
+            for future in futures:
+                future.cancel()
+
+    async def _call_tool_async(self, ctx: ParseContext, tool: str, entities: Dict[str, Any]) -> Any:
+        tool_fn = self.async_tools.get(tool)
+        if tool_fn is None:
+            # to_thread copies contextvars, so the request context goes along
+            return await asyncio.to_thread(self._call_tool, ctx, tool, entities)
+        with ctx.timed(f"tool:{tool}"), executor.tool_seconds.time(tool=tool):
+            return await tool_fn(ctx, entities)
+
+    async def _iter_jobs_async(self, jobs: List[Tuple[_SegmentPlan, str, ParseContext]]) -> AsyncIterator[Tuple[int, Any]]:
+        """_iter_jobs() on the event loop: every tool is a task, all under one deadline."""
+        tasks = {asyncio.ensure_future(self._call_tool_async(tool_ctx, tool, plan.entities)): index
+                 for index, (plan, tool, tool_ctx) in enumerate(jobs)}
+        deadline = time.monotonic() + Config.TOOL_TIMEOUT_SECONDS
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    yield tasks[task], task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _execute(self, plans: List[_SegmentPlan]) -> List[Tuple[str, List[Dict[str, Any]], str, List[HighlightSpan]]]:
+        """Runs the tools of all plans and finishes each plan in order.
+
+        Tool contexts are merged back in the original tool order. A tool still
+        running after TOOL_TIMEOUT_SECONDS is answered with an apology.
+        """
+        jobs = self._jobs(plans)
+        return self._finish_all(plans, jobs, dict(self._iter_jobs(jobs)))
+
+    async def _execute_async(self, plans: List[_SegmentPlan]) -> List[Tuple[str, List[Dict[str, Any]], str, List[HighlightSpan]]]:
+        jobs = self._jobs(plans)
+        return self._finish_all(plans, jobs, {index: result async for index, result in self._iter_jobs_async(jobs)})
+
+    def _finish_all(self, plans: List[_SegmentPlan], jobs: List[Tuple[_SegmentPlan, str, ParseContext]],
+                    results: Dict[int, Any]) -> List[Tuple[str, List[Dict[str, Any]], str, List[HighlightSpan]]]:
+        by_plan: Dict[int, List[Tuple[str, ParseContext, bool, Any]]] = {}
+        for index, (plan, tool, tool_ctx) in enumerate(jobs):
+            done = index in results
+            if not done:
+                executor.tool_timeouts.inc(tool=tool)
+            by_plan.setdefault(id(plan), []).append((tool, tool_ctx, done, results.get(index)))
+        return [self._finish_segment(plan, by_plan.get(id(plan), [])) for plan in plans]
+
+    def _finish_segment(self, plan: _SegmentPlan, tool_results: List[Tuple[str, ParseContext, bool, Any]]) -> Tuple[str, List[Dict[str, Any]], str, List[HighlightSpan]]:
+        ctx = plan.ctx
+        if plan.immediate is not None:
+            with ctx.timed("highlight"):
+                return (plan.immediate, []) + self._highlight_query(plan.query)
+
         responses = []
         all_widgets = []
         
-        for tool in tools:
-            if tool in self.known_tools:
-                result = self.known_tools[tool](entities)
-                if isinstance(result, tuple) and len(result) == 2:
-                    text, widgets = result
-                    responses.append(text)
-                    if widgets:
-                        all_widgets.extend(widgets)
-                else:
-                    responses.append(str(result))
+        for tool, tool_ctx, done, result in tool_results:
+            if not done:
+                ctx.add_thought("Tool timed out", tool)
+                responses.append("Sorry, that took too long to answer.")
+                continue
+            ctx.merge(tool_ctx)
+            if isinstance(result, tuple) and len(result) == 2:
+                text, widgets = result
+                responses.append(text)
+                if widgets:
+                    all_widgets.extend(widgets)
+            else:
+                responses.append(str(result))
         
         final_response = " ".join(responses)
-        self._add_thought("Final response generated", final_response)
+        ctx.add_thought("Final response generated", final_response)
         
-        return final_response, all_widgets, [t.__dict__ for t in self.thoughts], self._highlight_query(query, entities.get("location"))
+        with ctx.timed("highlight"):
+            return (final_response, all_widgets) + self._highlight_query(plan.query, plan.entities.get("location"))
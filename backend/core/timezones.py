@@ -0,0 +1,45 @@
+import functools
+import threading
+from typing import Optional
+import pytz
+from timezonefinder import TimezoneFinder
+from backend.config import Config
+
+# One TimezoneFinder per process: constructing it loads the polygon data from
+# disk, so it is built once (ideally at worker boot via warm_up) and shared.
+# timezonefinder does not support concurrent use of one instance, so lookups
+# take _lookup_lock; after the memo below warms up they are rare.
+_finder = None
+_finder_lock = threading.Lock()
+_lookup_lock = threading.Lock()
+
+def get_timezone_finder() -> TimezoneFinder:
+    global _finder
+    if _finder is None:
+        with _finder_lock:
+            if _finder is None:
+                try:
+                    _finder = TimezoneFinder(in_memory=Config.TIMEZONE_FINDER_IN_MEMORY)
+                except TypeError:
+                    # Older timezonefinder releases have no in_memory switch
+                    _finder = TimezoneFinder()
+    return _finder
+
+@functools.lru_cache(maxsize=4096)
+def _timezone_at(lat: float, lon: float) -> Optional[str]:
+    finder = get_timezone_finder()
+    with _lookup_lock:
+        return finder.timezone_at(lng=lon, lat=lat)
+
+def timezone_name_at(lat: float, lon: float) -> Optional[str]:
+    # ~11m precision is far finer than any timezone border we care about and
+    # lets geocoded places share memo entries
+    return _timezone_at(round(lat, 4), round(lon, 4))
+
+@functools.lru_cache(maxsize=512)
+def get_zone(name: str):
+    return pytz.timezone(name)
+
+def warm_up():
+    get_timezone_finder()
+    get_zone(Config.DEFAULT_TIMEZONE)
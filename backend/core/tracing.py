@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Lightweight spans for one parse: its stages, tools and the upstream calls
+# they make. The open span lives in a context variable, so work handed to the
+# executor, to_thread or an asyncio task nests under whatever started it.
+# Outside a trace, span() costs one context variable lookup.
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    end: Optional[float] = None
+    # Index of the enclosing span in Trace.spans
+    parent: Optional[int] = None
+    bytes: Optional[int] = None
+
+class Trace:
+    """Spans of one query, with monotonic timestamps; rendered relative to `origin`."""
+
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.spans: List[Span] = []
+        # Tools append from executor threads
+        self._lock = threading.Lock()
+
+    def enter(self, name: str) -> Tuple[int, contextvars.Token]:
+        active = _active.get()
+        parent = active[1] if active is not None and active[0] is self else None
+        with self._lock:
+            self.spans.append(Span(name, time.monotonic(), parent=parent))
+            index = len(self.spans) - 1
+        return index, _active.set((self, index))
+
+    def exit(self, opened: Tuple[int, contextvars.Token]):
+        index, token = opened
+        self.spans[index].end = time.monotonic()
+        try:
+            _active.reset(token)
+        except ValueError:
+            # Closed from another context (e.g. a stream generator finalised elsewhere)
+            pass
+
+    def current(self) -> Optional[int]:
+        active = _active.get()
+        return active[1] if active is not None and active[0] is self else None
+
+    def offset_ms(self, timestamp: Optional[float]) -> Optional[float]:
+        return None if timestamp is None else round((timestamp - self.origin) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = []
+        for span in self.spans:
+            spans.append({
+                "name": span.name,
+                "parent": span.parent,
+                "startMs": self.offset_ms(span.start),
+                "durationMs": None if span.end is None else round((span.end - span.start) * 1000, 3),
+                "bytes": span.bytes,
+            })
+        return {"spans": spans}
+
+_active: "contextvars.ContextVar[Optional[Tuple[Trace, int]]]" = contextvars.ContextVar("active_span", default=None)
+
+class _SpanScope:
+    # Plain class rather than @contextmanager: it wraps every outbound call
+    __slots__ = ("name", "trace", "opened")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace = None
+        self.opened = None
+
+    def __enter__(self) -> "_SpanScope":
+        active = _active.get()
+        if active is not None:
+            self.trace = active[0]
+            self.opened = self.trace.enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            self.trace.exit(self.opened)
+
+    def add_bytes(self, count: int):
+        if self.trace is not None:
+            span = self.trace.spans[self.opened[0]]
+            span.bytes = (span.bytes or 0) + count
+
+def span(name: str) -> _SpanScope:
+    """A span nested under the open one, or nothing when no trace is being recorded."""
+    return _SpanScope(name)
+
+def thought_timings(trace: Trace, thought: Dict[str, Any]) -> Dict[str, Any]:
+    """Timing fields for one serialised ThoughtStep; bytes is the size of its result as text."""
+    result = thought["result"]
+    return {
+        "startMs": trace.offset_ms(thought["start"]),
+        "durationMs": round((thought["end"] - thought["start"]) * 1000, 3),
+        "span": thought["span"],
+        "bytes": len(str(result).encode()) if result is not None else 0,
+    }
+
+_export_lock = threading.Lock()
+_export_failed = False
+
+def export(trace: Trace, query: str, thoughts: List[Dict[str, Any]]):
+    """Appends the trace as one JSON line to TRACE_EXPORT_FILE, if it took at least TRACE_EXPORT_MIN_MS.
+
+    Thoughts go in without their results, which may hold user data.
+    """
+    global _export_failed
+    if not Config.TRACE_EXPORT_FILE:
+        return
+    total_ms = round((max((s.end for s in trace.spans if s.end is not None), default=trace.origin) - trace.origin) * 1000, 3)
+    if total_ms < Config.TRACE_EXPORT_MIN_MS:
+        return
+    record = {
+        "time": time.time(),
+        "pid": os.getpid(),
+        "query": query,
+        "totalMs": total_ms,
+        "thoughts": [{"description": t["description"], **thought_timings(trace, t)} for t in thoughts],
+        **trace.to_dict(),
+    }
+    line = (json.dumps(record, default=str) + "\n").encode()
+    try:
+        # One unbuffered write(2) per line on an O_APPEND fd, so lines from
+        # workers sharing the file are not split up and interleaved
+        with _export_lock:
+            fd = os.open(Config.TRACE_EXPORT_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+    except OSError as e:
+        # The answer is already computed; losing its trace must not fail the request
+        if not _export_failed:
+            logger.warning("Cannot export trace to %s: %s", Config.TRACE_EXPORT_FILE, e)
+            _export_failed = True
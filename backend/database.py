@@ -1,119 +1,317 @@
+import os
+import queue
 import sqlite3
+import threading
+import time
 import contextlib
+import contextvars
+from typing import Dict, Any, List, Optional
 from backend.config import Config
+from backend import metrics
+
+db_queries = metrics.counter("neubot_db_queries_total", "SQL statements executed")
+db_connections_opened = metrics.counter("neubot_db_connections_opened_total", "SQLite connections opened")
+db_checkouts = metrics.counter("neubot_db_checkouts_total", "Connections checked out of the pool")
+db_wait_seconds = metrics.histogram("neubot_db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+                                    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5))
+
+db_queries_per_request = metrics.histogram("neubot_db_queries_per_request", "SQL statements executed per HTTP request",
+                                           buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+
+# A context variable rather than a thread local: tools running on the
+# executor or on an event loop inherit the request's counter
+_request_queries: "contextvars.ContextVar[Optional[List[int]]]" = contextvars.ContextVar("request_queries", default=None)
+
+def _count_query(statement: str):
+    db_queries.inc()
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+def reset_request_query_count():
+    _request_queries.set([0])
+
+def get_request_query_count() -> int:
+    counter = _request_queries.get()
+    return counter[0] if counter is not None else 0
+
+def record_request_query_count(endpoint: str) -> int:
+    count = get_request_query_count()
+    db_queries_per_request.observe(count, endpoint=endpoint)
+    return count
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        Config.DB_FILE,
+        timeout=Config.DB_BUSY_TIMEOUT_MS / 1000.0,
+        cached_statements=Config.DB_STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT_MS)}")
+    conn.set_trace_callback(_count_query)
+    db_connections_opened.inc()
+    return conn
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared by the threads of one worker."""
+
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.db_file = Config.DB_FILE
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return _open_connection()
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            # Pool exhausted (e.g. nested use); hand out an overflow connection
+            # rather than deadlocking. It is closed on release.
+            with self._lock:
+                self._created += 1
+            conn = _open_connection()
+        db_wait_seconds.observe(time.perf_counter() - start)
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            # Match the old connect-per-call behaviour: uncommitted work is discarded
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        if self.pid != os.getpid() or self._idle.qsize() >= self.size:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize()}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    pool = _pool
+    # Connections must not cross a fork, and tests may point DB_FILE elsewhere
+    if pool is None or pool.pid != os.getpid() or pool.db_file != Config.DB_FILE:
+        with _pool_lock:
+            pool = _pool
+            if pool is None or pool.pid != os.getpid() or pool.db_file != Config.DB_FILE:
+                if pool is not None and pool.pid == os.getpid():
+                    pool.close()
+                pool = ConnectionPool(Config.DB_POOL_SIZE, Config.DB_POOL_TIMEOUT)
+                _pool = pool
+    return pool
+
+def close_db_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
 
 @contextlib.contextmanager
 def get_db_connection():
-    conn = sqlite3.connect(Config.DB_FILE)
-    conn.row_factory = sqlite3.Row
+    pool = get_pool()
+    conn = pool.acquire()
+    db_checkouts.inc()
     try:
         yield conn
     finally:
-        conn.close()
+        pool.release(conn)
+
+def get_db_stats() -> Dict[str, Any]:
+    stats = get_pool().stats()
+    stats.update({
+        "queries": db_queries.value(),
+        "connections_opened": db_connections_opened.value(),
+        "checkouts": db_checkouts.value(),
+        "waits": db_wait_seconds.count(),
+        "wait_seconds": db_wait_seconds.total(),
+    })
+    return stats
+
+def _add_column_if_missing(cursor, table: str, column: str, definition: str):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _migration_initial_schema(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        profile_pic TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS home_assistant_links (
+        user_id TEXT PRIMARY KEY,
+        base_url TEXT NOT NULL,
+        access_token TEXT NOT NULL,
+        refresh_token TEXT,
+        expires_at INTEGER,
+        created_at DATETIME NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    # Databases created before token refresh support lack these columns
+    _add_column_if_missing(cursor, "home_assistant_links", "refresh_token", "TEXT")
+    _add_column_if_missing(cursor, "home_assistant_links", "expires_at", "INTEGER")
+
+    cursor.execute("DROP TABLE IF EXISTS app_tokens")
+    cursor.execute('''
+    CREATE TABLE app_tokens (
+        token TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        created_at DATETIME NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+
+    # Settings table (per user). If not logged in, frontend stores locally.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS show_settings (
+        user_id TEXT PRIMARY KEY,
+        hour_format TEXT DEFAULT '12',
+        default_room TEXT,
+        bg_follow_room INTEGER DEFAULT 0,
+        updated_at DATETIME NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    _add_column_if_missing(cursor, "show_settings", "temp_unit", "TEXT DEFAULT 'c'")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS app_auth_requests (
+        state TEXT PRIMARY KEY,
+        callback_url TEXT NOT NULL
+    )
+    ''')
+
+    # Rate Limiter Tables
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ip TEXT NOT NULL,
+        req_type TEXT NOT NULL,
+        timestamp DATETIME NOT NULL,
+        user_id TEXT
+    )
+    ''')
+    _add_column_if_missing(cursor, "requests", "user_id", "TEXT")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS reset_dates (
+        ip TEXT PRIMARY KEY,
+        reset_date DATETIME NOT NULL
+    )
+    ''')
+
+def _migration_rate_limit_epochs(cursor):
+    # Integer epoch columns avoid re-parsing the local-time strings on every
+    # check. The 'utc' modifier converts those local times to real epochs.
+    _add_column_if_missing(cursor, "requests", "ts", "INTEGER")
+    cursor.execute("UPDATE requests SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) WHERE ts IS NULL")
+    _add_column_if_missing(cursor, "reset_dates", "reset_ts", "INTEGER")
+    cursor.execute("UPDATE reset_dates SET reset_ts = CAST(strftime('%s', reset_date, 'utc') AS INTEGER) WHERE reset_ts IS NULL")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_requests_user_type_ts ON requests (user_id, req_type, ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_requests_guest_type_ts ON requests (ip, req_type, ts) WHERE user_id IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_requests_ts ON requests (ts)")
+
+def _migration_geocode_cache(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS geocode_cache (
+        query TEXT PRIMARY KEY,
+        address TEXT,
+        latitude REAL,
+        longitude REAL,
+        found INTEGER NOT NULL,
+        expires_at INTEGER NOT NULL
+    )
+    ''')
+
+def _migration_ha_contexts(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ha_contexts (
+        identity TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at INTEGER NOT NULL,
+        expires_at INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ha_contexts_expires ON ha_contexts (expires_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ha_contexts_updated ON ha_contexts (updated_at)")
+
+# Append-only: each entry runs once, in order, and bumps PRAGMA user_version
+MIGRATIONS = [
+    (1, "initial schema", _migration_initial_schema),
+    (2, "rate limit epoch columns and indexes", _migration_rate_limit_epochs),
+    (3, "geocode cache", _migration_geocode_cache),
+    (4, "home assistant conversational context", _migration_ha_contexts),
+]
+
+def get_schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, target: int = None) -> int:
+    target = target if target is not None else MIGRATIONS[-1][0]
+    for version, _name, migration in MIGRATIONS:
+        if version > target:
+            break
+        # BEGIN IMMEDIATE serialises workers that boot at the same time; the
+        # version is re-read under the lock so each migration applies once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
 
 def init_db():
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            provider TEXT NOT NULL,
-            profile_pic TEXT
-        )
-        ''')
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS home_assistant_links (
-            user_id TEXT PRIMARY KEY,
-            base_url TEXT NOT NULL,
-            access_token TEXT NOT NULL,
-            refresh_token TEXT,
-            expires_at INTEGER,
-            created_at DATETIME NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-
-
-        
-        # Migration checks
-        cursor.execute("PRAGMA table_info(home_assistant_links)")
-        ha_cols = [row[1] for row in cursor.fetchall()]
-        if 'refresh_token' not in ha_cols:
-            try:
-                cursor.execute('ALTER TABLE home_assistant_links ADD COLUMN refresh_token TEXT')
-            except Exception:
-                pass
-        if 'expires_at' not in ha_cols:
-            try:
-                cursor.execute('ALTER TABLE home_assistant_links ADD COLUMN expires_at INTEGER')
-            except Exception:
-                pass
-                
-        cursor.execute("DROP TABLE IF EXISTS app_tokens")
-        cursor.execute('''
-        CREATE TABLE app_tokens (
-            token TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            created_at DATETIME NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-
-        # Settings table (per user). If not logged in, frontend stores locally.
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS show_settings (
-            user_id TEXT PRIMARY KEY,
-            hour_format TEXT DEFAULT '12',
-            default_room TEXT,
-            bg_follow_room INTEGER DEFAULT 0,
-            updated_at DATETIME NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS app_auth_requests (
-            state TEXT PRIMARY KEY,
-            callback_url TEXT NOT NULL
-        )
-        ''')
-        
-        # Rate Limiter Tables
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ip TEXT NOT NULL,
-            req_type TEXT NOT NULL,
-            timestamp DATETIME NOT NULL,
-            user_id TEXT
-        )
-        ''')
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reset_dates (
-            ip TEXT PRIMARY KEY,
-            reset_date DATETIME NOT NULL
-        )
-        ''')
-        
-        # Migration for requests table
-        cursor.execute("PRAGMA table_info(requests)")
-        columns = cursor.fetchall()
-        column_names = [column[1] for column in columns]
-        
-        if 'user_id' not in column_names:
-            cursor.execute('ALTER TABLE requests ADD COLUMN user_id TEXT')
-            
-        # Migration for show_settings table
-        cursor.execute("PRAGMA table_info(show_settings)")
-        columns = cursor.fetchall()
-        column_names = [column[1] for column in columns]
-        
-        if 'temp_unit' not in column_names:
-            cursor.execute("ALTER TABLE show_settings ADD COLUMN temp_unit TEXT DEFAULT 'c'")
-        
-        conn.commit()
+        migrate(conn)
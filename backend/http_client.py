@@ -0,0 +1,334 @@
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Tuple, Callable, Any, Mapping
+from urllib.parse import urlsplit
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from backend.config import Config
+from backend import metrics
+from backend.core import tracing
+
+# Every outbound call goes through here so it gets a pooled keep-alive
+# session, a timeout, bounded retries and a circuit breaker per upstream.
+# request_async() is the aiohttp twin used by the async query pipeline; it
+# shares the policies, breakers, retry budgets and metrics.
+
+upstream_seconds = metrics.histogram("neubot_upstream_request_seconds", "Outbound request latency by upstream and outcome")
+upstream_errors = metrics.counter("neubot_upstream_errors_total", "Outbound request failures by upstream and kind")
+upstream_retries = metrics.counter("neubot_upstream_retries_total", "Outbound requests retried by upstream")
+
+@dataclass(frozen=True)
+class UpstreamPolicy:
+    timeout: float = 10.0
+    retries: int = 0
+    backoff: float = 0.2
+    retry_statuses: Tuple[int, ...] = (429, 502, 503, 504)
+    retry_methods: Tuple[str, ...] = ("GET", "HEAD")
+    breaker_threshold: int = 5
+    breaker_cooldown: float = 30.0
+
+POLICIES: Dict[str, UpstreamPolicy] = {
+    "openweather": UpstreamPolicy(timeout=5.0, retries=2),
+    "brave": UpstreamPolicy(timeout=5.0, retries=1),
+    "nominatim": UpstreamPolicy(timeout=5.0, retries=1),
+    "homeassistant": UpstreamPolicy(timeout=5.0, retries=1),
+    # Token exchange/refresh must never be replayed
+    "homeassistant_auth": UpstreamPolicy(timeout=15.0, retries=0, retry_methods=()),
+}
+DEFAULT_POLICY = UpstreamPolicy()
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without contacting the upstream while its breaker is open."""
+
+@dataclass(frozen=True)
+class AsyncResponse:
+    """Fully read response of request_async(); its connection is already back in the pool."""
+    status_code: int
+    headers: Mapping[str, str]
+    content: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.failures < self.threshold:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Let one probe through; its outcome closes or re-opens the breaker
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            if success:
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+class RetryBudget:
+    """Token bucket that caps retries to a fraction of recent traffic."""
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+# LRU order, capped at HTTP_MAX_HOSTS
+_sessions: "OrderedDict[str, requests.Session]" = OrderedDict()
+_breakers: "OrderedDict[Tuple[str, str], CircuitBreaker]" = OrderedDict()
+_budgets: Dict[str, RetryBudget] = {}
+# aiohttp sessions are bound to the loop that created them
+_async_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+_lock = threading.Lock()
+
+def get_policy(upstream: str) -> UpstreamPolicy:
+    return POLICIES.get(upstream, DEFAULT_POLICY)
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def get_session(url: str) -> requests.Session:
+    host = _host(url)
+    evicted = None
+    with _lock:
+        session = _sessions.get(host)
+        if session is not None:
+            _sessions.move_to_end(host)
+            return session
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _sessions[host] = session
+        if len(_sessions) > Config.HTTP_MAX_HOSTS:
+            _, evicted = _sessions.popitem(last=False)
+    if evicted is not None:
+        # Idle connections close now; one still in use is dropped when released
+        evicted.close()
+    return session
+
+def get_breaker(upstream: str, url: str) -> CircuitBreaker:
+    # Per host as well as per upstream: one user's dead Home Assistant must
+    # not trip the breaker for everyone else's
+    key = (upstream, _host(url))
+    with _lock:
+        breaker = _breakers.get(key)
+        if breaker is not None:
+            _breakers.move_to_end(key)
+            return breaker
+        policy = get_policy(upstream)
+        breaker = CircuitBreaker(policy.breaker_threshold, policy.breaker_cooldown)
+        _breakers[key] = breaker
+        if len(_breakers) > Config.HTTP_MAX_HOSTS:
+            _breakers.popitem(last=False)
+    return breaker
+
+def get_async_session() -> aiohttp.ClientSession:
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        with _lock:
+            session = _async_sessions.get(loop)
+            if session is None or session.closed:
+                # Sessions of loops that have since closed can only leak
+                for stale in [l for l in _async_sessions if l.is_closed()]:
+                    del _async_sessions[stale]
+                connector = aiohttp.TCPConnector(limit=Config.HTTP_ASYNC_POOL_SIZE)
+                session = aiohttp.ClientSession(connector=connector)
+                _async_sessions[loop] = session
+    return session
+
+async def close_async_session():
+    """Closes the running loop's session; call it when the loop shuts down."""
+    with _lock:
+        session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+def _get_budget(upstream: str) -> RetryBudget:
+    budget = _budgets.get(upstream)
+    if budget is None:
+        with _lock:
+            budget = _budgets.setdefault(upstream, RetryBudget(Config.HTTP_RETRY_BUDGET_RATIO))
+    return budget
+
+def _backoff(policy: UpstreamPolicy, attempt: int) -> float:
+    return policy.backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+
+def request(upstream: str, method: str, url: str, **kwargs) -> requests.Response:
+    # Retries included, so the span shows what the caller waited for
+    with tracing.span(f"upstream:{upstream}") as span:
+        response = _request(upstream, method, url, **kwargs)
+        if not kwargs.get("stream"):
+            span.add_bytes(len(response.content))
+        return response
+
+def _request(upstream: str, method: str, url: str, **kwargs) -> requests.Response:
+    policy = get_policy(upstream)
+    breaker = get_breaker(upstream, url)
+    budget = _get_budget(upstream)
+    kwargs.setdefault("timeout", policy.timeout)
+    method = method.upper()
+    can_retry = method in policy.retry_methods
+    session = get_session(url)
+    budget.deposit()
+
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            upstream_errors.inc(upstream=upstream, kind="circuit_open")
+            raise CircuitOpenError(f"{upstream} circuit open for {_host(url)}")
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            upstream_seconds.observe(time.perf_counter() - start, upstream=upstream, outcome="error")
+            upstream_errors.inc(upstream=upstream, kind=type(e).__name__)
+            breaker.record(False)
+            if can_retry and attempt < policy.retries and breaker.state == "closed" and budget.withdraw():
+                attempt += 1
+                upstream_retries.inc(upstream=upstream)
+                time.sleep(_backoff(policy, attempt))
+                continue
+            raise
+        failed = response.status_code >= 500 or response.status_code == 429
+        upstream_seconds.observe(time.perf_counter() - start, upstream=upstream,
+                                 outcome="error" if failed else "ok")
+        breaker.record(not failed)
+        if failed:
+            upstream_errors.inc(upstream=upstream, kind=f"http_{response.status_code}")
+            if (can_retry and response.status_code in policy.retry_statuses
+                    and attempt < policy.retries and breaker.state == "closed" and budget.withdraw()):
+                attempt += 1
+                upstream_retries.inc(upstream=upstream)
+                response.close()
+                time.sleep(_backoff(policy, attempt))
+                continue
+        return response
+
+async def request_async(upstream: str, method: str, url: str, **kwargs) -> AsyncResponse:
+    """request() for coroutines: same policy, breaker and retry budget, awaited instead of blocking.
+
+    Accepts the requests-style keywords the integrations use (params,
+    headers, data, json, timeout in seconds).
+    """
+    with tracing.span(f"upstream:{upstream}") as span:
+        response = await _request_async(upstream, method, url, **kwargs)
+        span.add_bytes(len(response.content))
+        return response
+
+async def _request_async(upstream: str, method: str, url: str, **kwargs) -> AsyncResponse:
+    policy = get_policy(upstream)
+    breaker = get_breaker(upstream, url)
+    budget = _get_budget(upstream)
+    timeout = aiohttp.ClientTimeout(total=kwargs.pop("timeout", policy.timeout))
+    if kwargs.get("params"):
+        # requests sends True as "True"; aiohttp refuses booleans outright
+        kwargs["params"] = {k: str(v) if isinstance(v, bool) else v for k, v in kwargs["params"].items()}
+    method = method.upper()
+    can_retry = method in policy.retry_methods
+    session = get_async_session()
+    budget.deposit()
+
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            upstream_errors.inc(upstream=upstream, kind="circuit_open")
+            raise CircuitOpenError(f"{upstream} circuit open for {_host(url)}")
+        start = time.perf_counter()
+        try:
+            async with session.request(method, url, timeout=timeout, **kwargs) as resp:
+                response = AsyncResponse(resp.status, resp.headers, await resp.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            upstream_seconds.observe(time.perf_counter() - start, upstream=upstream, outcome="error")
+            upstream_errors.inc(upstream=upstream, kind=type(e).__name__)
+            breaker.record(False)
+            if can_retry and attempt < policy.retries and breaker.state == "closed" and budget.withdraw():
+                attempt += 1
+                upstream_retries.inc(upstream=upstream)
+                await asyncio.sleep(_backoff(policy, attempt))
+                continue
+            raise
+        failed = response.status_code >= 500 or response.status_code == 429
+        upstream_seconds.observe(time.perf_counter() - start, upstream=upstream,
+                                 outcome="error" if failed else "ok")
+        breaker.record(not failed)
+        if failed:
+            upstream_errors.inc(upstream=upstream, kind=f"http_{response.status_code}")
+            if (can_retry and response.status_code in policy.retry_statuses
+                    and attempt < policy.retries and breaker.state == "closed" and budget.withdraw()):
+                attempt += 1
+                upstream_retries.inc(upstream=upstream)
+                await asyncio.sleep(_backoff(policy, attempt))
+                continue
+        return response
+
+def get(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "GET", url, **kwargs)
+
+def post(upstream: str, url: str, **kwargs) -> requests.Response:
+    return request(upstream, "POST", url, **kwargs)
+
+async def get_async(upstream: str, url: str, **kwargs) -> AsyncResponse:
+    return await request_async(upstream, "GET", url, **kwargs)
+
+def call(upstream: str, key: str, fn: Callable[[], Any]) -> Any:
+    """Runs a third-party client call (e.g. geopy) under the upstream's breaker and latency histogram."""
+    breaker = get_breaker(upstream, key)
+    if not breaker.allow():
+        upstream_errors.inc(upstream=upstream, kind="circuit_open")
+        raise CircuitOpenError(f"{upstream} circuit open")
+    start = time.perf_counter()
+    try:
+        with tracing.span(f"upstream:{upstream}"):
+            result = fn()
+    except Exception as e:
+        upstream_seconds.observe(time.perf_counter() - start, upstream=upstream, outcome="error")
+        upstream_errors.inc(upstream=upstream, kind=type(e).__name__)
+        breaker.record(False)
+        raise
+    upstream_seconds.observe(time.perf_counter() - start, upstream=upstream, outcome="ok")
+    breaker.record(True)
+    return result
+
+def get_http_stats() -> Dict[str, Any]:
+    with _lock:
+        breakers = {f"{upstream} {host}": b.state for (upstream, host), b in _breakers.items()}
+    return {"sessions": len(_sessions), "async_sessions": len(_async_sessions), "breakers": breakers}
@@ -0,0 +1,82 @@
+import re
+from typing import Dict, Any, Tuple
+from backend.config import Config
+from backend.core.cache import TTLCache, SingleFlight, AsyncSingleFlight
+from backend import http_client
+from backend.http_client import upstream_seconds
+
+SEARCH_URL = "https://api.search.brave.com/res/v1/web/search"
+
+_cache = TTLCache("search", Config.SEARCH_CACHE_SIZE, Config.SEARCH_CACHE_TTL)
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+
+class SearchUnavailable(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"Brave Search returned {status}")
+        self.status = status
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.lower()).strip(" ?!.")
+
+def _request_args(query: str) -> Dict[str, Any]:
+    return {
+        "headers": {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip",
+            "X-Subscription-Token": Config.BRAVE_SEARCH_TOKEN
+        },
+        "params": {
+            "q": query,
+            "count": 5,
+            "spellcheck": True
+        },
+    }
+
+def search_web(query: str) -> Tuple[Dict[str, Any], bool]:
+    """Returns (Brave response payload, from_cache)."""
+    key = normalize_query(query)
+    hit, data = _cache.lookup(key)
+    if hit:
+        return data, True
+
+    def fetch():
+        hit, cached = _cache.peek(key)
+        if hit:
+            return cached
+        response = http_client.get("brave", SEARCH_URL, **_request_args(query))
+        if response.status_code != 200:
+            raise SearchUnavailable(response.status_code)
+        payload = response.json()
+        _cache.set(key, payload)
+        return payload
+
+    data, _shared = _flights.do(key, fetch)
+    return data, False
+
+async def search_web_async(query: str) -> Tuple[Dict[str, Any], bool]:
+    """search_web() for the async pipeline; shares its cache."""
+    key = normalize_query(query)
+    hit, data = _cache.lookup(key)
+    if hit:
+        return data, True
+
+    async def fetch():
+        hit, cached = _cache.peek(key)
+        if hit:
+            return cached
+        response = await http_client.get_async("brave", SEARCH_URL, **_request_args(query))
+        if response.status_code != 200:
+            raise SearchUnavailable(response.status_code)
+        payload = response.json()
+        _cache.set(key, payload)
+        return payload
+
+    data, _shared = await _async_flights.do(key, fetch)
+    return data, False
+
+def get_search_stats() -> Dict[str, Any]:
+    stats = _cache.stats()
+    stats["upstream_calls"] = sum(upstream_seconds.count(upstream="brave", outcome=o) for o in ("ok", "error"))
+    stats["upstream_seconds"] = sum(upstream_seconds.total(upstream="brave", outcome=o) for o in ("ok", "error"))
+    return stats
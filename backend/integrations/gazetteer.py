@@ -0,0 +1,187 @@
+# Offline gazetteer of commonly requested places. Keys are normalized
+# (lowercase, single spaces); values are (display address, latitude, longitude).
+# The first comma-separated part of the address is what tools show to users,
+# matching how Nominatim addresses are trimmed.
+
+PLACES = {
+    # North America
+    "new york": ("New York, United States", 40.7127, -74.0060),
+    "los angeles": ("Los Angeles, California, United States", 34.0537, -118.2428),
+    "chicago": ("Chicago, Illinois, United States", 41.8756, -87.6244),
+    "houston": ("Houston, Texas, United States", 29.7589, -95.3677),
+    "phoenix": ("Phoenix, Arizona, United States", 33.4484, -112.0741),
+    "philadelphia": ("Philadelphia, Pennsylvania, United States", 39.9527, -75.1635),
+    "san antonio": ("San Antonio, Texas, United States", 29.4246, -98.4951),
+    "san diego": ("San Diego, California, United States", 32.7174, -117.1628),
+    "dallas": ("Dallas, Texas, United States", 32.7763, -96.7969),
+    "austin": ("Austin, Texas, United States", 30.2711, -97.7437),
+    "san francisco": ("San Francisco, California, United States", 37.7793, -122.4193),
+    "san jose": ("San Jose, California, United States", 37.3362, -121.8906),
+    "seattle": ("Seattle, Washington, United States", 47.6038, -122.3301),
+    "portland": ("Portland, Oregon, United States", 45.5202, -122.6742),
+    "denver": ("Denver, Colorado, United States", 39.7392, -104.9849),
+    "las vegas": ("Las Vegas, Nevada, United States", 36.1672, -115.1485),
+    "salt lake city": ("Salt Lake City, Utah, United States", 40.7596, -111.8868),
+    "minneapolis": ("Minneapolis, Minnesota, United States", 44.9773, -93.2655),
+    "detroit": ("Detroit, Michigan, United States", 42.3316, -83.0467),
+    "boston": ("Boston, Massachusetts, United States", 42.3555, -71.0565),
+    "washington": ("Washington, District of Columbia, United States", 38.8951, -77.0364),
+    "washington dc": ("Washington, District of Columbia, United States", 38.8951, -77.0364),
+    "baltimore": ("Baltimore, Maryland, United States", 39.2905, -76.6104),
+    "atlanta": ("Atlanta, Georgia, United States", 33.7489, -84.3902),
+    "miami": ("Miami, Florida, United States", 25.7742, -80.1936),
+    "orlando": ("Orlando, Florida, United States", 28.5421, -81.3790),
+    "tampa": ("Tampa, Florida, United States", 27.9478, -82.4584),
+    "nashville": ("Nashville, Tennessee, United States", 36.1623, -86.7744),
+    "new orleans": ("New Orleans, Louisiana, United States", 29.9759, -90.0782),
+    "charlotte": ("Charlotte, North Carolina, United States", 35.2272, -80.8431),
+    "raleigh": ("Raleigh, North Carolina, United States", 35.7804, -78.6391),
+    "winston-salem": ("Winston-Salem, North Carolina, United States", 36.0999, -80.2442),
+    "pittsburgh": ("Pittsburgh, Pennsylvania, United States", 40.4417, -79.9901),
+    "cleveland": ("Cleveland, Ohio, United States", 41.4996, -81.6937),
+    "columbus": ("Columbus, Ohio, United States", 39.9623, -83.0007),
+    "st louis": ("St. Louis, Missouri, United States", 38.6280, -90.1910),
+    "kansas city": ("Kansas City, Missouri, United States", 39.1001, -94.5781),
+    "honolulu": ("Honolulu, Hawaii, United States", 21.3045, -157.8557),
+    "anchorage": ("Anchorage, Alaska, United States", 61.2163, -149.8949),
+    "toronto": ("Toronto, Ontario, Canada", 43.6535, -79.3839),
+    "montreal": ("Montreal, Quebec, Canada", 45.5032, -73.5698),
+    "vancouver": ("Vancouver, British Columbia, Canada", 49.2609, -123.1139),
+    "calgary": ("Calgary, Alberta, Canada", 51.0453, -114.0581),
+    "ottawa": ("Ottawa, Ontario, Canada", 45.4209, -75.6901),
+    "mexico city": ("Mexico City, Mexico", 19.4326, -99.1332),
+    "havana": ("Havana, Cuba", 23.1352, -82.3590),
+    # South America
+    "sao paulo": ("São Paulo, Brazil", -23.5507, -46.6334),
+    "rio de janeiro": ("Rio de Janeiro, Brazil", -22.9111, -43.2056),
+    "buenos aires": ("Buenos Aires, Argentina", -34.6076, -58.4371),
+    "santiago": ("Santiago, Chile", -33.4378, -70.6505),
+    "lima": ("Lima, Peru", -12.0621, -77.0365),
+    "bogota": ("Bogotá, Colombia", 4.6534, -74.0836),
+    "caracas": ("Caracas, Venezuela", 10.5061, -66.9146),
+    # Europe
+    "london": ("London, England, United Kingdom", 51.5074, -0.1278),
+    "manchester": ("Manchester, England, United Kingdom", 53.4794, -2.2453),
+    "edinburgh": ("Edinburgh, Scotland, United Kingdom", 55.9533, -3.1884),
+    "dublin": ("Dublin, Ireland", 53.3498, -6.2603),
+    "paris": ("Paris, Île-de-France, France", 48.8535, 2.3484),
+    "lyon": ("Lyon, France", 45.7578, 4.8320),
+    "marseille": ("Marseille, France", 43.2962, 5.3700),
+    "berlin": ("Berlin, Germany", 52.5108, 13.3989),
+    "munich": ("Munich, Bavaria, Germany", 48.1371, 11.5754),
+    "hamburg": ("Hamburg, Germany", 53.5503, 10.0007),
+    "frankfurt": ("Frankfurt am Main, Hesse, Germany", 50.1106, 8.6821),
+    "amsterdam": ("Amsterdam, Netherlands", 52.3731, 4.8925),
+    "brussels": ("Brussels, Belgium", 50.8467, 4.3525),
+    "zurich": ("Zurich, Switzerland", 47.3745, 8.5410),
+    "geneva": ("Geneva, Switzerland", 46.2018, 6.1466),
+    "vienna": ("Vienna, Austria", 48.2084, 16.3725),
+    "prague": ("Prague, Czechia", 50.0875, 14.4213),
+    "warsaw": ("Warsaw, Poland", 52.2320, 21.0067),
+    "budapest": ("Budapest, Hungary", 47.4980, 19.0399),
+    "rome": ("Rome, Lazio, Italy", 41.8933, 12.4829),
+    "milan": ("Milan, Lombardy, Italy", 45.4642, 9.1896),
+    "venice": ("Venice, Veneto, Italy", 45.4372, 12.3346),
+    "madrid": ("Madrid, Spain", 40.4167, -3.7036),
+    "barcelona": ("Barcelona, Catalonia, Spain", 41.3829, 2.1774),
+    "lisbon": ("Lisbon, Portugal", 38.7078, -9.1366),
+    "athens": ("Athens, Greece", 37.9756, 23.7348),
+    "istanbul": ("Istanbul, Türkiye", 41.0091, 28.9653),
+    "copenhagen": ("Copenhagen, Denmark", 55.6867, 12.5701),
+    "stockholm": ("Stockholm, Sweden", 59.3251, 18.0711),
+    "oslo": ("Oslo, Norway", 59.9133, 10.7389),
+    "helsinki": ("Helsinki, Finland", 60.1699, 24.9384),
+    "reykjavik": ("Reykjavík, Iceland", 64.1457, -21.9422),
+    "moscow": ("Moscow, Russia", 55.7506, 37.6175),
+    "kyiv": ("Kyiv, Ukraine", 50.4500, 30.5241),
+    # Africa and the Middle East
+    "cairo": ("Cairo, Egypt", 30.0444, 31.2357),
+    "lagos": ("Lagos, Nigeria", 6.4550, 3.3941),
+    "nairobi": ("Nairobi, Kenya", -1.2833, 36.8167),
+    "johannesburg": ("Johannesburg, Gauteng, South Africa", -26.2050, 28.0497),
+    "cape town": ("Cape Town, Western Cape, South Africa", -33.9288, 18.4172),
+    "casablanca": ("Casablanca, Morocco", 33.5950, -7.6188),
+    "dubai": ("Dubai, United Arab Emirates", 25.2653, 55.2925),
+    "abu dhabi": ("Abu Dhabi, United Arab Emirates", 24.4539, 54.3773),
+    "doha": ("Doha, Qatar", 25.2854, 51.5310),
+    "riyadh": ("Riyadh, Saudi Arabia", 24.6333, 46.7167),
+    "tel aviv": ("Tel Aviv-Yafo, Israel", 32.0853, 34.7818),
+    "jerusalem": ("Jerusalem, Israel", 31.7788, 35.2258),
+    "tehran": ("Tehran, Iran", 35.6892, 51.3890),
+    # Asia
+    "tokyo": ("Tokyo, Japan", 35.6769, 139.7639),
+    "osaka": ("Osaka, Japan", 34.6937, 135.5023),
+    "kyoto": ("Kyoto, Japan", 35.0116, 135.7681),
+    "seoul": ("Seoul, South Korea", 37.5667, 126.9783),
+    "beijing": ("Beijing, China", 39.9057, 116.3913),
+    "shanghai": ("Shanghai, China", 31.2323, 121.4691),
+    "hong kong": ("Hong Kong, China", 22.2793, 114.1628),
+    "taipei": ("Taipei, Taiwan", 25.0375, 121.5637),
+    "singapore": ("Singapore", 1.2897, 103.8501),
+    "bangkok": ("Bangkok, Thailand", 13.7525, 100.4935),
+    "kuala lumpur": ("Kuala Lumpur, Malaysia", 3.1516, 101.6942),
+    "jakarta": ("Jakarta, Indonesia", -6.1754, 106.8272),
+    "manila": ("Manila, Philippines", 14.5905, 120.9802),
+    "hanoi": ("Hanoi, Vietnam", 21.0285, 105.8542),
+    "ho chi minh city": ("Ho Chi Minh City, Vietnam", 10.7756, 106.7019),
+    "mumbai": ("Mumbai, Maharashtra, India", 19.0550, 72.8692),
+    "delhi": ("Delhi, India", 28.6517, 77.2219),
+    "new delhi": ("New Delhi, Delhi, India", 28.6139, 77.2090),
+    "bangalore": ("Bengaluru, Karnataka, India", 12.9768, 77.5901),
+    "kolkata": ("Kolkata, West Bengal, India", 22.5726, 88.3639),
+    "chennai": ("Chennai, Tamil Nadu, India", 13.0837, 80.2702),
+    "karachi": ("Karachi, Pakistan", 24.8608, 67.0104),
+    "dhaka": ("Dhaka, Bangladesh", 23.7644, 90.3890),
+    # Oceania
+    "sydney": ("Sydney, New South Wales, Australia", -33.8698, 151.2083),
+    "melbourne": ("Melbourne, Victoria, Australia", -37.8142, 144.9632),
+    "brisbane": ("Brisbane, Queensland, Australia", -27.4689, 153.0235),
+    "perth": ("Perth, Western Australia, Australia", -31.9558, 115.8597),
+    "adelaide": ("Adelaide, South Australia, Australia", -34.9281, 138.5999),
+    "canberra": ("Canberra, Australian Capital Territory, Australia", -35.2976, 149.1013),
+    "hobart": ("Hobart, Tasmania, Australia", -42.8825, 147.3281),
+    "darwin": ("Darwin, Northern Territory, Australia", -12.4637, 130.8444),
+    "gold coast": ("Gold Coast, Queensland, Australia", -28.0023, 153.4145),
+    "auckland": ("Auckland, New Zealand", -36.8524, 174.7691),
+    "wellington": ("Wellington, New Zealand", -41.2888, 174.7772),
+    "christchurch": ("Christchurch, New Zealand", -43.5309, 172.6365),
+}
+
+ALIASES = {
+    "nyc": "new york",
+    "new york city": "new york",
+    "la": "los angeles",
+    "sf": "san francisco",
+    "dc": "washington dc",
+    "washington d c": "washington dc",
+    "saint louis": "st louis",
+    "são paulo": "sao paulo",
+    "bogotá": "bogota",
+    "zürich": "zurich",
+    "münchen": "munich",
+    "roma": "rome",
+    "praha": "prague",
+    "wien": "vienna",
+    "kiev": "kyiv",
+    "bengaluru": "bangalore",
+    "bombay": "mumbai",
+    "calcutta": "kolkata",
+    "madras": "chennai",
+    "saigon": "ho chi minh city",
+    "peking": "beijing",
+    "reykjavík": "reykjavik",
+}
+
+# Names that also denote another well-known place (Portland, Maine; the state
+# of Washington; "LA" for Louisiana; ...). Our pick may not be the one
+# Nominatim ranks first, so hybrid mode leaves these to Nominatim.
+AMBIGUOUS = {
+    "portland", "washington", "santiago", "columbus", "kansas city", "san jose",
+    "vancouver", "perth", "darwin", "la",
+}
+
+def lookup(normalized: str, allow_ambiguous: bool = True):
+    if not allow_ambiguous and normalized in AMBIGUOUS:
+        return None
+    key = ALIASES.get(normalized, normalized)
+    return PLACES.get(key)
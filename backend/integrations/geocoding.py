@@ -0,0 +1,148 @@
+import re
+import time
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple, Dict, Any
+from geopy.geocoders import Nominatim
+from geopy.exc import GeocoderServiceError
+from backend.config import Config
+from backend.database import get_db_connection
+from backend.core.cache import TTLCache
+from backend.integrations import gazetteer
+from backend import metrics, http_client
+
+NOMINATIM_HOST = "https://nominatim.openstreetmap.org"
+
+geocode_lookups = metrics.counter("neubot_geocode_lookups_total", "Geocode lookups by answering tier and result")
+
+@dataclass(frozen=True)
+class GeoPlace:
+    # Same attribute names as geopy's Location so callers can use either
+    address: str
+    latitude: float
+    longitude: float
+
+_memory = TTLCache("geocode", Config.GEOCODE_CACHE_SIZE, Config.GEOCODE_CACHE_TTL)
+_geolocator = None
+_geolocator_lock = threading.Lock()
+
+def normalize_location(location: str) -> str:
+    text = location.lower().replace(".", " ").replace(",", " ")
+    text = re.sub(r"[^\w\s'-]", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def _get_geolocator() -> Nominatim:
+    global _geolocator
+    if _geolocator is None:
+        with _geolocator_lock:
+            if _geolocator is None:
+                _geolocator = Nominatim(user_agent="neubot", timeout=http_client.get_policy("nominatim").timeout)
+    return _geolocator
+
+def _remember(key: str, place: Optional[GeoPlace], persist: bool = True):
+    ttl = Config.GEOCODE_CACHE_TTL if place else Config.GEOCODE_NEGATIVE_TTL
+    _memory.set(key, place, ttl=ttl)
+    if not persist:
+        return
+    with get_db_connection() as conn:
+        conn.execute('''
+        INSERT OR REPLACE INTO geocode_cache (query, address, latitude, longitude, found, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key, place.address if place else None, place.latitude if place else None,
+              place.longitude if place else None, 1 if place else 0, int(time.time() + ttl)))
+        conn.commit()
+
+def _load_persisted(key: str) -> Tuple[bool, Optional[GeoPlace]]:
+    with get_db_connection() as conn:
+        row = conn.execute(
+            'SELECT address, latitude, longitude, found, expires_at FROM geocode_cache WHERE query = ?', (key,)
+        ).fetchone()
+    if not row or row['expires_at'] <= time.time():
+        return False, None
+    if not row['found']:
+        return True, None
+    return True, GeoPlace(row['address'], row['latitude'], row['longitude'])
+
+def _lookup_memory(key: str) -> Tuple[bool, Optional[GeoPlace]]:
+    hit, place = _memory.lookup(key)
+    if hit:
+        geocode_lookups.inc(tier="memory", result="hit" if place else "negative")
+    return hit, place
+
+def _lookup_stored(key: str) -> Tuple[bool, Optional[GeoPlace]]:
+    """Gazetteer and SQLite tiers. found is False only when Nominatim has to be asked.
+
+    Hybrid mode only takes unambiguous names from the gazetteer; offline
+    mode, which has nothing else to ask, takes any.
+    """
+    if Config.GEOCODER_MODE in ("hybrid", "offline"):
+        entry = gazetteer.lookup(key, allow_ambiguous=Config.GEOCODER_MODE == "offline")
+        if entry:
+            place = GeoPlace(*entry)
+            _remember(key, place, persist=False)
+            geocode_lookups.inc(tier="gazetteer", result="hit")
+            return True, place
+
+    found, place = _load_persisted(key)
+    if found:
+        _memory.set(key, place, ttl=Config.GEOCODE_CACHE_TTL if place else Config.GEOCODE_NEGATIVE_TTL)
+        geocode_lookups.inc(tier="sqlite", result="hit" if place else "negative")
+        return True, place
+
+    if Config.GEOCODER_MODE == "offline":
+        geocode_lookups.inc(tier="gazetteer", result="miss")
+        return True, None
+    return False, None
+
+def geocode(location: str) -> Optional[GeoPlace]:
+    """Resolves a place name, trying memory, the gazetteer, SQLite and then Nominatim.
+
+    Misses are cached too (for GEOCODE_NEGATIVE_TTL) so repeated typos do not
+    reach Nominatim. Network errors propagate and are not cached.
+    """
+    key = normalize_location(location)
+    if not key:
+        return None
+
+    found, place = _lookup_memory(key)
+    if not found:
+        found, place = _lookup_stored(key)
+    if found:
+        return place
+
+    location_data = http_client.call("nominatim", NOMINATIM_HOST, lambda: _get_geolocator().geocode(location))
+    place = GeoPlace(location_data.address, location_data.latitude, location_data.longitude) if location_data else None
+    _remember(key, place)
+    geocode_lookups.inc(tier="nominatim", result="hit" if place else "negative")
+    return place
+
+async def geocode_async(location: str) -> Optional[GeoPlace]:
+    """geocode() for the async pipeline. SQLite work runs in a thread; Nominatim is queried directly."""
+    key = normalize_location(location)
+    if not key:
+        return None
+
+    found, place = _lookup_memory(key)
+    if not found:
+        found, place = await asyncio.to_thread(_lookup_stored, key)
+    if found:
+        return place
+
+    # The same query geopy's Nominatim.geocode() sends
+    response = await http_client.get_async("nominatim", f"{NOMINATIM_HOST}/search",
+                                           params={"q": location, "format": "json", "limit": 1},
+                                           headers={"User-Agent": "neubot"})
+    if response.status_code != 200:
+        raise GeocoderServiceError(f"Nominatim returned {response.status_code}")
+    results = response.json()
+    place = GeoPlace(results[0]["display_name"], float(results[0]["lat"]), float(results[0]["lon"])) if results else None
+    await asyncio.to_thread(_remember, key, place)
+    geocode_lookups.inc(tier="nominatim", result="hit" if place else "negative")
+    return place
+
+def get_geocode_stats() -> Dict[str, Any]:
+    stats = _memory.stats()
+    for labels, value in geocode_lookups.samples():
+        stats[f"{labels['tier']}_{labels['result']}"] = value
+    return stats
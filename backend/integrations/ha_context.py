@@ -0,0 +1,113 @@
+import json
+import time
+import threading
+from typing import Any, Dict
+from backend.config import Config
+from backend.database import get_db_connection
+from backend.core.cache import TTLCache
+from backend import metrics
+
+# Conversational Home Assistant context: what the caller's last command
+# touched (domain, area, entity ids, sensor types), so a follow-up such as
+# "turn them off" knows what "them" is. Contexts are stored as JSON, so a
+# load always hands out a private copy and changes only land through save().
+
+context_loads = metrics.counter("neubot_ha_context_loads_total", "Conversational context loads by backend and result")
+# "max" across workers: with the SQLite backend they all measure the same table
+context_entries = metrics.gauge("neubot_ha_context_entries", "Stored conversational contexts (as of the last stats call)", mode="max")
+context_bytes = metrics.gauge("neubot_ha_context_bytes", "JSON size of the stored conversational contexts (as of the last stats call)",
+                              mode="max")
+
+# The SQLite store drops expired and surplus rows once every this many saves
+_PURGE_EVERY = 100
+
+class MemoryContextStore:
+    """Per-worker LRU store; contexts expire `ttl` seconds after their last save."""
+
+    name = "memory"
+
+    def __init__(self, max_size: int, ttl: float):
+        self._cache = TTLCache("ha_context", max_size, ttl)
+
+    def load(self, key: str) -> Dict[str, Any]:
+        raw = self._cache.get(key)
+        context_loads.inc(backend=self.name, result="hit" if raw else "miss")
+        return json.loads(raw) if raw else {}
+
+    def save(self, key: str, context: Dict[str, Any]):
+        self._cache.set(key, json.dumps(context))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats["bytes"] = sum(len(raw) for raw in self._cache.values())
+        return stats
+
+class SQLiteContextStore:
+    """Store shared by every worker through the ha_contexts table.
+
+    Reads ignore expired rows; the rows themselves, and any beyond max_size
+    (least recently saved first), are deleted every _PURGE_EVERY saves.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._saves = 0
+        self._lock = threading.Lock()
+
+    def load(self, key: str) -> Dict[str, Any]:
+        with get_db_connection() as conn:
+            row = conn.execute('SELECT data FROM ha_contexts WHERE identity = ? AND expires_at > ?',
+                               (key, int(time.time()))).fetchone()
+        context_loads.inc(backend=self.name, result="hit" if row else "miss")
+        return json.loads(row['data']) if row else {}
+
+    def save(self, key: str, context: Dict[str, Any]):
+        now = int(time.time())
+        with self._lock:
+            self._saves += 1
+            purge = self._saves % _PURGE_EVERY == 0
+        with get_db_connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO ha_contexts (identity, data, updated_at, expires_at) VALUES (?, ?, ?, ?)',
+                         (key, json.dumps(context), now, now + int(self.ttl)))
+            if purge:
+                conn.execute('DELETE FROM ha_contexts WHERE expires_at <= ?', (now,))
+                conn.execute('''
+                DELETE FROM ha_contexts WHERE identity IN (
+                    SELECT identity FROM ha_contexts ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )
+                ''', (self.max_size,))
+            conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with get_db_connection() as conn:
+            row = conn.execute('SELECT COUNT(*) AS size, COALESCE(SUM(LENGTH(data)), 0) AS bytes FROM ha_contexts '
+                               'WHERE expires_at > ?', (int(time.time()),)).fetchone()
+        return {"size": row['size'], "max_size": self.max_size, "bytes": row['bytes']}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_context_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if Config.HA_CONTEXT_BACKEND == "memory":
+                    _store = MemoryContextStore(Config.HA_CONTEXT_SIZE, Config.HA_CONTEXT_TTL)
+                else:
+                    _store = SQLiteContextStore(Config.HA_CONTEXT_SIZE, Config.HA_CONTEXT_TTL)
+    return _store
+
+def get_ha_context_stats() -> Dict[str, Any]:
+    store = get_context_store()
+    stats = store.stats()
+    stats["backend"] = store.name
+    context_entries.set(stats["size"], backend=store.name)
+    context_bytes.set(stats["bytes"], backend=store.name)
+    for labels, value in context_loads.samples():
+        if labels.get("backend") == store.name:
+            stats[f"loads_{labels['result']}"] = value
+    return stats
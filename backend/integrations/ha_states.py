@@ -0,0 +1,105 @@
+import re
+from collections import defaultdict
+from typing import Dict, Any, List, Iterable, Optional, Set, Tuple
+from backend.config import Config
+from backend import http_client
+from backend.core.cache import TTLCache, SingleFlight
+
+NAME_TOKEN_RE = re.compile(r"[a-zA-Z0-9']+")
+
+_cache = TTLCache("ha_states", Config.HA_STATE_CACHE_SIZE, Config.HA_STATE_CACHE_TTL)
+_flights = SingleFlight()
+
+class HAStatesUnavailable(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"Home Assistant returned {status}")
+        self.status = status
+
+class HAStateIndex:
+    """Indexed view over one `/api/states` response.
+
+    Entities keep their original order everywhere so matching behaves exactly
+    as the old linear scans did, just over far fewer candidates.
+    """
+
+    def __init__(self, states: List[Dict[str, Any]]):
+        self.states = states
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_domain: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.by_device_class: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # Friendly-name words; HA's REST API has no area field, so room names
+        # ("kitchen", "josh's bedroom") are matched through these
+        self.by_name_token: Dict[str, Set[str]] = defaultdict(set)
+        self.name_tokens: Dict[str, Set[str]] = {}
+        self._position: Dict[str, int] = {}
+
+        for pos, st in enumerate(states):
+            eid = st.get('entity_id', '')
+            attrs = st.get('attributes', {}) or {}
+            self.by_id[eid] = st
+            self._position[eid] = pos
+            self.by_domain[eid.split('.')[0]].append(st)
+            device_class = attrs.get('device_class')
+            if device_class:
+                self.by_device_class[device_class].append(st)
+            tokens = set(NAME_TOKEN_RE.findall((attrs.get('friendly_name', '') or '').lower()))
+            self.name_tokens[eid] = tokens
+            for tok in tokens:
+                self.by_name_token[tok].add(eid)
+
+    def get(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(entity_id)
+
+    def domain(self, *domains: str) -> List[Dict[str, Any]]:
+        if len(domains) == 1:
+            return self.by_domain.get(domains[0], [])
+        return self._ordered(st['entity_id'] for d in domains for st in self.by_domain.get(d, []))
+
+    def device_class(self, device_class: str) -> List[Dict[str, Any]]:
+        return self.by_device_class.get(device_class, [])
+
+    def select(self, entity_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return self._ordered(eid for eid in entity_ids if eid in self.by_id)
+
+    def with_name_tokens(self, domain: str, tokens: Iterable[str]) -> List[Dict[str, Any]]:
+        """Entities in `domain` whose friendly name shares at least one word with `tokens`."""
+        prefix = domain + '.'
+        eids: Set[str] = set()
+        for tok in tokens:
+            eids.update(e for e in self.by_name_token.get(tok, ()) if e.startswith(prefix))
+        return self._ordered(eids)
+
+    def _ordered(self, entity_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return [self.by_id[eid] for eid in sorted(set(entity_ids), key=self._position.__getitem__)]
+
+def _cache_key(user_id: Any, base_url: str) -> Tuple[str, str]:
+    return str(user_id), base_url.rstrip('/')
+
+def get_state_index(user_id: Any, base_url: str, access_token: str) -> Tuple[HAStateIndex, bool]:
+    """Returns (index, from_cache) for the user's Home Assistant, fetching `/api/states` at most once per TTL."""
+    key = _cache_key(user_id, base_url)
+    hit, index = _cache.lookup(key)
+    if hit:
+        return index, True
+
+    def fetch():
+        response = http_client.get(
+            "homeassistant",
+            f"{base_url}/api/states",
+            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+        )
+        if response.status_code != 200:
+            raise HAStatesUnavailable(response.status_code)
+        fresh = HAStateIndex(response.json())
+        _cache.set(key, fresh)
+        return fresh
+
+    index, _shared = _flights.do(key, fetch)
+    return index, False
+
+def invalidate(user_id: Any, base_url: str):
+    """Drops the cached states after we change something in the user's house."""
+    _cache.delete(_cache_key(user_id, base_url))
+
+def get_ha_state_cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+import aiohttp
+from backend.config import Config
+from backend import metrics
+from backend.integrations.ha_states import HAStateIndex
+
+# Optional live mirror of each active user's Home Assistant. One authenticated
+# /api/websocket connection per (user, instance) receives state_changed events,
+# so state questions are answered without any upstream round trip. All sockets
+# of a worker run on one asyncio loop in a daemon thread.
+
+ws_connections = metrics.gauge("neubot_ha_websocket_connections", "Live Home Assistant WebSocket connections")
+ws_events = metrics.counter("neubot_ha_websocket_events_total", "state_changed events applied to live mirrors")
+ws_disconnects = metrics.counter("neubot_ha_websocket_disconnects_total", "Home Assistant WebSocket drops by reason")
+
+SUBSCRIBE_ID = 1
+GET_STATES_ID = 2
+
+class HAAuthFailed(Exception):
+    pass
+
+def websocket_url(base_url: str) -> str:
+    url = base_url.rstrip('/')
+    if url.startswith('https://'):
+        url = 'wss://' + url[len('https://'):]
+    elif url.startswith('http://'):
+        url = 'ws://' + url[len('http://'):]
+    return url + '/api/websocket'
+
+class HAMirror:
+    """In-memory copy of one Home Assistant's entity states."""
+
+    def __init__(self, user_id: str, base_url: str, access_token: str):
+        self.user_id = user_id
+        self.base_url = base_url
+        self.access_token = access_token
+        self.last_used = time.monotonic()
+        self.ready = False
+        self.future = None
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._version = 0
+        self._index: Optional[HAStateIndex] = None
+        self._index_version = -1
+        self._lock = threading.Lock()
+
+    def replace_all(self, states: List[Dict[str, Any]]):
+        with self._lock:
+            self._states = {st.get('entity_id', ''): st for st in states}
+            self._version += 1
+        self.ready = True
+
+    def apply(self, entity_id: str, new_state: Optional[Dict[str, Any]]):
+        with self._lock:
+            if new_state is None:
+                self._states.pop(entity_id, None)
+            else:
+                self._states[entity_id] = new_state
+            self._version += 1
+
+    def index(self) -> HAStateIndex:
+        # Rebuilt lazily: a busy house emits many events between two questions
+        with self._lock:
+            if self._index_version != self._version:
+                self._index = HAStateIndex(list(self._states.values()))
+                self._index_version = self._version
+            return self._index
+
+class HAWebSocketManager:
+    def __init__(self, max_connections: int, idle_seconds: float):
+        self.max_connections = max_connections
+        self.idle_seconds = idle_seconds
+        self._mirrors: "OrderedDict[Tuple[str, str], HAMirror]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid = None
+
+    def _ensure_loop(self):
+        # Called with _lock held. A forked worker inherits neither the thread
+        # nor the sockets, so it starts afresh.
+        if self._loop is not None and self._pid == os.getpid():
+            return
+        self._mirrors.clear()
+        self._pid = os.getpid()
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._run, args=(self._loop,), name="ha-websocket", daemon=True).start()
+
+    def _run(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.create_task(self._reap_idle())
+        loop.run_forever()
+
+    def get_live_index(self, user_id: Any, base_url: str, access_token: str) -> Optional[HAStateIndex]:
+        """Returns the live index once the mirror has synced, else None (callers fall back to REST).
+
+        The first call for a user opens the connection in the background.
+        """
+        key = (str(user_id), base_url.rstrip('/'))
+        evicted = []
+        with self._lock:
+            self._ensure_loop()
+            mirror = self._mirrors.get(key)
+            if mirror is None:
+                mirror = HAMirror(key[0], key[1], access_token)
+                self._mirrors[key] = mirror
+                while len(self._mirrors) > self.max_connections:
+                    evicted.append(self._mirrors.popitem(last=False)[1])
+                mirror.future = asyncio.run_coroutine_threadsafe(self._maintain(mirror), self._loop)
+            else:
+                self._mirrors.move_to_end(key)
+                # Keeps reconnects authenticated with the latest refreshed token
+                mirror.access_token = access_token
+            mirror.last_used = time.monotonic()
+        for old in evicted:
+            ws_disconnects.inc(reason="evicted")
+            old.future.cancel()
+        return mirror.index() if mirror.ready else None
+
+    async def _maintain(self, mirror: HAMirror):
+        backoff = 1.0
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    await self._stream(session, mirror)
+                    ws_disconnects.inc(reason="closed")
+                except HAAuthFailed:
+                    ws_disconnects.inc(reason="auth")
+                    rejected = mirror.access_token
+                    mirror.ready = False
+                    while mirror.access_token == rejected:
+                        await asyncio.sleep(5)
+                    continue
+                except asyncio.CancelledError:
+                    mirror.ready = False
+                    raise
+                except Exception:
+                    ws_disconnects.inc(reason="error")
+                mirror.ready = False
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    async def _stream(self, session: aiohttp.ClientSession, mirror: HAMirror):
+        async with session.ws_connect(websocket_url(mirror.base_url), heartbeat=30) as ws:
+            ws_connections.inc()
+            try:
+                await ws.receive_json()  # auth_required
+                await ws.send_json({"type": "auth", "access_token": mirror.access_token})
+                reply = await ws.receive_json()
+                if reply.get("type") != "auth_ok":
+                    raise HAAuthFailed(reply.get("message", "auth rejected"))
+                # Subscribe first so nothing changes unseen between snapshot and stream
+                await ws.send_json({"id": SUBSCRIBE_ID, "type": "subscribe_events", "event_type": "state_changed"})
+                await ws.send_json({"id": GET_STATES_ID, "type": "get_states"})
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    message = json.loads(msg.data)
+                    if message.get("type") == "event":
+                        data = message.get("event", {}).get("data", {})
+                        mirror.apply(data.get("entity_id", ''), data.get("new_state"))
+                        ws_events.inc()
+                    elif message.get("id") == GET_STATES_ID and message.get("success"):
+                        mirror.replace_all(message.get("result") or [])
+            finally:
+                ws_connections.inc(-1)
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(min(60.0, self.idle_seconds))
+            cutoff = time.monotonic() - self.idle_seconds
+            with self._lock:
+                idle = [key for key, m in self._mirrors.items() if m.last_used < cutoff]
+                stale = [self._mirrors.pop(key) for key in idle]
+            for mirror in stale:
+                ws_disconnects.inc(reason="idle")
+                mirror.future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            mirrors = list(self._mirrors.values())
+        return {
+            "connections": len(mirrors),
+            "synced": sum(1 for m in mirrors if m.ready),
+            "max_connections": self.max_connections,
+        }
+
+_manager = HAWebSocketManager(Config.HA_WEBSOCKET_MAX_CONNECTIONS, Config.HA_WEBSOCKET_IDLE_SECONDS)
+
+def get_live_index(user_id: Any, base_url: str, access_token: str) -> Optional[HAStateIndex]:
+    if not Config.HA_WEBSOCKET_ENABLED:
+        return None
+    return _manager.get_live_index(user_id, base_url, access_token)
+
+def get_ha_websocket_stats() -> Dict[str, Any]:
+    return _manager.stats()
@@ -1,32 +1,39 @@
 import re
 import json
+import functools
 import time
-import requests
 import random
-import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, Callable, List, Tuple, Set
 from flask import url_for, has_request_context, session
 from flask_login import current_user
 from backend.database import get_db_connection
 from backend.security import encrypt_token, decrypt_token
 from backend.config import Config
-from backend.utils import get_request_user_id, get_client_ip
+from backend import http_client
+from backend.integrations.ha_states import get_state_index, invalidate as invalidate_states, HAStatesUnavailable
+from backend.integrations.ha_websocket import get_live_index
+from backend.integrations.ha_context import get_context_store
+from backend.utils import get_request_identity
+from backend.core.keyword_matcher import KeywordMatcher, KeywordHits
 
-# Global thread-safe session dictionary for conversational awareness
-ha_sessions = {}
-ha_sessions_lock = threading.Lock()
-
-def get_ha_session_dict():
+def get_ha_context() -> Dict[str, Any]:
+    """The caller's conversational context (a copy; changes go through save_ha_context)."""
     if not has_request_context():
         return {}
-    user_id = get_request_user_id()
-    if not user_id:
-        user_id = get_client_ip()
-    
-    with ha_sessions_lock:
-        if user_id not in ha_sessions:
-            ha_sessions[user_id] = {}
-        return ha_sessions[user_id]
+    return get_context_store().load(get_request_identity().rate_limit_key)
+
+def save_ha_context(domain: str, area: Optional[str], sensor_types: List[str], entity_ids: List[str]):
+    """Remembers what the current command touched, for the caller's follow-ups."""
+    if not has_request_context():
+        return
+    get_context_store().save(get_request_identity().rate_limit_key, {
+        "last_ha_domain": domain,
+        "last_ha_area": area,
+        "last_ha_sensor_types": sensor_types,
+        "last_ha_entity_ids": entity_ids,
+    })
 
 HA_ACTION_VERBS = {
     "turn on": "turn_on",
@@ -68,47 +75,62 @@ SENSOR_KEYWORDS = [
     "presence", "motion", "occupancy", "movement", "someone", "somebody", "anyone", "anybody"
 ]
 
+# All intent vocabulary, compiled once so a query is scanned a single time
+HA_VOCABULARY = KeywordMatcher({
+    "sensor": SENSOR_KEYWORDS,
+    "domain": HA_DOMAIN_TERMS,
+    "followup": ["them", "it", "they", "both", "all", "the light", "the lights",
+                 "the switch", "the switches", "the fan", "the fans"],
+    "transition": ["what about", "how about", "and the", "and"],
+    "question": ["what", "how", "is", "are", "check", "get", "read", "show", "status", "tell", "state", "find", "who"],
+})
+
+FOLLOWUP_CONTROL_RE = re.compile(
+    r"^\s*(?:set\s+(?:them|it|the\s+lights?|both|all)?\s*to\s+"
+    r"|turn\s+(?:on|off)\b"
+    r"|(?:make|change)\s+(?:them|it|the\s+lights?|both|all)?\s+"
+    r"|(?:dim|brighten)\b)"
+)
+SENSOR_KW_PATTERN = r"\b(?:temperature|temp|tempature|temperatue|temperatur|humidity|humid|humdity|humidy|humidty|presence|motion|occupancy|movement|someone)\b"
+AREA_AFTER_SENSOR_RE = re.compile(
+    rf"{SENSOR_KW_PATTERN}(?:\s+(?:and|or)\s+{SENSOR_KW_PATTERN})?\s*(?:in|at|for|of)?\s*(?:the|my)?\s*([a-zA-Z ]{{2,30}})"
+)
+AREA_BEFORE_SENSOR_RES = {kw: re.compile(rf"\b([a-zA-Z ]{{2,30}}?)\b{re.escape(kw)}\b") for kw in SENSOR_KEYWORDS}
+AREA_BEFORE_DEVICE_RES = {
+    dom: re.compile(rf"\b([a-zA-Z ]{{2,40}}?)\b(?:{dom}|{dom}s|lamp|lamps|bulb|bulbs)\b")
+    for dom in set(HA_DOMAIN_TERMS.values())
+}
+
+@functools.lru_cache(maxsize=1024)
+def scan_ha_keywords(ql: str) -> KeywordHits:
+    # The parser asks is_home_assistant_query and then extract_ha_entities
+    # about the same text, so the scan is memoised
+    return HA_VOCABULARY.scan(ql)
+
+def _is_followup(ql: str, hits: KeywordHits) -> bool:
+    if hits.any("followup") or FOLLOWUP_CONTROL_RE.search(ql):
+        return True
+    if len(ql.split()) == 1 and ql.strip("?.,!") in SENSOR_KEYWORDS:
+        return True
+    return hits.any("transition") and hits.any("sensor")
+
 def is_home_assistant_query(query: str) -> bool:
     """Detects if a query is intended for Home Assistant."""
     ql = query.lower()
+    hits = scan_ha_keywords(ql)
     
     # Check for conversational follow-up if we have previous HA context in session
-    ha_session = get_ha_session_dict()
-    if has_request_context() and "last_ha_domain" in ha_session:
-        followup_pronouns = [r"\bthem\b", r"\bit\b", r"\bthey\b", r"\bboth\b", r"\ball\b", r"\bthe\s+lights?\b", r"\bthe\s+switches?\b", r"\bthe\s+fans?\b"]
-        has_pronoun = any(re.search(pat, ql) for pat in followup_pronouns)
-        
-        control_indicators = [
-            r"^\s*set\s+(?:them|it|the\s+lights?|both|all)?\s*to\s+",
-            r"^\s*turn\s+(?:on|off)\b",
-            r"^\s*(?:make|change)\s+(?:them|it|the\s+lights?|both|all)?\s+",
-            r"^\s*(?:dim|brighten)\b"
-        ]
-        has_control_indicator = any(re.search(pat, ql) for pat in control_indicators)
-        
-        is_single_sensor = len(ql.split()) == 1 and ql.strip("?.,!") in SENSOR_KEYWORDS
-        
-        transitions = [r"\bwhat\s+about\b", r"\bhow\s+about\b", r"\band\s+the\b", r"\band\b"]
-        has_transition = any(re.search(pat, ql) for pat in transitions) and any(re.search(rf"\b{re.escape(k)}\b", ql) for k in SENSOR_KEYWORDS)
-        
-        if has_pronoun or has_control_indicator or is_single_sensor or has_transition:
-            return True
+    # (the session lookup resolves the user, so only do it for follow-up shaped queries)
+    if _is_followup(ql, hits) and has_request_context() and "last_ha_domain" in get_ha_context():
+        return True
             
     # Check for sensor keywords
-    has_sensor_keyword = any(re.search(rf"\b{re.escape(k)}\b", ql) for k in SENSOR_KEYWORDS)
-    if has_sensor_keyword:
-        question_indicators = ["what", "how", "is", "are", "check", "get", "read", "show", "status", "tell", "state", "find", "who"]
-        if any(re.search(rf"\b{re.escape(qi)}\b", ql) for qi in question_indicators) or any(w in ql for w in ["temperature", "tempature", "temperatue", "temperatur", "humidity", "humdity", "humidy", "humidty"]):
+    if hits.any("sensor"):
+        if hits.any("question") or any(w in ql for w in ["temperature", "tempature", "temperatue", "temperatur", "humidity", "humdity", "humidy", "humidty"]):
             return True
             
     # Check for direct domains
-    has_domain = False
-    for term in HA_DOMAIN_TERMS:
-        if re.search(rf"\b{re.escape(term)}\b", ql):
-            has_domain = True
-            break
-    
-    if has_domain:
+    if hits.any("domain"):
         # Check for action words
         for verb in HA_ACTION_VERBS:
             if verb in ql:
@@ -128,30 +150,14 @@ def extract_ha_entities(query: str, thought_logger: Callable[[str, Any], None])
     thought_logger("Extracting Home Assistant entities", None)
     ql = query.lower()
     result: Dict[str, Any] = {}
+    hits = scan_ha_keywords(ql)
 
-    has_sensor_keyword = any(re.search(rf"\b{re.escape(k)}\b", ql) for k in SENSOR_KEYWORDS)
+    has_sensor_keyword = hits.any("sensor")
 
     is_followup = False
-    ha_session = get_ha_session_dict()
+    ha_session = get_ha_context()
     if has_request_context() and "last_ha_domain" in ha_session:
-        followup_pronouns = [r"\bthem\b", r"\bit\b", r"\bthey\b", r"\bboth\b", r"\ball\b", r"\bthe\s+lights?\b", r"\bthe\s+switches?\b", r"\bthe\s+fans?\b"]
-        has_pronoun = any(re.search(pat, ql) for pat in followup_pronouns)
-        
-        control_indicators = [
-            r"^\s*set\s+(?:them|it|the\s+lights?|both|all)?\s*to\s+",
-            r"^\s*turn\s+(?:on|off)\b",
-            r"^\s*(?:make|change)\s+(?:them|it|the\s+lights?|both|all)?\s+",
-            r"^\s*(?:dim|brighten)\b"
-        ]
-        has_control_indicator = any(re.search(pat, ql) for pat in control_indicators)
-        
-        is_single_sensor = len(ql.split()) == 1 and ql.strip("?.,!") in SENSOR_KEYWORDS
-        
-        transitions = [r"\bwhat\s+about\b", r"\bhow\s+about\b", r"\band\s+the\b", r"\band\b"]
-        has_transition = any(re.search(pat, ql) for pat in transitions) and any(re.search(rf"\b{re.escape(k)}\b", ql) for k in SENSOR_KEYWORDS)
-        
-        if has_pronoun or has_control_indicator or is_single_sensor or has_transition:
-            is_followup = True
+        is_followup = _is_followup(ql, hits)
 
     if has_sensor_keyword:
         result["ha_action"] = "get_state"
@@ -172,11 +178,7 @@ def extract_ha_entities(query: str, thought_logger: Callable[[str, Any], None])
         ha_area = None
         
         # 1. Match area after sensor keywords
-        kw_pattern = r"\b(?:temperature|temp|tempature|temperatue|temperatur|humidity|humid|humdity|humidy|humidty|presence|motion|occupancy|movement|someone)\b"
-        area_after_match = re.search(
-            rf"{kw_pattern}(?:\s+(?:and|or)\s+{kw_pattern})?\s*(?:in|at|for|of)?\s*(?:the|my)?\s*([a-zA-Z ]{{2,30}})",
-            ql
-        )
+        area_after_match = AREA_AFTER_SENSOR_RE.search(ql)
         if area_after_match:
             candidate = area_after_match.group(1).strip()
             candidate = re.sub(r"\b(please|now|right|today|sensor|sensors|is|are|get|read|show|check|tell|what|whats|how|about|and)\b", "", candidate).strip()
@@ -197,7 +199,9 @@ def extract_ha_entities(query: str, thought_logger: Callable[[str, Any], None])
         # 3. Backward match fallback
         if not ha_area:
             for kw in SENSOR_KEYWORDS:
-                m = re.search(rf"\b([a-zA-Z ]{{2,30}}?)\b{re.escape(kw)}\b", ql)
+                if kw not in hits["sensor"]:
+                    continue
+                m = AREA_BEFORE_SENSOR_RES[kw].search(ql)
                 if m:
                     candidate = m.group(1).strip()
                     candidate = re.sub(r"\b(turn|switch|set|activate|run|start|stop|on|off|the|my|a|to|what|whats|is|are|check|get|read|how|about|and)\b", "", candidate).strip()
@@ -240,18 +244,14 @@ def extract_ha_entities(query: str, thought_logger: Callable[[str, Any], None])
     if action:
         result["ha_action"] = action
 
-    domain = None
-    for term, canonical in HA_DOMAIN_TERMS.items():
-        if re.search(rf"\b{re.escape(term)}\b", ql):
-            domain = canonical
-            break
-    if domain:
-        result["ha_domain"] = domain
+    term = hits.first("domain", HA_DOMAIN_TERMS)
+    if term:
+        result["ha_domain"] = HA_DOMAIN_TERMS[term]
 
     ha_area = None
     if result.get("ha_domain"):
         curr_dom = result.get("ha_domain")
-        m = re.search(rf"\b([a-zA-Z ]{{2,40}}?)\b(?:{curr_dom}|{curr_dom}s|lamp|lamps|bulb|bulbs)\b", ql)
+        m = AREA_BEFORE_DEVICE_RES[curr_dom].search(ql)
         if m:
             candidate = m.group(1).strip()
             candidate = re.sub(r"\b(turn|switch|set|activate|run|start|stop|on|off|the|my|a|to)\b", "", candidate).strip()
@@ -350,6 +350,63 @@ def format_ha_summary(action: str, domain: str, results: List[Dict[str, Any]]) -
         
     return text + "."
 
+_service_pool = ThreadPoolExecutor(max_workers=Config.HA_SERVICE_CONCURRENCY, thread_name_prefix="ha-service")
+
+def call_ha_services(base_url: str, access_token: str, domain: str,
+                     calls: List[Tuple[str, Dict[str, Any]]]) -> List[int]:
+    """Runs one (action, service data) call per entity and returns each entity's status code (0 on error).
+
+    With HA_BATCH_SERVICE_CALLS, entities whose service data is otherwise
+    identical share one call with an entity_id list, and the distinct calls
+    run concurrently, so a room of bulbs switches together. Calls for the
+    same entity still run one after another in the order given: its n-th
+    call only goes out in round n, once the previous round has finished.
+    """
+    rounds: List[Dict[Any, List[int]]] = []
+    seen: Dict[Any, int] = {}
+    for i, (action, svc_data) in enumerate(calls):
+        if Config.HA_BATCH_SERVICE_CALLS:
+            entity_id = svc_data.get('entity_id')
+            n = seen.get(entity_id, 0)
+            seen[entity_id] = n + 1
+            shared = {k: v for k, v in svc_data.items() if k != 'entity_id'}
+            key = (action, json.dumps(shared, sort_keys=True))
+        else:
+            n, key = 0, i
+        if n == len(rounds):
+            rounds.append({})
+        rounds[n].setdefault(key, []).append(i)
+
+    def post(indexes: List[int]) -> int:
+        action, svc_data = calls[indexes[0]]
+        payload = dict(svc_data)
+        if len(indexes) > 1:
+            payload['entity_id'] = [calls[i][1]['entity_id'] for i in indexes]
+        try:
+            svc = http_client.post(
+                "homeassistant",
+                f"{base_url}/api/services/{domain}/{action}",
+                headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
+                json=payload
+            )
+            return svc.status_code
+        except Exception:
+            return 0
+
+    codes = [0] * len(calls)
+    for groups in rounds:
+        batches = list(groups.values())
+        if Config.HA_BATCH_SERVICE_CALLS and len(batches) > 1:
+            # A copy of our context per call, so their upstream spans join the trace
+            futures = [_service_pool.submit(contextvars.copy_context().run, post, b) for b in batches]
+            codes_by_batch = [f.result() for f in futures]
+        else:
+            codes_by_batch = [post(b) for b in batches]
+        for indexes, code in zip(batches, codes_by_batch):
+            for i in indexes:
+                codes[i] = code
+    return codes
+
 def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any], None]) -> Tuple[str, List[Dict[str, Any]]]:
     thought_logger("Executing Home Assistant tool", None)
     if not current_user.is_authenticated:
@@ -382,13 +439,14 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
     # Refresh if expires in less than 5 minutes (300s) or already expired
     if expires_at and expires_at < now_ts + 300 and refresh_token:
         try:
-            token_resp = requests.post(
+            token_resp = http_client.post(
+                "homeassistant_auth",
                 f"{base_url}/auth/token",
                 data={
                     'grant_type': 'refresh_token',
                     'refresh_token': refresh_token,
                     'client_id': url_for('api.ha_callback', _external=True)
-                }, timeout=10
+                }
             )
             if token_resp.status_code == 200:
                 td = token_resp.json()
@@ -412,10 +470,8 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
         elif re.search(r"\b(turn off|switch off|deactivate|stop)\b", ql):
             action = 'turn_off'
     if not domain:
-        for term, canonical in HA_DOMAIN_TERMS.items():
-            if re.search(rf"\b{re.escape(term)}\b", ql):
-                domain = canonical
-                break
+        term = scan_ha_keywords(ql).first("domain", HA_DOMAIN_TERMS)
+        domain = HA_DOMAIN_TERMS[term] if term else None
     if domain in ('scene', 'script') and not action:
         action = 'turn_on'
     if not domain:
@@ -429,17 +485,18 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
             if cand and len(cand.split()) <= 3 and not re.search(r"turn|on|off|activate|run|switch|set|dim|brighten", cand):
                 room = cand
 
-    try:
-        resp = requests.get(
-            f"{base_url}/api/states",
-            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
-            timeout=5
-        )
-        if resp.status_code != 200:
-            return f"Failed to reach Home Assistant ({resp.status_code}).", []
-        states = resp.json()
-    except Exception as e:
-        return f"Error contacting Home Assistant: {e}", []
+    index = get_live_index(current_user.id, base_url, access_token)
+    if index is not None:
+        thought_logger("Using live Home Assistant states", None)
+    else:
+        try:
+            index, from_cache = get_state_index(current_user.id, base_url, access_token)
+        except HAStatesUnavailable as e:
+            return f"Failed to reach Home Assistant ({e.status}).", []
+        except Exception as e:
+            return f"Error contacting Home Assistant: {e}", []
+        if from_cache:
+            thought_logger("Using cached Home Assistant states", None)
 
     sensor_types = entities.get('ha_sensor_types') or []
     if not sensor_types and entities.get('ha_sensor_type'):
@@ -469,16 +526,10 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
         
         for s_type in sensor_types:
             candidates = []
-            for st in states:
+            # Temperature & Humidity queries must ONLY match sensor.* entities
+            pool = index.domain('sensor') if s_type in ('temperature', 'humidity') else index.domain('sensor', 'binary_sensor')
+            for st in pool:
                 eid = st.get('entity_id', '')
-                
-                # Temperature & Humidity queries must ONLY match sensor.* entities
-                if s_type in ('temperature', 'humidity'):
-                    if not eid.startswith('sensor.'):
-                        continue
-                else:
-                    if not (eid.startswith('sensor.') or eid.startswith('binary_sensor.')):
-                        continue
                     
                 fname = st.get('attributes', {}).get('friendly_name', '') or ''
                 fname_l = fname.lower()
@@ -555,10 +606,8 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
         # Fallback if no match is found
         if area and not selected_candidates:
             all_sensors_of_type = []
-            for st in states:
+            for st in index.domain('sensor', 'binary_sensor'):
                 eid = st.get('entity_id', '')
-                if not (eid.startswith('sensor.') or eid.startswith('binary_sensor.')):
-                    continue
                 fname = st.get('attributes', {}).get('friendly_name', '') or ''
                 fname_l = fname.lower()
                 device_class = st.get('attributes', {}).get('device_class', '') or ''
@@ -681,12 +730,9 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                     'devices': results
                 }
             }
-            if has_request_context():
-                ha_session = get_ha_session_dict()
-                ha_session["last_ha_domain"] = 'sensor' if any(r['entity_id'].startswith('sensor.') for r in results) else 'binary_sensor'
-                ha_session["last_ha_area"] = list(area_readings.keys())[0] if area_readings else area
-                ha_session["last_ha_sensor_types"] = sensor_types
-                ha_session["last_ha_entity_ids"] = [r['entity_id'] for r in results]
+            save_ha_context('sensor' if any(r['entity_id'].startswith('sensor.') for r in results) else 'binary_sensor',
+                            list(area_readings.keys())[0] if area_readings else area,
+                            sensor_types, [r['entity_id'] for r in results])
             return summary_text, [widget]
 
         # Single sensor matched
@@ -747,12 +793,7 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                 'devices': results
             }
         }
-        if has_request_context():
-            ha_session = get_ha_session_dict()
-            ha_session["last_ha_domain"] = eid.split('.')[0]
-            ha_session["last_ha_area"] = cleaned_area
-            ha_session["last_ha_sensor_types"] = sensor_types
-            ha_session["last_ha_entity_ids"] = [eid]
+        save_ha_context(eid.split('.')[0], cleaned_area, sensor_types, [eid])
         return summary_text, [widget]
 
     color_words_all = ["warm white","cool white","magenta","yellow","purple","orange","white","green","blue","pink","cyan","red"]
@@ -794,15 +835,6 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
         action_regex_on = re.compile(r"\b(turn on|switch on|set .*? to|set .*? on|activate|enable)\b")
         action_regex_off = re.compile(r"\b(turn off|switch off|deactivate|disable)\b")
 
-        entity_name_tokens: Dict[str, Tuple[str, Set[str], str]] = {}
-        for st in states:
-            eid = st.get('entity_id','')
-            if not eid.startswith(domain + '.'):
-                continue
-            fname = st.get('attributes',{}).get('friendly_name','')
-            toks = set(re.findall(r"[a-zA-Z0-9']+", fname.lower()))
-            entity_name_tokens[eid] = (fname, toks, st.get('state'))
-
         clause_results = []
         for seg in segments:
             seg_l = seg.lower()
@@ -820,11 +852,10 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
             device_tokens = [t for t in raw_tokens if t not in ignore_tokens and t not in {'to'} and all(cw.find(t) == -1 for cw in color_words_all)]
             device_tokens = [t for t in device_tokens if not t.isdigit()]
             device_tokens_set = set(device_tokens)
-            seg_entities = []
-            if device_tokens_set:
-                for eid,(fname,toks,state_val) in entity_name_tokens.items():
-                    if toks & device_tokens_set:
-                        seg_entities.append((eid,fname,state_val))
+            seg_entities = [
+                (st.get('entity_id',''), st.get('attributes',{}).get('friendly_name',''), st.get('state'))
+                for st in index.with_name_tokens(domain, device_tokens_set)
+            ]
             if seg_entities and (seg_action or seg_color or seg_brightness):
                 clause_results.append({
                     'action': seg_action or ('turn_on' if (seg_color or seg_brightness) else action or 'turn_on'),
@@ -836,6 +867,7 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
 
         if len(clause_results) > 1:
             results = []
+            pending: List[Tuple[str, Dict[str, Any]]] = []
             prior_states = []
             summary_clauses = []
             for c in clause_results:
@@ -849,10 +881,7 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                 for eid,fname,state_val in c['entities']:
                     svc_data = {'entity_id': eid}
                     # Capture prior attributes to enable restore
-                    try:
-                        prior_attrs = next((s.get('attributes',{}) for s in states if s.get('entity_id')==eid), {})
-                    except Exception:
-                        prior_attrs = {}
+                    prior_attrs = (index.get(eid) or {}).get('attributes',{})
                     prior_states.append({
                         'entity_id': eid,
                         'state': state_val,
@@ -876,23 +905,13 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                                 svc_data['brightness'] = int(prior_attrs.get('brightness'))
                             except Exception:
                                 pass
-                    try:
-                        svc = requests.post(
-                            f"{base_url}/api/services/{domain}/{c['action']}",
-                            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
-                            json=svc_data,
-                            timeout=5
-                        )
-                        success = svc.status_code in (200,201)
-                    except Exception as e:
-                        success = False
-                        svc = type('obj', (), {'status_code': 0})()
+                    pending.append((c['action'], svc_data))
                     results.append({
                         'entity_id': eid,
                         'name': fname,
                         'requested_action': c['action'],
-                        'success': success,
-                        'code': getattr(svc, 'status_code', 0),
+                        'success': False,
+                        'code': 0,
                         'state_before': state_val,
                         'applied_color': assigned_color,
                         'applied_brightness_pct': c['brightness']
@@ -904,6 +923,10 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                     if c['color']:
                         clause_text += f" ({c['color']})"
                     summary_clauses.append(clause_text)
+            for res, code in zip(results, call_ha_services(base_url, access_token, domain, pending)):
+                res['success'] = code in (200,201)
+                res['code'] = code
+            invalidate_states(current_user.id, base_url)
             summary_text = '; '.join(summary_clauses) + '.' if summary_clauses else 'Action attempted.'
             
             widget = {
@@ -916,15 +939,10 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                     'applied': { 'restore_in_seconds': 0 }
                 }
             }
-            if has_request_context():
-                ha_session = get_ha_session_dict()
-                all_eids = []
-                for cl in clause_results:
-                    all_eids.extend([e[0] for e in cl['entities']])
-                ha_session["last_ha_domain"] = domain
-                ha_session["last_ha_area"] = area or room
-                ha_session["last_ha_sensor_types"] = sensor_types
-                ha_session["last_ha_entity_ids"] = list(set(all_eids))
+            all_eids = []
+            for cl in clause_results:
+                all_eids.extend([e[0] for e in cl['entities']])
+            save_ha_context(domain, area or room, sensor_types, list(set(all_eids)))
             return summary_text, [widget]
 
     target_entity = None
@@ -933,10 +951,8 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
     if device_phrase:
         phrase_tokens = [t for t in re.findall(r"\w+", device_phrase.lower()) if t not in ('the','a','my')]
     best_score = 0.0
-    for st in states:
+    for st in index.domain(domain):
         eid = st.get('entity_id','')
-        if not eid.startswith(domain + '.'):
-            continue
         fname = st.get('attributes',{}).get('friendly_name','')
         fname_l = fname.lower()
         if phrase_tokens:
@@ -959,44 +975,32 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
     
     last_ha_entity_ids = entities.get('last_ha_entity_ids')
     if last_ha_entity_ids:
-        for st in states:
-            eid = st.get('entity_id','')
-            if eid in last_ha_entity_ids:
-                fname = st.get('attributes',{}).get('friendly_name','')
-                matched_entities.append((eid, fname, st.get('state')))
+        for st in index.select(last_ha_entity_ids):
+            fname = st.get('attributes',{}).get('friendly_name','')
+            matched_entities.append((st.get('entity_id',''), fname, st.get('state')))
     else:
         select_all = ('all' in token_set or 'every' in token_set) and any(w in token_set for w in {'light','lights',domain, domain+'s'})
-        for st in states:
-            eid = st.get('entity_id','')
-            if not eid.startswith(domain + '.'):
-                continue
+        if select_all:
+            candidates = index.domain(domain)
+        else:
+            candidates = index.with_name_tokens(domain, content_tokens - {'the','and','of'})
+        for st in candidates:
             fname = st.get('attributes',{}).get('friendly_name','')
-            fname_l = fname.lower()
-            name_tokens = [t for t in re.findall(r"[a-zA-Z0-9']+", fname_l) if t not in {'the','and','of'}]
-            if select_all:
-                matched_entities.append((eid, fname, st.get('state')))
-                continue
-            if content_tokens and any(nt in content_tokens for nt in name_tokens):
-                matched_entities.append((eid, fname, st.get('state')))
+            matched_entities.append((st.get('entity_id',''), fname, st.get('state')))
 
         if not matched_entities and target_entity:
-            state_val = next((s.get('state') for s in states if s.get('entity_id')==target_entity), None)
+            state_val = (index.get(target_entity) or {}).get('state')
             matched_entities = [(target_entity, friendly, state_val)]
 
     if not matched_entities:
         return "I couldn't find a matching device.", []
 
-    if has_request_context():
-        ha_session = get_ha_session_dict()
-        ha_session["last_ha_domain"] = domain
-        ha_session["last_ha_area"] = area or room
-        ha_session["last_ha_sensor_types"] = sensor_types
-        ha_session["last_ha_entity_ids"] = [e[0] for e in matched_entities]
+    save_ha_context(domain, area or room, sensor_types, [e[0] for e in matched_entities])
 
     if action == 'get_state':
         results = []
         for eid, fname, state_val in matched_entities:
-            full_state = next((s for s in states if s.get('entity_id') == eid), {})
+            full_state = index.get(eid) or {}
             current_state = full_state.get('state', 'unknown')
             attrs = full_state.get('attributes', {})
             
@@ -1036,6 +1040,7 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
         return "Need to know if you want them on or off.", []
 
     results = []
+    pending: List[Tuple[str, Dict[str, Any]]] = []
     multi_color_cycle: List[str] = []
     if len(ordered_colors) > 1 and action == 'turn_on' and domain == 'light':
         while len(multi_color_cycle) < len(matched_entities):
@@ -1056,10 +1061,7 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                 assigned_color = color_name; svc_data['color_name'] = assigned_color
         
         # Capture prior attributes before action for restore
-        try:
-            prior_attrs = next((s.get('attributes',{}) for s in states if s.get('entity_id')==eid), {})
-        except Exception:
-            prior_attrs = {}
+        prior_attrs = (index.get(eid) or {}).get('attributes',{})
         # Preserve brightness when turning on with color but no brightness provided
         if domain == 'light' and action == 'turn_on' and 'color_name' in svc_data and 'brightness_pct' not in svc_data:
             if prior_attrs.get('brightness') is not None:
@@ -1067,26 +1069,21 @@ def execute_ha_tool(entities: Dict[str, Any], thought_logger: Callable[[str, Any
                     svc_data['brightness'] = int(prior_attrs.get('brightness'))
                 except Exception:
                     pass
-        try:
-            svc = requests.post(
-                f"{base_url}/api/services/{domain}/{action}",
-                headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
-                json=svc_data,
-                timeout=5
-            )
-            success = svc.status_code in (200,201)
-        except Exception:
-            success = False; svc = type('obj', (), {'status_code': 0})()
+        pending.append((action, svc_data))
         results.append({
             'entity_id': eid,
             'name': fname,
             'requested_action': action,
-            'success': success,
-            'code': getattr(svc,'status_code',0),
+            'success': False,
+            'code': 0,
             'state_before': state_val,
             'applied_color': assigned_color,
             'applied_brightness_pct': brightness_pct
         })
+    for res, code in zip(results, call_ha_services(base_url, access_token, domain, pending)):
+        res['success'] = code in (200,201)
+        res['code'] = code
+    invalidate_states(current_user.id, base_url)
     
     summary_text = format_ha_summary(action, domain, results)
     
@@ -0,0 +1,78 @@
+from typing import Dict, Any, Optional, Tuple
+from backend.config import Config
+from backend import http_client
+from backend.core.cache import TTLCache, SingleFlight, AsyncSingleFlight
+
+WEATHER_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+_cache = TTLCache("weather", Config.WEATHER_CACHE_SIZE, Config.WEATHER_CACHE_TTL)
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+
+class WeatherUnavailable(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"OpenWeatherMap returned {status}")
+        self.status = status
+
+def _params(key: Tuple[float, float]) -> Dict[str, Any]:
+    return {
+        "lat": key[0],
+        "lon": key[1],
+        "appid": Config.OPENWEATHER_API_KEY,
+        "units": "metric",
+    }
+
+def _cache_key(lat: float, lon: float) -> Tuple[float, float]:
+    # Nearby coordinates (2 decimals is ~1km) share one cached observation
+    precision = Config.WEATHER_CACHE_PRECISION
+    return round(lat, precision), round(lon, precision)
+
+def get_cached_weather(lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    # A probe, not a lookup: get_current_weather() counts the request's one hit or miss
+    return _cache.peek(_cache_key(lat, lon))[1]
+
+def get_current_weather(lat: float, lon: float) -> Tuple[Dict[str, Any], bool]:
+    """Returns (payload, from_cache). Concurrent misses for one place share a single upstream call."""
+    key = _cache_key(lat, lon)
+    hit, data = _cache.lookup(key)
+    if hit:
+        return data, True
+
+    def fetch():
+        # Another flight may have filled the cache while we were queued
+        hit, cached = _cache.peek(key)
+        if hit:
+            return cached
+        response = http_client.get("openweather", WEATHER_URL, params=_params(key))
+        if response.status_code != 200:
+            raise WeatherUnavailable(response.status_code)
+        payload = response.json()
+        _cache.set(key, payload)
+        return payload
+
+    data, _shared = _flights.do(key, fetch)
+    return data, False
+
+async def get_current_weather_async(lat: float, lon: float) -> Tuple[Dict[str, Any], bool]:
+    """get_current_weather() for the async pipeline; shares its cache."""
+    key = _cache_key(lat, lon)
+    hit, data = _cache.lookup(key)
+    if hit:
+        return data, True
+
+    async def fetch():
+        hit, cached = _cache.peek(key)
+        if hit:
+            return cached
+        response = await http_client.get_async("openweather", WEATHER_URL, params=_params(key))
+        if response.status_code != 200:
+            raise WeatherUnavailable(response.status_code)
+        payload = response.json()
+        _cache.set(key, payload)
+        return payload
+
+    data, _shared = await _async_flights.do(key, fetch)
+    return data, False
+
+def get_weather_cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+from typing import Dict, Tuple, List, Any, Optional
+
+# Lightweight in-process counters and histograms. Modules register their
+# metrics at import time and update them on the hot path. Under gunicorn each
+# worker has its own registry; with a snapshot directory configured, workers
+# write theirs there and collect() adds them all up.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, "Metric"] = {}
+_registry_lock = threading.Lock()
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> List[Tuple[Dict[str, str], float]]:
+        with self._lock:
+            return [(dict(k), v) for k, v in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, mode: str = "sum"):
+        super().__init__(name, description)
+        # How live workers' values combine: "sum" (e.g. open connections
+        # per worker) or "max" (every worker measures the same shared thing)
+        self.mode = mode
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+                self._values[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["count"] += 1
+            series["sum"] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._values.get(_label_key(labels))
+            return series["count"] if series else 0
+
+    def total(self, **labels) -> float:
+        with self._lock:
+            series = self._values.get(_label_key(labels))
+            return series["sum"] if series else 0.0
+
+    def samples(self) -> List[Tuple[Dict[str, str], Dict[str, Any]]]:
+        with self._lock:
+            return [(dict(k), {"buckets": list(v["buckets"]), "count": v["count"], "sum": v["sum"]})
+                    for k, v in self._values.items()]
+
+def _register(cls, name: str, description: str, **kwargs):
+    with _registry_lock:
+        existing = _registry.get(name)
+        if existing is not None:
+            return existing
+        metric = cls(name, description, **kwargs)
+        _registry[name] = metric
+        return metric
+
+def counter(name: str, description: str) -> Counter:
+    return _register(Counter, name, description)
+
+def gauge(name: str, description: str, mode: str = "sum") -> Gauge:
+    return _register(Gauge, name, description, mode=mode)
+
+def histogram(name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, description, buckets=buckets)
+
+def get_metric(name: str) -> Optional[Metric]:
+    return _registry.get(name)
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        metrics = list(_registry.values())
+    result = {}
+    for m in metrics:
+        entry = {"type": m.kind, "help": m.description, "samples": m.samples()}
+        if isinstance(m, Histogram):
+            entry["buckets"] = list(m.buckets)
+        if isinstance(m, Gauge):
+            entry["mode"] = m.mode
+        result[m.name] = entry
+    return result
+
+def write_snapshot(directory: str):
+    """Writes this process's snapshot() to <directory>/<pid>.json, atomically."""
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+def start_snapshot_writer(directory: str, interval: float):
+    """Snapshots this process every `interval` seconds from a daemon thread (once per process)."""
+    global _writer_pid
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+    os.makedirs(directory, exist_ok=True)
+
+    def run():
+        warned = False
+        while True:
+            try:
+                write_snapshot(directory)
+            except OSError as e:
+                # Without snapshots /metrics silently leaves this worker out
+                if not warned:
+                    logger.warning("Cannot write metrics snapshot to %s: %s", directory, e)
+                    warned = True
+            time.sleep(interval)
+    threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _merge_series(merged: Dict[str, Any], entry: Dict[str, Any], live: bool):
+    series = merged.setdefault("series", {})
+    for labels, value in entry["samples"]:
+        key = _label_key(labels)
+        if entry["type"] == "histogram":
+            current = series.get(key)
+            if current is None:
+                series[key] = (labels, {"buckets": list(value["buckets"]), "count": value["count"], "sum": value["sum"]})
+            else:
+                current[1]["buckets"] = [a + b for a, b in zip(current[1]["buckets"], value["buckets"])]
+                current[1]["count"] += value["count"]
+                current[1]["sum"] += value["sum"]
+        elif entry["type"] == "gauge":
+            # A dead worker's gauges no longer describe anything
+            if not live:
+                continue
+            current = series.get(key)
+            if current is None:
+                series[key] = (labels, value)
+            elif entry.get("mode") == "max":
+                series[key] = (labels, max(current[1], value))
+            else:
+                series[key] = (labels, current[1] + value)
+        else:
+            # Counters of exited workers still count towards the totals
+            current = series.get(key)
+            series[key] = (labels, value + (current[1] if current else 0))
+
+def collect(directory: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """snapshot() summed over this process and every worker that wrote into `directory`.
+
+    Other workers' figures are as old as their last snapshot write.
+    """
+    snapshots = [(snapshot(), True)]
+    if directory and os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != ".json" or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    snapshots.append((json.load(f), _alive(int(pid))))
+            except (OSError, ValueError):
+                continue
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snap, live in snapshots:
+        for name, entry in snap.items():
+            target = merged.setdefault(name, {k: v for k, v in entry.items() if k != "samples"})
+            _merge_series(target, entry, live)
+    for entry in merged.values():
+        entry["samples"] = list(entry.pop("series", {}).values())
+    return merged
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+def _format_labels(labels: Dict[str, str], **extra) -> str:
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in items) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def render_prometheus(metrics: Dict[str, Dict[str, Any]]) -> str:
+    """Prometheus text exposition (version 0.0.4) of a snapshot() or collect() result."""
+    lines = []
+    for name in sorted(metrics):
+        entry = metrics[name]
+        lines.append(f"# HELP {name} {_escape(entry['help'], quotes=False)}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for labels, value in entry["samples"]:
+            if entry["type"] == "histogram":
+                # Bucket counts are already cumulative (observe() bumps every bound >= value)
+                for bound, count in zip(entry["buckets"], value["buckets"]):
+                    lines.append(f"{name}_bucket{_format_labels(labels, le=_format_value(bound))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from flask_login import user_logged_in, user_logged_out
+from backend.config import Config
+from backend.core.cache import TTLCache
+from backend.models.user import User
+from backend.security import decode_api_token_claims
+from backend.utils import get_user_id_from_token
+
+# Who is calling, without a database round trip in the steady state. Tokens
+# are cached under their SHA-256 so raw credentials never sit in memory
+# longer than the request. Every entry carries its user's generation;
+# invalidate_user() bumps it, which retires all of that user's entries at once.
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: Optional[str]
+    user: Optional[User]
+    generation: int
+
+_tokens = TTLCache("principals", Config.PRINCIPAL_CACHE_SIZE, Config.PRINCIPAL_CACHE_TTL)
+_users = TTLCache("users", Config.PRINCIPAL_CACHE_SIZE, Config.PRINCIPAL_CACHE_TTL)
+_generations: Dict[str, int] = {}
+_lock = threading.Lock()
+
+def token_key(kind: str, token: str) -> str:
+    return f"{kind}:{hashlib.sha256(token.encode()).hexdigest()}"
+
+def _generation(user_id: Optional[str]) -> int:
+    return _generations.get(user_id, 0) if user_id else 0
+
+def _lookup(key: str) -> Optional[Principal]:
+    principal = _tokens.get(key)
+    if principal is not None and principal.generation != _generation(principal.user_id):
+        _tokens.delete(key)
+        return None
+    return principal
+
+def load_user(user_id: str) -> Optional[User]:
+    """User.get() through the cache. Missing users are not cached, so a new signup is seen at once."""
+    generation = _generation(user_id)
+    cached = _users.get(user_id)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    user = User.get(user_id)
+    if user is not None:
+        _users.set(user_id, (generation, user))
+    return user
+
+def user_for_api_token(token: str) -> Optional[User]:
+    """The user a signed API token belongs to; the JWT is validated once per PRINCIPAL_CACHE_TTL."""
+    key = token_key("jwt", token)
+    principal = _lookup(key)
+    if principal is not None:
+        return principal.user
+    claims = decode_api_token_claims(token)
+    if not claims:
+        return None
+    user_id = claims['sub']
+    user = load_user(user_id)
+    if user is None:
+        return None
+    # Never outlive the token itself
+    ttl = min(Config.PRINCIPAL_CACHE_TTL, claims.get('exp', float('inf')) - time.time())
+    if ttl > 0:
+        _tokens.set(key, Principal(user_id, user, _generation(user_id)), ttl=ttl)
+    return user
+
+def user_id_for_app_token(auth_header: Optional[str]) -> Optional[str]:
+    """get_user_id_from_token() (the app_tokens table) through the cache, misses included."""
+    if not auth_header:
+        return None
+    key = token_key("app", auth_header)
+    principal = _lookup(key)
+    if principal is not None:
+        return principal.user_id
+    user_id = get_user_id_from_token(auth_header)
+    _tokens.set(key, Principal(user_id, None, _generation(user_id)))
+    return user_id
+
+def invalidate_user(user_id: Optional[str]):
+    """Forgets everything cached about a user, e.g. after their row changed."""
+    if not user_id:
+        return
+    with _lock:
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+    _users.delete(user_id)
+
+@user_logged_in.connect
+def _on_login(sender, user: Any, **extra):
+    invalidate_user(user.get_id())
+
+@user_logged_out.connect
+def _on_logout(sender, user: Any, **extra):
+    if user is not None:
+        invalidate_user(user.get_id())
+
+def get_principal_cache_stats() -> Dict[str, Any]:
+    return {"tokens": _tokens.stats(), "users": _users.stats()}
@@ -1,13 +1,20 @@
 import os
 import base64
-from cryptography.fernet import Fernet
+import functools
+from typing import Any, Dict, Optional, Tuple
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from backend.config import Config
+from backend import metrics
 from authlib.jose import jwt
 import time
 
+kdf_derivations = metrics.counter("neubot_token_kdf_derivations_total", "PBKDF2 key derivations performed")
+crypto_seconds = metrics.histogram("neubot_token_crypto_seconds", "Time spent encrypting/decrypting stored tokens",
+                                   buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1))
+
 def generate_api_token(user_id: str) -> str:
     header = {'alg': 'HS256'}
     payload = {
@@ -19,21 +26,31 @@ def generate_api_token(user_id: str) -> str:
     key = Config.SECRET_KEY
     return jwt.encode(header, payload, key).decode('utf-8')
 
-def decode_api_token(token: str) -> str:
+def decode_api_token_claims(token: str) -> Optional[Dict[str, Any]]:
+    """Validated claims of an API token, or None if it is forged, malformed or expired."""
     try:
         key = Config.SECRET_KEY
         claims = jwt.decode(token, key)
         claims.validate()
-        return claims['sub']
+        return dict(claims)
     except Exception:
         return None
 
+def decode_api_token(token: str) -> str:
+    claims = decode_api_token_claims(token)
+    return claims['sub'] if claims else None
+
 def get_encryption_key(secret_key: str) -> bytes:
     salt = Config.TOKEN_ENCRYPTION_SALT
     if not salt:
         # Fallback if salt is not set, though it should be for persistence
         salt = b'default_salt' 
-    
+    return _derive_key(secret_key, salt)
+
+@functools.lru_cache(maxsize=16)
+def _derive_key(secret_key: str, salt: bytes) -> bytes:
+    # PBKDF2 is deliberately slow; derive each key once per process
+    kdf_derivations.inc()
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
@@ -43,12 +60,29 @@ def get_encryption_key(secret_key: str) -> bytes:
     )
     return base64.urlsafe_b64encode(kdf.derive(secret_key.encode()))
 
+@functools.lru_cache(maxsize=4)
+def _build_keyring(current: str, previous: Tuple[str, ...], salt: bytes) -> MultiFernet:
+    # First key encrypts, every key is tried on decrypt
+    keys = [Fernet(get_encryption_key(current))]
+    for old_secret in previous:
+        if old_secret and old_secret != current:
+            keys.append(Fernet(get_encryption_key(old_secret)))
+    return MultiFernet(keys)
+
+def get_keyring() -> MultiFernet:
+    return _build_keyring(Config.SECRET_KEY, tuple(Config.PREVIOUS_SECRET_KEYS), Config.TOKEN_ENCRYPTION_SALT)
+
 def encrypt_token(token: str) -> str:
-    key = get_encryption_key(Config.SECRET_KEY)
-    fernet = Fernet(key)
-    return fernet.encrypt(token.encode()).decode()
+    with crypto_seconds.time(op="encrypt"):
+        return get_keyring().encrypt(token.encode()).decode()
 
 def decrypt_token(encrypted_token: str) -> str:
-    key = get_encryption_key(Config.SECRET_KEY)
-    fernet = Fernet(key)
-    return fernet.decrypt(encrypted_token.encode()).decode()
+    with crypto_seconds.time(op="decrypt"):
+        return get_keyring().decrypt(encrypted_token.encode()).decode()
+
+def get_crypto_stats() -> Dict[str, float]:
+    stats = {"kdf_derivations": kdf_derivations.value()}
+    for op in ("encrypt", "decrypt"):
+        stats[f"{op}_calls"] = crypto_seconds.count(op=op)
+        stats[f"{op}_seconds"] = crypto_seconds.total(op=op)
+    return stats
@@ -1,7 +1,9 @@
-from flask import request
+from dataclasses import dataclass
+from flask import request, g, session
 from flask_login import current_user
 from typing import Optional
 from backend.database import get_db_connection
+from backend.core.rate_limiter import identity_key
 
 def get_client_ip():
     if request.headers.get('CF-Connecting-IP'):
@@ -28,9 +30,40 @@ def get_user_id_from_token(auth_header: Optional[str]) -> Optional[str]:
             return result['user_id']
     return None
 
+@dataclass(frozen=True)
+class RequestIdentity:
+    ip: str
+    user_id: Optional[str]
+    # "session", "api_token", "app_token" or "guest"
+    auth_method: str
+    # What the rate limiter counts this caller under
+    rate_limit_key: str
+
+def _resolve_identity() -> RequestIdentity:
+    ip = get_client_ip()
+    if current_user.is_authenticated:
+        user_id = current_user.get_id()
+        # flask-login keeps session logins under _user_id; otherwise the request loader matched an API token
+        auth_method = "session" if session.get('_user_id') == user_id else "api_token"
+    else:
+        from backend.principals import user_id_for_app_token
+        user_id = user_id_for_app_token(request.headers.get('Authorization'))
+        auth_method = "app_token" if user_id else "guest"
+    return RequestIdentity(ip=ip, user_id=user_id, auth_method=auth_method,
+                           rate_limit_key=identity_key(ip, user_id))
+
+def resolve_request_identity():
+    """before_request hook: works out who is calling once, for every module to read from g."""
+    if request.endpoint == 'static':
+        return
+    g.identity = _resolve_identity()
+
+def get_request_identity() -> RequestIdentity:
+    identity = g.get('identity')
+    if identity is None:
+        # Outside the hook (e.g. a static file or a test request context)
+        identity = g.identity = _resolve_identity()
+    return identity
+
 def get_request_user_id():
-    user_id = current_user.get_id() if current_user.is_authenticated else None
-    if not user_id:
-        auth_header = request.headers.get('Authorization')
-        user_id = get_user_id_from_token(auth_header)
-    return user_id
+    return get_request_identity().user_id
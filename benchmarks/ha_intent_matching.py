@@ -0,0 +1,92 @@
+"""Per-query cost of Home Assistant intent keyword detection.
+
+Compares the former approach (one `\\bkeyword\\b` regex built per vocabulary
+entry, evaluated once in is_home_assistant_query and again in
+extract_ha_entities) with a single KeywordMatcher scan, checks that both give
+the same answers on the sample queries, and times the full
+is_home_assistant_query + extract_ha_entities pair.
+
+    python benchmarks/ha_intent_matching.py [rounds]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.integrations.home_assistant import (
+    HA_DOMAIN_TERMS, SENSOR_KEYWORDS, HA_VOCABULARY, scan_ha_keywords,
+    is_home_assistant_query, extract_ha_entities,
+)
+
+ROUNDS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+QUERIES = [
+    "turn on the kitchen lights",
+    "what is the temperature in the living room",
+    "is there anyone in the hall",
+    "switch off all fans and then turn on the desk lamp",
+    "set them to blue",
+    "how about the bedroom",
+    "what's the weather in paris tomorrow",
+    "search for the best pizza in new york",
+    "humidity",
+    "tell me a joke",
+    "is the garage switch on",
+    "run the movie night scene",
+]
+
+FOLLOWUP_PRONOUNS = [r"\bthem\b", r"\bit\b", r"\bthey\b", r"\bboth\b", r"\ball\b", r"\bthe\s+lights?\b", r"\bthe\s+switches?\b", r"\bthe\s+fans?\b"]
+TRANSITIONS = [r"\bwhat\s+about\b", r"\bhow\s+about\b", r"\band\s+the\b", r"\band\b"]
+QUESTION_INDICATORS = ["what", "how", "is", "are", "check", "get", "read", "show", "status", "tell", "state", "find", "who"]
+
+def legacy_keywords(ql):
+    sensor = any(re.search(rf"\b{re.escape(k)}\b", ql) for k in SENSOR_KEYWORDS)
+    return (
+        sensor,
+        any(re.search(pat, ql) for pat in FOLLOWUP_PRONOUNS),
+        any(re.search(pat, ql) for pat in TRANSITIONS),
+        any(re.search(rf"\b{re.escape(qi)}\b", ql) for qi in QUESTION_INDICATORS),
+        next((c for t, c in HA_DOMAIN_TERMS.items() if re.search(rf"\b{re.escape(t)}\b", ql)), None),
+    )
+
+def matcher_keywords(ql):
+    hits = HA_VOCABULARY.scan(ql)
+    term = hits.first("domain", HA_DOMAIN_TERMS)
+    return (
+        hits.any("sensor"),
+        hits.any("followup"),
+        hits.any("transition"),
+        hits.any("question"),
+        HA_DOMAIN_TERMS[term] if term else None,
+    )
+
+def timed(label, fn, per_query=2):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for q in QUERIES:
+            for _ in range(per_query):
+                fn(q)
+    elapsed = (time.perf_counter() - start) / (ROUNDS * len(QUERIES))
+    print(f"{label:<52} {elapsed * 1e6:9.2f} us/query")
+    return elapsed
+
+def main():
+    for q in QUERIES:
+        assert legacy_keywords(q) == matcher_keywords(q), q
+
+    # The old code evaluated the keyword checks twice per query (detection, then extraction)
+    legacy = timed("legacy per-keyword regexes (x2)", legacy_keywords)
+    scan = timed("KeywordMatcher.scan (x1)", matcher_keywords, per_query=1)
+    print(f"keyword detection speedup: {legacy / scan:.1f}x")
+
+    quiet = lambda *a: None
+    def full(q):
+        scan_ha_keywords.cache_clear()
+        if is_home_assistant_query(q):
+            extract_ha_entities(q, quiet)
+    timed("is_home_assistant_query + extract_ha_entities", full, per_query=1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Rate-limit query latency before and after the epoch/index migration.
+
+Builds a throwaway database at schema version 1 (string timestamps, no
+indexes), fills `requests` with ROWS rows, times the legacy COUNT query, then
+migrates to the latest version and times the indexed queries and both
+rate limit stores.
+
+    python benchmarks/rate_limit_queries.py [rows]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.config import Config
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+IDENTITIES = 20_000
+SAMPLES = 200
+
+def timed(label, fn, samples=SAMPLES):
+    start = time.perf_counter()
+    for i in range(samples):
+        fn(i)
+    elapsed = (time.perf_counter() - start) / samples
+    print(f"{label:<48} {elapsed * 1000:9.3f} ms/query")
+    return elapsed
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix="neubot-bench-")
+    Config.DB_FILE = os.path.join(tmpdir, "bench.db")
+    Config.RATE_LIMIT_SYNC_SECONDS = 3600
+
+    from backend.database import get_db_connection, migrate
+    from backend.core.rate_limiter import SQLiteRateLimitStore, MemoryRateLimitStore, WINDOW
+
+    now = datetime.now()
+    rng = random.Random(42)
+    ips = [f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}" for i in range(IDENTITIES)]
+
+    with get_db_connection() as conn:
+        migrate(conn, target=1)
+        rows = []
+        for _ in range(ROWS):
+            ts = now - timedelta(seconds=rng.randint(0, 45 * 86400))
+            rows.append((rng.choice(ips), rng.choice(("search", "weather")), ts.strftime("%Y-%m-%d %H:%M:%S"), None))
+        start = time.perf_counter()
+        conn.executemany("INSERT INTO requests (ip, req_type, timestamp, user_id) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        print(f"inserted {ROWS:,} rows in {time.perf_counter() - start:.1f}s")
+
+        month_ago = (now - WINDOW).strftime("%Y-%m-%d %H:%M:%S")
+        legacy = timed("v1 COUNT (string timestamp, no index)", lambda i: conn.execute(
+            "SELECT COUNT(*) FROM requests WHERE ip = ? AND req_type = ? AND timestamp > ? AND user_id IS NULL",
+            (ips[i], "weather", month_ago)).fetchone(), samples=20)
+
+        start = time.perf_counter()
+        migrate(conn)
+        print(f"migrated to latest schema in {time.perf_counter() - start:.1f}s")
+
+        since = int((now - WINDOW).timestamp())
+        indexed = timed("latest COUNT (epoch ts, composite index)", lambda i: conn.execute(
+            "SELECT COUNT(*) FROM requests WHERE ip = ? AND req_type = ? AND ts > ? AND user_id IS NULL",
+            (ips[i], "weather", since)).fetchone())
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM requests WHERE ip = ? AND req_type = ? AND ts > ? AND user_id IS NULL",
+            (ips[0], "weather", since)).fetchall()
+        print("  plan:", "; ".join(row[-1] for row in plan))
+
+    sqlite_store = SQLiteRateLimitStore()
+    timed("SQLiteRateLimitStore.count", lambda i: sqlite_store.count(ips[i], "weather", None, now - WINDOW))
+    memory_store = MemoryRateLimitStore()
+    timed("MemoryRateLimitStore.count (cold load)", lambda i: memory_store.count(ips[i], "weather", None, now - WINDOW))
+    memory = timed("MemoryRateLimitStore.count (warm)", lambda i: memory_store.count(ips[i], "weather", None, now - WINDOW))
+
+    print(f"speedup: indexed {legacy / indexed:,.0f}x, in-memory {legacy / memory:,.0f}x over v1")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,31 @@
 """
 Gunicorn configuration file for Neubot application
 """
+import os
 
 # Server socket binding
 bind = "0.0.0.0:3006"  # Same port as in Flask app
 
 # Worker processes
 workers = 4  # Rule of thumb: 2-4 x number of CPU cores
-worker_class = "sync"
-threads = 2
+# The parser keeps per-request state in a ParseContext, so requests can share
+# a worker; most of a request's time is spent waiting on upstream APIs
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Workers write metric snapshots here for /metrics to add up; files left by
+# a previous run are cleared when the master starts
+os.environ.setdefault("METRICS_DIR", "/var/run/neubot/metrics")
+
+def on_starting(server):
+    metrics_dir = os.environ["METRICS_DIR"]
+    os.makedirs(metrics_dir, exist_ok=True)
+    # Workers drop privileges to user/group below and must be able to write here
+    if server.cfg.uid != os.geteuid() or server.cfg.gid != os.getegid():
+        os.chown(metrics_dir, server.cfg.uid, server.cfg.gid)
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            os.remove(os.path.join(metrics_dir, name))
 
 # Logging
 accesslog = "-"
@@ -26,4 +43,4 @@ group = "www-data"
 daemon = True
 
 # PID file
-pidfile = "/var/run/neubot/gunicorn.pid"
\ No newline at end of file
+pidfile = "/var/run/neubot/gunicorn.pid"
\ No newline at end of file
@@ -236,7 +236,13 @@ document.addEventListener('DOMContentLoaded', function () {
 
         const typingIndicator = addTypingIndicator();
 
-        fetch('/api/query', {
+        const partials = [];
+        let toolCount = 0;
+        let answered = false;
+
+        // Streamed so the highlight and the answers of fast tools show up
+        // before the slowest tool has finished
+        fetch('/api/query/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -246,20 +252,37 @@ document.addEventListener('DOMContentLoaded', function () {
                 timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
             }),
         })
-            .then(response => response.json())
-            .then(data => {
-                typingIndicator.remove();
-
-                if (highlightEnabled && data.highlightedQuery) {
-                    const queryDiv = userMessageDiv.querySelector('.highlighted-query');
-                    if (queryDiv) {
-                        queryDiv.innerHTML = data.highlightedQuery;
-                    }
+            .then(response => {
+                if (!response.ok || !response.body) {
+                    throw new Error(`Query failed with status ${response.status}`);
                 }
+                return readEventStream(response, (event, data) => {
+                    if (event === 'query') {
+                        toolCount = data.tools;
+                        if (highlightEnabled && data.highlightedQuery) {
+                            const queryDiv = userMessageDiv.querySelector('.highlighted-query');
+                            if (queryDiv) {
+                                queryDiv.innerHTML = data.highlightedQuery;
+                            }
+                        }
+                    } else if (event === 'partial' && toolCount > 1) {
+                        partials.push(data.response);
+                        typingIndicator.showPartial(partials.join(' '));
+                        scrollToBottom();
+                    } else if (event === 'done') {
+                        answered = true;
+                        typingIndicator.remove();
 
-                addBotMessage(data.response, data.thoughts, data.widgets);
+                        addBotMessage(data.response, data.thoughts, data.widgets);
 
-                scrollToBottom();
+                        scrollToBottom();
+                    }
+                });
+            })
+            .then(() => {
+                if (!answered) {
+                    throw new Error('Query stream ended before the answer');
+                }
             })
             .catch(error => {
                 console.error('Error:', error);
@@ -269,6 +292,34 @@ document.addEventListener('DOMContentLoaded', function () {
             });
     }
 
+    // Reads a text/event-stream response body, calling onEvent(event, data)
+    // with the parsed JSON data of every event
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+
     function addUserMessage(text, highlightedQuery = null) {
         const messageDiv = document.createElement('div');
         messageDiv.className = 'message user';
@@ -462,6 +513,16 @@ document.addEventListener('DOMContentLoaded', function () {
             this.parentNode.removeChild(this);
         };
 
+        indicatorDiv.showPartial = function (text) {
+            let partial = this.querySelector('.message-text');
+            if (!partial) {
+                partial = document.createElement('div');
+                partial.className = 'message-text';
+                this.querySelector('.message-content').prepend(partial);
+            }
+            partial.innerHTML = text; // Same trust as addBotMessage
+        };
+
         scrollToBottom();
 
         return indicatorDiv;
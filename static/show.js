@@ -175,13 +175,53 @@
   }
   qResp.addEventListener('click', hideOverlay);
 
+  // Reads a text/event-stream body, calling onEvent(event, parsed data) per event
+  async function readEventStream(response, onEvent){
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while(true){
+      const { done, value } = await reader.read();
+      if(done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while((boundary = buffer.indexOf('\n\n')) !== -1){
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = 'message', data = '';
+        block.split('\n').forEach(line => {
+          if(line.startsWith('event: ')) event = line.slice(7);
+          else if(line.startsWith('data: ')) data += line.slice(6);
+        });
+        if(data) onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
+  // Resolves with the final /api/query payload; partial answers are shown as tools finish
+  function streamQuery(text){
+    let final = null, toolCount = 0;
+    const partials = [];
+    return fetch('/api/query/stream', {
+      method: 'POST', headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ query: text, timezone: Intl.DateTimeFormat().resolvedOptions().timeZone }),
+    }).then(r => {
+      if(!r.ok || !r.body) throw new Error('query failed');
+      return readEventStream(r, (event, data) => {
+        if(event === 'query') toolCount = data.tools;
+        else if(event === 'partial' && toolCount > 1){ partials.push(data.response); showOverlayAnimated(partials.join(' ')); }
+        else if(event === 'done') final = data;
+      });
+    }).then(() => {
+      if(!final) throw new Error('query stream ended early');
+      return final;
+    });
+  }
+
   function sendQuery(text){
     if(!text.trim()) return;
     showOverlayAnimated('Thinking…');
-    fetch('/api/query', {
-      method: 'POST', headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ query: text, timezone: Intl.DateTimeFormat().resolvedOptions().timeZone }),
-    }).then(r => r.json()).then(d => {
+    streamQuery(text).then(d => {
       let displayText = d.response || 'Sorry, something went wrong.';
       const widgets = d.widgets || [];
       